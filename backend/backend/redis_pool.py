@@ -0,0 +1,28 @@
+"""
+Cliente async de Redis compartido por todo el proceso.
+
+Un único pool de conexiones (REDIS_URL, hasta REDIS_MAX_CONNECTIONS) por
+event loop, en lugar de abrir una conexión por consumidor o por petición.
+Las conexiones de redis.asyncio quedan ligadas al loop que las creó, así que
+se guarda un cliente por loop (normalmente solo hay uno: el del worker ASGI).
+"""
+import asyncio
+import weakref
+
+import redis.asyncio as aioredis
+from django.conf import settings
+
+_clients = weakref.WeakKeyDictionary()
+
+
+def get_redis():
+    """Cliente del loop actual (hay que llamarlo desde una corrutina)."""
+    loop = asyncio.get_running_loop()
+    client = _clients.get(loop)
+    if client is None:
+        client = _clients[loop] = aioredis.from_url(
+            settings.REDIS_URL,
+            decode_responses=True,
+            max_connections=settings.REDIS_MAX_CONNECTIONS,
+        )
+    return client
@@ -56,11 +56,15 @@ INSTALLED_APPS = [
 ]
 
 # Configuración de Channels y Redis
+REDIS_URL = os.getenv("REDIS_URL", "redis://transcendence_redis:6379/0")
+# Conexiones máximas del pool async compartido (ver backend/redis_pool.py)
+REDIS_MAX_CONNECTIONS = int(os.getenv("REDIS_MAX_CONNECTIONS", "50"))
+
 CHANNEL_LAYERS = {
     "default": {
         "BACKEND": "channels_redis.core.RedisChannelLayer",
         "CONFIG": {
-            "hosts": [("transcendence_redis", 6379)],
+            "hosts": [REDIS_URL],
         },
     },
 }
@@ -68,6 +72,27 @@ CHANNEL_LAYERS = {
 # Configurar ASGI
 ASGI_APPLICATION = "backend.asgi.application"
 
+# Motor de Pong: "python" (engine.step por sala) o "numpy" (paso vectorizado
+# de todas las salas del proceso, ver pong/engine_numpy.py)
+PONG_ENGINE = os.getenv("PONG_ENGINE", "python")
+# Frecuencia de simulación (ticks/s) y de envío de snapshots a los clientes
+PONG_TICK_RATE = int(os.getenv("PONG_TICK_RATE", "120"))
+PONG_SNAPSHOT_RATE = int(os.getenv("PONG_SNAPSHOT_RATE", "30"))
+# Frames/s del stream de espectadores (pong/spectators.py)
+PONG_SPECTATOR_RATE = int(os.getenv("PONG_SPECTATOR_RATE", "10"))
+# Segundos que se espera (con la partida en pausa) a un jugador que pierde la conexión
+PONG_RECONNECT_GRACE = float(os.getenv("PONG_RECONNECT_GRACE", "10"))
+# Segundos que una partida de torneo lista puede quedar sin jugarse antes de
+# darse por ganada al jugador presente (pong/reaper.py)
+PONG_TOURNAMENT_NO_SHOW = int(os.getenv("PONG_TOURNAMENT_NO_SHOW", "300"))
+# Segundos tras los que una PongRoom sin partida viva se da por abandonada (pong/reaper.py)
+PONG_ROOM_STALE_AFTER = int(os.getenv("PONG_ROOM_STALE_AFTER", "3600"))
+# Segundos sin latido del worker tras los que un usuario pasa a offline (users/presence.py)
+PRESENCE_TTL = int(os.getenv("PRESENCE_TTL", "30"))
+# Varios workers ASGI: cada sala la simula un único worker dueño y el resto
+# le reenvía entradas y recibe sus frames por el channel layer (pong/cluster.py)
+PONG_CLUSTER = os.getenv("PONG_CLUSTER", "false").lower() in ("1", "true", "yes")
+
 # Middleware
 MIDDLEWARE = [
     'corsheaders.middleware.CorsMiddleware',
@@ -0,0 +1,127 @@
+"""
+IA de Pong: predicción analítica del punto de intercepción.
+
+En lugar de simular la pelota frame a frame, la trayectoria se calcula en
+forma cerrada: se avanza la Y "desdoblada" (como si no hubiera paredes) y los
+rebotes se pliegan después con aritmética modular (periodo 200 = ida y
+vuelta del campo). Cada predicción es O(1) y se cachea por trayectoria
+(state.rally cambia en cada golpe de pala y en cada saque), así que la IA
+puede replanificar en todos los ticks sin coste apreciable.
+"""
+import random
+
+from .engine import per_second
+
+
+class Difficulty:
+    """Parámetros de un nivel de la IA."""
+
+    __slots__ = ("name", "miss_chance", "error", "max_speed")
+
+    def __init__(self, name, miss_chance, error, max_speed_per_frame):
+        self.name = name
+        # Probabilidad de fallar a propósito en cada trayectoria
+        self.miss_chance = miss_chance
+        # Error máximo (±%) sobre el punto de intercepción
+        self.error = error
+        # Velocidad máxima de la pala en %/s
+        self.max_speed = per_second(max_speed_per_frame)
+
+
+# Todos los niveles predicen en forma cerrada (intercept_y + fold) una sola vez
+# por trayectoria, con el error de reacción (±error) y el fallo intencionado
+# del nivel. "normal" usa los parámetros de la IA original (10% de fallos,
+# ±3 %, 2 %/frame), pero no juega igual: aquella replanificaba cada segundo
+# con una simulación paso a paso, y esta apunta desde el primer tick de cada
+# trayectoria, así que llega antes a la pelota
+DIFFICULTIES = {
+    "easy": Difficulty("easy", miss_chance=0.25, error=8.0, max_speed_per_frame=1.2),
+    "normal": Difficulty("normal", miss_chance=0.1, error=3.0, max_speed_per_frame=2),
+    "hard": Difficulty("hard", miss_chance=0.02, error=1.0, max_speed_per_frame=3),
+}
+DEFAULT_DIFFICULTY = "normal"
+
+
+def fold(y):
+    """Pliega una Y desdoblada sobre el campo [0, 100] (rebotes en las paredes)."""
+    y %= 200
+    return 200 - y if y > 100 else y
+
+
+def _travel(y, vx, vy, distance):
+    """
+    Avanza `distance` en X desde `y` con velocidad (vx, vy). Devuelve la Y
+    plegada al llegar y el signo de vy en ese momento.
+    """
+    unfolded = y + vy * (distance / abs(vx))
+    direction = 1 if vy >= 0 else -1
+    # En los tramos impares (100-200 del periodo) la pelota va al revés
+    if unfolded % 200 > 100:
+        direction = -direction
+    return fold(unfolded), direction
+
+
+def intercept_y(state):
+    """
+    Y a la que llegará la pelota a la pala derecha, o None si no hay
+    trayectoria (pelota parada o ya detrás de la pala).
+
+    Si la pelota va hacia la izquierda se supone que el rival la devuelve:
+    se pliega su tramo hasta la pala izquierda, se aplica la aceleración del
+    golpe y se continúa hacia la derecha.
+    """
+    rules = state.rules
+    left_x = rules.paddle_face + rules.ball_radius
+    right_x = 100 - rules.paddle_face - rules.ball_radius
+    x, y = state.ball_x, state.ball_y
+    vx, vy = state.ball_vx, state.ball_vy
+
+    if vx == 0:
+        return None
+    if vx < 0:
+        y, direction = _travel(y, vx, vy, max(0.0, x - left_x))
+        vx = (abs(vx) + rules.speedup_add) * rules.speedup_mul
+        vy = (abs(vy) + rules.speedup_add) * rules.speedup_mul * direction
+        x = left_x
+    if x > right_x:
+        return None
+    return _travel(y, vx, vy, right_x - x)[0]
+
+
+class PongAI:
+    """
+    Controla la pala derecha. Elige un objetivo por trayectoria (fallo
+    intencionado o intercepción + error) y en cada tick devuelve la velocidad
+    para acercarse a él.
+    """
+
+    __slots__ = ("difficulty", "rally", "target")
+
+    def __init__(self, difficulty=DEFAULT_DIFFICULTY):
+        self.difficulty = DIFFICULTIES.get(difficulty, DIFFICULTIES[DEFAULT_DIFFICULTY])
+        self.rally = None
+        # None => la pala se queda donde está
+        self.target = None
+
+    def plan(self, state):
+        """Objetivo de la pala; solo se recalcula cuando cambia la trayectoria."""
+        if state.rally != self.rally:
+            self.rally = state.rally
+            difficulty = self.difficulty
+            if random.random() < difficulty.miss_chance:
+                self.target = random.uniform(0, 100)
+            else:
+                predicted = intercept_y(state)
+                if predicted is not None:
+                    predicted += random.uniform(-difficulty.error, difficulty.error)
+                self.target = predicted
+        return self.target
+
+    def speed(self, state):
+        """Velocidad (%/s) de la pala derecha para este tick."""
+        target = self.plan(state)
+        if target is None:
+            return 0.0
+        max_speed = self.difficulty.max_speed
+        wanted = (target - state.paddle_right) / state.rules.dt
+        return max(min(wanted, max_speed), -max_speed)
@@ -2,9 +2,24 @@
 from rest_framework.views import APIView
 from rest_framework.response import Response
 from rest_framework import status
+from rest_framework.permissions import IsAdminUser, IsAuthenticated
+from asgiref.sync import async_to_sync
 from channels.layers import get_channel_layer
+from django.contrib.auth import get_user_model
+from django.db.models import Q
+from django.http import FileResponse, HttpResponse
+from django.shortcuts import get_object_or_404
 import json
 
+from users.models import MatchHistory
+from . import tournaments
+from .metrics import metrics
+from .models import Tournament
+from .replay import MAX_CHUNK_FRAMES, ReplayReader
+from .scheduler import scheduler
+
+User = get_user_model()
+
 channel_layer = get_channel_layer()
 
 class StartGameAPIView(APIView):
@@ -47,3 +62,136 @@ class MovePaddleAPIView(APIView):
             }
         )
         return Response({"status": "paddle_moved"}, status=status.HTTP_200_OK)
+
+
+class PongMetricsAPIView(APIView):
+    """
+    Métricas del bucle de juego de este worker (ver metrics.py): histogramas
+    de duración y retraso del tick, latencia de envío y de group_send y frames
+    perdidos, globales y por sala. Solo para administradores.
+    """
+    permission_classes = [IsAdminUser]
+
+    def get(self, request, format=None):
+        data = metrics.to_dict()
+        data["scheduler"] = {
+            "tick_rate": scheduler.tick_rate,
+            "snapshot_every": scheduler.snapshot_every,
+            "rooms": len(scheduler),
+            "ticks": scheduler.ticks,
+            "budget_used": scheduler.budget_used,
+        }
+        return Response(data, status=status.HTTP_200_OK)
+
+
+class TournamentListCreateAPIView(APIView):
+    """
+    GET: torneos en los que participa el usuario, cada uno con la partida que
+    le toca jugar ("next_match"), aunque no estuviera conectado cuando se
+    anunció.
+    POST: crea un torneo y lo arranca. Se espera un JSON con:
+    {
+        "name": "Copa",
+        "players": ["user1", "user2", ...]   (orden = cabezas de serie)
+    }
+    El creador se añade si no está en la lista. Las partidas de la primera
+    ronda se anuncian a sus jugadores con 'start_game' y se juegan a la vez.
+    """
+    permission_classes = [IsAuthenticated]
+
+    def get(self, request, format=None):
+        user_tournaments = Tournament.objects.filter(
+            Q(players=request.user) | Q(created_by=request.user)
+        ).distinct().order_by("-created_at")
+        return Response([tournaments.serialize(t, request.user) for t in user_tournaments])
+
+    def post(self, request, format=None):
+        name = str(request.data.get("name", "")).strip()[:100]
+        usernames = request.data.get("players")
+        if not name or not isinstance(usernames, list):
+            return Response({"error": "Debes indicar el nombre y la lista de jugadores."},
+                            status=status.HTTP_400_BAD_REQUEST)
+
+        usernames = list(dict.fromkeys(str(username) for username in usernames))
+        if request.user.username not in usernames:
+            usernames.insert(0, request.user.username)
+        if not tournaments.MIN_PLAYERS <= len(usernames) <= tournaments.MAX_PLAYERS:
+            return Response(
+                {"error": f"Un torneo necesita entre {tournaments.MIN_PLAYERS} y "
+                          f"{tournaments.MAX_PLAYERS} jugadores."},
+                status=status.HTTP_400_BAD_REQUEST,
+            )
+        users = User.objects.in_bulk(usernames, field_name="username")
+        missing = [username for username in usernames if username not in users]
+        if missing:
+            return Response({"error": f"Usuarios inexistentes: {', '.join(missing)}"},
+                            status=status.HTTP_404_NOT_FOUND)
+
+        tournament, events = tournaments.create_tournament(
+            name, request.user, [users[username] for username in usernames]
+        )
+        async_to_sync(tournaments.announce)(channel_layer, events)
+        return Response(tournaments.serialize(tournament, request.user), status=status.HTTP_201_CREATED)
+
+
+class TournamentDetailAPIView(APIView):
+    """Cuadro completo de un torneo: rondas, partidas, marcadores y salas."""
+    permission_classes = [IsAuthenticated]
+
+    def get(self, request, tournament_id, format=None):
+        tournament = get_object_or_404(Tournament, id=tournament_id)
+        return Response(tournaments.serialize(tournament, request.user))
+
+
+def _replay_of(match_id):
+    """Fichero de replay de una partida del historial, o None si no tiene."""
+    match = get_object_or_404(MatchHistory, id=match_id)
+    return match.replay or None
+
+
+class ReplayInfoAPIView(APIView):
+    """
+    Cabecera de un replay: frecuencias, número de frames, duración y los
+    ticks de sus keyframes (los puntos a los que se puede saltar).
+    """
+    permission_classes = [IsAuthenticated]
+
+    def get(self, request, match_id, format=None):
+        replay = _replay_of(match_id)
+        if replay is None:
+            return Response({"error": "Esta partida no tiene replay."}, status=status.HTTP_404_NOT_FOUND)
+        with replay.open("rb") as fileobj:
+            return Response(ReplayReader(fileobj).info())
+
+
+class ReplayFramesAPIView(APIView):
+    """
+    Frames de un replay en binario (u16 longitud + frame de protocol.py).
+
+    Con ?tick=T devuelve un trozo de como mucho ?frames=N frames
+    (MAX_CHUNK_FRAMES por defecto) desde el keyframe anterior a T, leyendo
+    del fichero solo ese trozo; la cabecera X-Replay-Tick indica dónde empieza.
+    Sin ?tick devuelve el fichero completo en streaming.
+    """
+    permission_classes = [IsAuthenticated]
+
+    def get(self, request, match_id, format=None):
+        replay = _replay_of(match_id)
+        if replay is None:
+            return Response({"error": "Esta partida no tiene replay."}, status=status.HTTP_404_NOT_FOUND)
+        if "tick" not in request.query_params:
+            return FileResponse(replay.open("rb"), content_type="application/octet-stream")
+
+        try:
+            tick = max(0, int(request.query_params["tick"]))
+            frames = int(request.query_params.get("frames", MAX_CHUNK_FRAMES))
+        except ValueError:
+            return Response({"error": "tick y frames deben ser enteros."}, status=status.HTTP_400_BAD_REQUEST)
+        frames = max(1, min(frames, MAX_CHUNK_FRAMES))
+
+        with replay.open("rb") as fileobj:
+            start_tick, data, count = ReplayReader(fileobj).chunk(tick, frames)
+        response = HttpResponse(data, content_type="application/octet-stream")
+        response["X-Replay-Tick"] = str(start_tick)
+        response["X-Replay-Frames"] = str(count)
+        return response
@@ -0,0 +1,451 @@
+"""
+Afinidad de salas entre varios workers ASGI (PONG_CLUSTER).
+
+Con más de un worker, los dos jugadores de una sala pueden caer en procesos
+distintos. En lugar de simular la sala en ambos, cada room_id tiene un único
+worker dueño que la simula (GameRoom); los demás le reenvían las entradas por
+el channel layer y reciben de él un solo mensaje de frame por snapshot, que
+reparten entre sus sockets locales.
+
+  - Cada worker tiene un canal propio (channel_layer.new_channel()) que hace
+    de identificador y se anuncia con un latido en el ZSET WORKERS_KEY
+    (puntuación = último latido). Vivos = latido hace menos de WORKER_TTL.
+  - El dueño de una sala se elige por hashing de rendezvous (HRW) sobre los
+    workers vivos y se fija en OWNER_KEY (SET NX con TTL), que el dueño
+    renueva en cada latido mientras tenga la sala.
+  - Rebalanceo: si el dueño deja de latir, la siguiente conexión reasigna la
+    sala por HRW entre los vivos; un worker nuevo entra en el HRW y recibe su
+    parte de las salas nuevas. Las partidas en curso no migran de worker:
+    terminan donde empezaron.
+  - Workers caídos: en cada latido se olvidan los que ya no laten. El dueño
+    cierra sus RemoteHub (sus jugadores cuentan como desconectados) y cada
+    worker con sockets en salas de un dueño caído los vuelve a unir a la sala
+    en el nuevo dueño (owner_of), donde empieza de cero.
+
+Mensajes entre workers (channel_layer.send al canal del worker):
+    pong.join / pong.leave / pong.input / pong.start   -> al dueño
+    pong.frame                                         -> a cada worker con jugadores
+    pong.watch / pong.unwatch                          -> al dueño (espectadores)
+    pong.spectate                                      -> a cada worker con espectadores
+
+Las altas, bajas y arranques (pong.join / pong.leave / pong.start) pueden
+esperar a la BD; se procesan en tareas propias, en orden por sala, y el
+bucle de recepción sigue repartiendo frames mientras tanto.
+
+Sin PONG_CLUSTER todo es local y no se toca Redis.
+"""
+import asyncio
+import hashlib
+import json
+import logging
+import time
+from collections import namedtuple
+
+from channels.layers import get_channel_layer
+from django.conf import settings
+from redis.exceptions import WatchError
+
+from backend.redis_pool import get_redis
+from .metrics import metrics
+from .rooms import rooms
+from .spectators import spectators
+
+WORKERS_KEY = "pong:workers"
+OWNER_KEY = "pong:room:{room_id}:owner"
+
+# Segundos entre latidos, sin latido para darse por muerto y de vida de la
+# asignación de una sala (se renueva en cada latido del dueño)
+HEARTBEAT = 3
+WORKER_TTL = 10
+OWNER_TTL = 30
+# Segundos que se cachea la lista de workers vivos
+LIVE_CACHE = 1
+
+RemoteUser = namedtuple("RemoteUser", "id username")
+
+
+def rendezvous(room_id, workers):
+    """Worker con mayor peso HRW para la sala (estable al añadir o quitar otros)."""
+    def weight(worker):
+        return hashlib.blake2b(f"{worker}:{room_id}".encode(), digest_size=8).digest()
+    return max(workers, key=weight)
+
+
+class RemotePlayer:
+    """En el dueño, un socket de jugador conectado a otro worker."""
+
+    __slots__ = ("user", "subprotocol")
+
+    def __init__(self, user, subprotocol):
+        self.user = user
+        self.subprotocol = subprotocol
+
+
+class RemoteHub:
+    """
+    En el dueño, receptor de frames que representa a otro worker: un único
+    mensaje por snapshot, sea cual sea el número de sockets que tenga allí.
+    """
+
+    def __init__(self, cluster, room, worker):
+        self.cluster = cluster
+        self.room = room
+        self.worker = worker
+        self.players = {}
+
+    def add(self, member, player):
+        self.players[member] = player
+
+    def remove(self, member):
+        """Quita un jugador y ajusta las codificaciones que pide el hub a la sala."""
+        player = self.players.pop(member, None)
+        self.room.detach(self)
+        for other in self.players.values():
+            self.room.attach(self, bool(other.subprotocol))
+        return player
+
+    async def send_frame(self, text, frame):
+        await self.cluster.channel_layer.send(self.worker, {
+            "type": "pong.frame",
+            "room_id": self.room.room_id,
+            "text": text,
+            "frame": frame,
+        })
+
+
+class RemoteRoom:
+    """
+    En un worker que no es el dueño, proxy de la sala con el mismo interfaz
+    que GameRoom para el consumidor: reenvía sus operaciones al dueño y reparte
+    los frames que llegan de él.
+    """
+
+    def __init__(self, cluster, room_id, owner):
+        self.cluster = cluster
+        self.room_id = room_id
+        self.owner = owner
+        self.members = set()
+
+    def __str__(self):
+        return f"RemoteRoom {self.room_id} -> {self.owner}"
+
+    async def forward(self, kind, consumer, **fields):
+        await self.cluster.channel_layer.send(self.owner, {
+            "type": kind,
+            "room_id": self.room_id,
+            "worker": self.cluster.worker_id,
+            "member": consumer.channel_name,
+            **fields,
+        })
+
+    async def join(self, consumer):
+        self.members.add(consumer)
+        await self.forward(
+            "pong.join", consumer,
+            user_id=consumer.user.id, username=consumer.user.username,
+            subprotocol=consumer.subprotocol,
+        )
+        # La pala la asigna el dueño; llega a todos en el room_update
+        return None
+
+    async def leave(self, consumer):
+        self.members.discard(consumer)
+        if not self.members and self.cluster.proxies.get(self.room_id) is self:
+            del self.cluster.proxies[self.room_id]
+        await self.forward("pong.leave", consumer)
+
+    async def move(self, consumer, seq, direction):
+        # El dueño descarta duplicados y sockets sin asiento
+        await self.forward("pong.input", consumer, seq=seq, direction=direction)
+        return True
+
+    async def request_start(self, consumer):
+        await self.forward("pong.start", consumer)
+
+    async def deliver(self, text, frame):
+        started = time.perf_counter()
+        results = await asyncio.gather(
+            *(member.send_frame(text, frame) for member in list(self.members)),
+            return_exceptions=True,
+        )
+        metrics.observe("send", (time.perf_counter() - started) * 1000)
+        failed = sum(isinstance(result, Exception) for result in results)
+        if failed:
+            metrics.drop(failed)
+
+
+class Cluster:
+    """Pertenencia de este worker al clúster y enrutado de salas al dueño."""
+
+    def __init__(self, enabled=False):
+        self.enabled = enabled
+        self.worker_id = None
+        self.channel_layer = None
+        # room_id -> RemoteRoom (salas de otros dueños con sockets aquí)
+        self.proxies = {}
+        # (room_id, worker) -> RemoteHub (salas propias con sockets en otros workers)
+        self.hubs = {}
+        # room_id -> última tarea de altas/bajas de la sala (se ejecutan en orden)
+        self._room_tasks = {}
+        self._started = None
+        self._tasks = []
+        self._live = ()
+        self._live_at = 0.0
+
+    async def room_for(self, room_id):
+        """GameRoom local si este worker es el dueño de la sala, o un proxy al dueño."""
+        room_id = str(room_id)
+        if not self.enabled:
+            return rooms.get_or_create(room_id)
+        owner = await self.owner_of(room_id)
+        if owner == self.worker_id:
+            return rooms.get_or_create(room_id)
+        proxy = self.proxies.get(room_id)
+        if proxy is None or proxy.owner != owner:
+            proxy = self.proxies[room_id] = RemoteRoom(self, room_id, owner)
+        return proxy
+
+    async def watch(self, room_id, consumer):
+        """
+        Suscribe un espectador al stream de la sala. Si la simula otro worker,
+        este se apunta una vez como observador en el dueño (pong.watch), que
+        le enviará un único pong.spectate por frame.
+        """
+        room_id = str(room_id)
+        owner = None
+        if self.enabled:
+            owner = await self.owner_of(room_id)
+            if owner == self.worker_id:
+                owner = None
+        audience, first = spectators.add(room_id, consumer)
+        if first:
+            audience.owner = owner
+        if audience.owner:
+            # También en cada alta: el dueño fuerza un keyframe y reenvía los jugadores
+            await self.channel_layer.send(audience.owner, {
+                "type": "pong.watch", "room_id": room_id, "worker": self.worker_id,
+            })
+            return
+        room = rooms.get(room_id)
+        if room is not None:
+            room.feed.force_keyframe()
+            await consumer.send_frame(
+                json.dumps(room.room_update()), None
+            )
+
+    async def unwatch(self, room_id, consumer):
+        audience = spectators.discard(str(room_id), consumer)
+        if audience is not None and audience.owner:
+            await self.channel_layer.send(audience.owner, {
+                "type": "pong.unwatch", "room_id": audience.room_id, "worker": self.worker_id,
+            })
+
+    # ======================================================
+    #   Pertenencia y dueños
+    # ======================================================
+    async def start(self):
+        """Se registra en el clúster la primera vez que hace falta (idempotente)."""
+        if self._started is None:
+            self._started = asyncio.ensure_future(self._start())
+        await self._started
+
+    async def _start(self):
+        self.channel_layer = get_channel_layer()
+        self.worker_id = await self.channel_layer.new_channel(prefix="pongworker")
+        await get_redis().zadd(WORKERS_KEY, {self.worker_id: time.time()})
+        self._tasks = [
+            asyncio.create_task(self.heartbeat()),
+            asyncio.create_task(self.receive_loop()),
+        ]
+        logging.info(f"🛰️ Worker {self.worker_id} unido al clúster de Pong")
+
+    async def live_workers(self):
+        now = time.monotonic()
+        if now - self._live_at > LIVE_CACHE:
+            self._live = set(await get_redis().zrangebyscore(
+                WORKERS_KEY, time.time() - WORKER_TTL, "+inf"
+            ))
+            # Este worker está vivo aunque su latido aún no se vea
+            self._live.add(self.worker_id)
+            self._live_at = now
+        return self._live
+
+    async def owner_of(self, room_id):
+        """
+        Worker dueño de la sala. Respeta la asignación vigente mientras su
+        dueño siga vivo; si no la hay (o el dueño murió) la fija por HRW.
+        """
+        await self.start()
+        redis = get_redis()
+        key = OWNER_KEY.format(room_id=room_id)
+        owner = await redis.get(key)
+        live = await self.live_workers()
+        if owner in live:
+            return owner
+
+        candidate = rendezvous(room_id, live)
+        # Compare-and-set: solo se reasigna si nadie lo ha hecho entretanto
+        async with redis.pipeline() as pipe:
+            try:
+                await pipe.watch(key)
+                current = await pipe.get(key)
+                if current != owner:
+                    return current
+                pipe.multi()
+                pipe.set(key, candidate, ex=OWNER_TTL)
+                await pipe.execute()
+            except WatchError:
+                return await redis.get(key)
+        if owner is not None:
+            logging.info(f"🛰️ Sala {room_id} reasignada de {owner} (caído) a {candidate}")
+        return candidate
+
+    async def heartbeat(self):
+        """Latido del worker y renovación de las salas que simula."""
+        redis = get_redis()
+        while True:
+            try:
+                now = time.time()
+                async with redis.pipeline(transaction=False) as pipe:
+                    pipe.zadd(WORKERS_KEY, {self.worker_id: now})
+                    pipe.zremrangebyscore(WORKERS_KEY, "-inf", now - WORKER_TTL)
+                    for room_id in rooms.ids():
+                        pipe.expire(OWNER_KEY.format(room_id=room_id), OWNER_TTL)
+                    await pipe.execute()
+                await self.drop_dead_workers()
+            except Exception as e:
+                logging.warning(f"⚠️ Latido del clúster fallido: {e}")
+            await asyncio.sleep(HEARTBEAT)
+
+    async def drop_dead_workers(self):
+        """
+        Olvida a los workers sin latido: cierra sus RemoteHub en las salas de
+        aquí y lleva los sockets de aquí que jugaban en sus salas al nuevo dueño.
+        """
+        # Sin caché: se acaba de podar WORKERS_KEY
+        self._live_at = 0.0
+        live = await self.live_workers()
+
+        for hub_key, hub in list(self.hubs.items()):
+            if hub.worker in live:
+                continue
+            del self.hubs[hub_key]
+            hub.room.detach(hub)
+            for player in list(hub.players.values()):
+                await hub.room.leave(player, detach=False)
+            logging.info(f"🛰️ Sala {hub.room.room_id}: fuera los jugadores de {hub.worker} (caído)")
+
+        for room_id, proxy in list(self.proxies.items()):
+            if proxy.owner in live:
+                continue
+            del self.proxies[room_id]
+            # owner_of reasigna la sala entre los vivos (puede ser este worker)
+            room = await self.room_for(room_id)
+            for consumer in list(proxy.members):
+                consumer.game = room
+                await room.join(consumer)
+            logging.info(f"🛰️ Sala {room_id}: {len(proxy.members)} sockets pasan de {proxy.owner} (caído) a {room}")
+
+    # ======================================================
+    #   Mensajes entre workers
+    # ======================================================
+    async def receive_loop(self):
+        while True:
+            message = await self.channel_layer.receive(self.worker_id)
+            try:
+                await self.dispatch(message)
+            except Exception as e:
+                logging.warning(f"⚠️ Error procesando {message.get('type')} del clúster: {e}")
+
+    async def dispatch(self, message):
+        kind = message["type"]
+        room_id = message["room_id"]
+
+        if kind == "pong.frame":
+            proxy = self.proxies.get(room_id)
+            if proxy is not None:
+                await proxy.deliver(message["text"], message["frame"])
+            return
+
+        if kind == "pong.spectate":
+            audience = spectators.audiences.get(room_id)
+            if audience is not None:
+                # En su propia tarea: no frena la recepción de frames de jugadores
+                audience.relay(message["text"], message["frame"])
+            return
+        if kind == "pong.watch":
+            spectators.watch(room_id, message["worker"])
+            room = rooms.get(room_id)
+            if room is not None:
+                room.feed.force_keyframe()
+                await self.channel_layer.send(message["worker"], {
+                    "type": "pong.spectate",
+                    "room_id": room_id,
+                    "text": json.dumps(room.room_update()),
+                    "frame": None,
+                })
+            return
+        if kind == "pong.unwatch":
+            spectators.unwatch(room_id, message["worker"])
+            return
+
+        if kind == "pong.input":
+            hub = self.hubs.get((room_id, message["worker"]))
+            player = hub.players.get(message["member"]) if hub is not None else None
+            if player is not None:
+                await hub.room.move(player, message["seq"], message["direction"])
+            return
+
+        # Altas, bajas y arranques esperan a la BD (GameRoom.load_players()):
+        # en su propia tarea, para que los frames no se queden detrás
+        self.in_order(room_id, self.handle_member(message))
+
+    def in_order(self, room_id, coro):
+        """Ejecuta coro en su propia tarea, tras las anteriores de la misma sala."""
+        previous = self._room_tasks.get(room_id)
+        task = self._room_tasks[room_id] = asyncio.create_task(self._after(previous, coro))
+
+        def forget(done):
+            if self._room_tasks.get(room_id) is done:
+                del self._room_tasks[room_id]
+        task.add_done_callback(forget)
+
+    async def _after(self, previous, coro):
+        if previous is not None:
+            await asyncio.wait([previous])
+        try:
+            await coro
+        except Exception as e:
+            logging.warning(f"⚠️ Error procesando un mensaje de jugador del clúster: {e}")
+
+    async def handle_member(self, message):
+        """pong.join / pong.leave / pong.start de un socket de otro worker."""
+        kind = message["type"]
+        room_id = message["room_id"]
+        hub_key = (room_id, message["worker"])
+        member = message["member"]
+        if kind == "pong.join":
+            room = rooms.get_or_create(room_id)
+            hub = self.hubs.get(hub_key)
+            if hub is None or hub.room is not room:
+                hub = self.hubs[hub_key] = RemoteHub(self, room, message["worker"])
+            player = RemotePlayer(
+                RemoteUser(message["user_id"], message["username"]), message["subprotocol"]
+            )
+            hub.add(member, player)
+            await room.join(player, receiver=hub)
+            return
+
+        hub = self.hubs.get(hub_key)
+        player = hub.players.get(member) if hub is not None else None
+        if player is None:
+            return
+        if kind == "pong.start":
+            await hub.room.request_start(player)
+        elif kind == "pong.leave":
+            hub.remove(member)
+            if not hub.players:
+                del self.hubs[hub_key]
+            await hub.room.leave(player, detach=False)
+
+cluster = Cluster(enabled=settings.PONG_CLUSTER)
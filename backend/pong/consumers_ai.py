@@ -1,12 +1,25 @@
 import json
 import logging
-import asyncio
+from urllib.parse import parse_qs
 from channels.generic.websocket import AsyncWebsocketConsumer
-import random
+from users.models import MatchHistory
+from .ai import PongAI, DEFAULT_DIFFICULTY
+from .engine import GameState, AI_RULES, LEFT, per_second
+from .inputs import InputQueue
+from .protocol import FrameEncoder, negotiate
+from .replay import ReplayRecorder
+from .results import MatchResult, results
+from .scheduler import scheduler
 
 logging.basicConfig(level=logging.DEBUG)
 
 class PongAIGameConsumer(AsyncWebsocketConsumer):
+    # La pala de la IA se recalcula en cada tick (ver scheduler.py)
+    dynamic_inputs = True
+
+    def __str__(self):
+        return f"IA {getattr(self, 'room_id', '?')}"
+
     async def connect(self):
         """
         Acepta la conexión solo si el usuario está autenticado.
@@ -20,38 +33,23 @@ class PongAIGameConsumer(AsyncWebsocketConsumer):
             await self.close()
             return
 
-        await self.channel_layer.group_add(self.room_group_name, self.channel_name)
-        await self.accept()
-
-        # ----------------------------------------------
-        # Constantes y estado
-        # ----------------------------------------------
-        self.PADDLE_HEIGHT = 20
-        self.PADDLE_HALF = self.PADDLE_HEIGHT / 2.0
-        self.MAX_SPEED_PER_FRAME = 2  # Velocidad con la que la IA se acerca a su "target"
-
-        # Donde la IA quiere colocar su pala derecha (centro)
-        self.ai_target = 50  
-
-        # Palas
-        self.paddle_left = 50
-        self.paddle_right = 50
-        self.paddle_left_speed = 0
-        self.paddle_right_speed = 0
+        # Subprotocolo binario para los frames si el cliente lo pide (JSON si no)
+        self.subprotocol = negotiate(self.scope)
+        self.encoder = FrameEncoder()
 
-        # Pelota
-        self.ball_x = 50
-        self.ball_y = 50
-        self.initial_vx = -1.0
-        self.initial_vy = 0.7
+        await self.channel_layer.group_add(self.room_group_name, self.channel_name)
+        await self.accept(self.subprotocol)
 
-        # Marcador
-        self.score_left = 0
-        self.score_right = 0
+        # IA de la pala derecha (ver ai.py); nivel con ?difficulty=easy|normal|hard
+        query = parse_qs(self.scope.get("query_string", b"").decode())
+        self.ai = PongAI(query.get("difficulty", [DEFAULT_DIFFICULTY])[0])
 
-        # Tareas
-        self.ai_task = None
-        self.game_task = None
+        # Estado de la partida (ver engine.py); la primera pelota va hacia el humano
+        self.state = GameState(scheduler.rules(AI_RULES), serve_to=LEFT)
+        # Entradas del jugador humano (pala izquierda), aplicadas una vez por tick
+        self.left_input = InputQueue()
+        # Grabación de la partida (ver replay.py)
+        self.recorder = ReplayRecorder()
 
         await self.send_initial_state()
         logging.debug(f"🔗 {self.user.username} conectado a la sala IA {self.room_id}")
@@ -60,10 +58,7 @@ class PongAIGameConsumer(AsyncWebsocketConsumer):
         """
         Cancelamos tareas y abandonamos el grupo.
         """
-        if self.ai_task:
-            self.ai_task.cancel()
-        if self.game_task:
-            self.game_task.cancel()
+        scheduler.remove(self)
 
         await self.channel_layer.group_discard(self.room_group_name, self.channel_name)
         logging.debug(f"❌ {self.user.username} desconectado de la sala IA {self.room_id}")
@@ -72,7 +67,7 @@ class PongAIGameConsumer(AsyncWebsocketConsumer):
         """
         Mensajes JSON desde el frontend:
          - "paddle_input": speed => Jugador humano
-         - "start_game": iniciar IA + bucle ~60 FPS
+         - "start_game": iniciar IA + ticks ~60 FPS
         """
         try:
             data = json.loads(text_data)
@@ -90,220 +85,83 @@ class PongAIGameConsumer(AsyncWebsocketConsumer):
     async def handle_paddle_input_left(self, data):
         """
         Ajusta la velocidad de la pala IZQUIERDA (jugador humano).
+        Se aplica en el próximo tick; "seq" se devuelve como ack_left.
         """
         speed = float(data.get("speed", 0))
-        self.paddle_left_speed = speed
+        self.left_input.push(data.get("seq"), speed=per_second(speed))
         logging.debug(f"🚀 Jugador humano -> pala izquierda speed={speed}")
 
     async def start_game(self):
         """
-        {type:"start_game"} => inicia la IA y el bucle principal
+        {type:"start_game"} => registra la partida en el planificador; la IA
+        replanifica en cada tick (inputs())
         """
-        logging.debug("⏯ start_game recibido => Iniciando IA + bucle principal")
-
-        if not self.ai_task:
-            self.ai_task = asyncio.create_task(self.ai_loop())
+        logging.debug(f"⏯ start_game recibido => IA {self.ai.difficulty.name}")
 
-        if not self.game_task:
-            self.ball_vx = self.initial_vx
-            self.ball_vy = self.initial_vy
-            self.game_task = asyncio.create_task(self.game_loop())
+        if self not in scheduler and self.state.winner is None:
+            scheduler.add(self)
 
     # ======================================================
-    #   IA loop => actualiza ai_target cada 1 seg
+    #   Tick => lo llama el planificador (scheduler.py)
     # ======================================================
-    async def ai_loop(self):
-        """
-        Cada 1 segundo, la IA predice la trayectoria
-        y decide a dónde colocar la pala derecha.
-        Con 1/5 de probabilidad “falla” y elige un objetivo aleatorio.
-        """
-        try:
-            while True:
-                await asyncio.sleep(1.0)
-
-                chance = random.random()  # Valor en [0,1)
-                if chance < 0.1:
-                    self.ai_target = random.uniform(0, 100)
-                    logging.debug(f"🤖 IA => HA FALLADO INTENCIONALMENTE. target={self.ai_target:.2f}")
-                else:
-                    predicted = self.predict_ball_y_assuming_rebound()
-                    if predicted is not None:
-                        error = random.uniform(-3, 3)
-                        self.ai_target = predicted + error
-                    else:
-                        self.ai_target = self.paddle_right
-                    logging.debug(f"🤖 IA => target={self.ai_target:.2f}")
-        except asyncio.CancelledError:
-            logging.debug("🚫 ai_loop cancelado (socket cerrado).")
-
-    def predict_ball_y_assuming_rebound(self):
-        """
-        Simula la trayectoria de la pelota y devuelve la posición Y final.
-        """
-        sim_x = self.ball_x
-        sim_y = self.ball_y
-        vx = self.ball_vx
-        vy = self.ball_vy
-
-        if vx < 0:
-            while sim_x > 5:
-                sim_x += vx
-                sim_y += vy
-                if sim_y <= 0:
-                    sim_y = -sim_y
-                    vy = -vy
-                elif sim_y >= 100:
-                    sim_y = 200 - sim_y
-                    vy = -vy
-            vx = abs(vx)
-
-        while sim_x < 95:
-            sim_x += vx
-            sim_y += vy
-            if sim_y <= 0:
-                sim_y = -sim_y
-                vy = -vy
-            elif sim_y >= 100:
-                sim_y = 200 - sim_y
-                vy = -vy
-            if vx < 0:
-                return None
-        return sim_y
-
-    # ======================================================
-    #   Bucle principal => ~60 FPS
-    # ======================================================
-    async def game_loop(self):
-        """
-        Cada ~16ms mueve la pelota y palas, y difunde "game_update".
-        """
-        try:
-            max_score = 5
-            ball_radius = 1.25  # 10px de 800 = 1.25%
-            # Definimos la posición de las palas (en porcentaje)
-            left_paddle_x = 5
-            right_paddle_x = 95
-            left_paddle_width = 1.25
-            right_paddle_width = 1.25
-
-            while True:
-                # Mueve la pelota
-                self.ball_x += self.ball_vx
-                self.ball_y += self.ball_vy
-
-                # Mueve la pala izquierda
-                self.paddle_left += self.paddle_left_speed
-                self.paddle_left = max(self.PADDLE_HALF, min(100 - self.PADDLE_HALF, self.paddle_left))
-
-                # Mueve la pala derecha: la IA se acerca al target
-                let_dist = self.ai_target - self.paddle_right
-                if abs(let_dist) < 0.5:
-                    self.paddle_right = self.ai_target
-                else:
-                    move = max(min(let_dist, self.MAX_SPEED_PER_FRAME), -self.MAX_SPEED_PER_FRAME)
-                    self.paddle_right += move
-                self.paddle_right = max(self.PADDLE_HALF, min(100 - self.PADDLE_HALF, self.paddle_right))
-
-                # Rebote vertical
-                if self.ball_y <= 0 or self.ball_y >= 100:
-                    self.ball_vy *= -1
+    def inputs(self):
+        state = self.state
+        return (self.left_input.take(state.rules.dt), self.ai.speed(state))
 
-                # Anotación: gol a la izquierda o derecha
-                if self.ball_x - ball_radius <= 0:
-                    self.score_right += 1
-                    self.reset_ball(right_side=True)
-                elif self.ball_x + ball_radius >= 100:
-                    self.score_left += 1
-                    self.reset_ball(right_side=False)
-                else:
-                    # Colisión con la pala izquierda
-                    if self.ball_x - ball_radius <= left_paddle_x + left_paddle_width:
-                        if abs(self.ball_y - self.paddle_left) <= self.PADDLE_HALF:
-                            self.ball_vx = abs(self.ball_vx)
-                            self.ball_x = left_paddle_x + left_paddle_width + ball_radius
-                            self.speed_up_ball()
-                    # Colisión con la pala derecha
-                    if self.ball_x + ball_radius >= right_paddle_x - right_paddle_width:
-                        if abs(self.ball_y - self.paddle_right) <= self.PADDLE_HALF:
-                            self.ball_vx = -abs(self.ball_vx)
-                            self.ball_x = right_paddle_x - right_paddle_width - ball_radius
-                            self.speed_up_ball()
-
-                # Envía el estado actual al cliente
-                await self.channel_layer.group_send(
-                    self.room_group_name,
-                    {
-                        "type": "game_update",
-                        "data": {
-                            "type": "game_update",
-                            "ball_x": self.ball_x,
-                            "ball_y": self.ball_y,
-                            "score_left": self.score_left,
-                            "score_right": self.score_right,
-                            "paddle_left": self.paddle_left,
-                            "paddle_right": self.paddle_right,
-                        }
-                    }
-                )
-
-                # Fin de partida
-                if self.score_left >= max_score or self.score_right >= max_score:
-                    winner = self.user.username if (self.score_left > self.score_right) else "La IA"
-                    await self.channel_layer.group_send(
-                        self.room_group_name,
-                        {
-                            "type": "game_over",
-                            "data": {
-                                "type": "game_over",
-                                "score_left": self.score_left,
-                                "score_right": self.score_right,
-                                "winner": winner
-                            }
-                        }
-                    )
-                    break
-
-                await asyncio.sleep(0.016)
-        except asyncio.CancelledError:
-            logging.debug("🚫 game_loop cancelado (socket cerrado).")
-
-    def check_paddle_collision(self, paddle_center):
+    def after_step(self, event):
         """
-        Retorna True si la pelota colisiona con la pala centrada en paddle_center.
+        Tras avanzar la física (engine.step) devuelve el envío de "game_update".
         """
-        min_paddle = paddle_center - self.PADDLE_HALF
-        max_paddle = paddle_center + self.PADDLE_HALF
-        return (min_paddle < self.ball_y < max_paddle)
+        state = self.state
+        # Solo se emite un snapshot cada scheduler.snapshot_every ticks
+        if state.winner is None and not scheduler.snapshot_due(state):
+            return ()
+        acks = (self.left_input.acked, 0)
+        self.recorder.record(state, scheduler.now_ms, acks)
 
-    def speed_up_ball(self):
-        """
-        Aumenta la velocidad de la pelota (vx, vy) en ±0.01 según su dirección actual.
-        """
-        increment = 0.01
-        if self.ball_vx > 0:
-            self.ball_vx += increment
-        else:
-            self.ball_vx -= increment
-        if self.ball_vy > 0:
-            self.ball_vy += increment
-        else:
-            self.ball_vy -= increment
-        logging.debug(f"⚡ Ball speed up => vx={self.ball_vx:.2f}, vy={self.ball_vy:.2f}")
-
-    def reset_ball(self, right_side=True):
-        """
-        Resetea la pelota y la velocidad al anotar un punto.
-        """
-        self.ball_x = 50
-        self.ball_y = 50
-        self.ball_vx = self.initial_vx
-        self.ball_vy = self.initial_vy
-
-        if right_side:
-            self.ball_vx = abs(self.ball_vx)
+        # La sala solo tiene este socket: los frames se envían directamente,
+        # sin pasar por el channel layer (Redis)
+        if self.subprotocol:
+            messages = [self.encoder.encode(state, scheduler.now_ms, acks)]
         else:
-            self.ball_vx = -abs(self.ball_vx)
+            messages = [{
+                "type": "game_update",
+                "tick": state.tick,
+                "t": scheduler.now_ms,
+                "ball_x": state.ball_x,
+                "ball_y": state.ball_y,
+                "score_left": state.score_left,
+                "score_right": state.score_right,
+                "paddle_left": state.paddle_left,
+                "paddle_right": state.paddle_right,
+                "ack_left": self.left_input.acked,
+            }]
+
+        # Fin de partida
+        if state.winner is not None:
+            scheduler.remove(self)
+            winner = self.user.username if state.winner == LEFT else "La IA"
+            # Historial y replay por lotes en el sumidero (no suma estadísticas)
+            results.submit(MatchResult(
+                None, False, self.user.id, None, state.score_left, state.score_right,
+                self.user.id if state.winner == LEFT else None,
+                mode=MatchHistory.AI, replay=self.recorder,
+            ))
+            messages.append({
+                "type": "game_over",
+                "score_left": state.score_left,
+                "score_right": state.score_right,
+                "winner": winner
+            })
+        return [self.send_messages(messages)]
+
+    async def send_messages(self, messages):
+        """Envía los mensajes al cliente, en orden."""
+        for message in messages:
+            if isinstance(message, bytes):
+                await self.send(bytes_data=message)
+            else:
+                await self.send(text_data=json.dumps(message))
 
     # ======================================================
     # Handlers group_send
@@ -321,21 +179,13 @@ class PongAIGameConsumer(AsyncWebsocketConsumer):
         data = event["data"]
         await self.send(text_data=json.dumps(data))
 
-    async def game_over(self, event):
-        data = event["data"]
-        if self.ai_task:
-            self.ai_task.cancel()
-        if self.game_task:
-            self.game_task.cancel()
-        await self.send(text_data=json.dumps(data))
-
     async def send_initial_state(self):
         await self.send(text_data=json.dumps({
             "type": "initial_state",
-            "paddle_left": self.paddle_left,
-            "paddle_right": self.paddle_right,
-            "ball_x": self.ball_x,
-            "ball_y": self.ball_y,
-            "score_left": self.score_left,
-            "score_right": self.score_right,
+            "paddle_left": self.state.paddle_left,
+            "paddle_right": self.state.paddle_right,
+            "ball_x": self.state.ball_x,
+            "ball_y": self.state.ball_y,
+            "score_left": self.state.score_left,
+            "score_right": self.state.score_right,
         }))
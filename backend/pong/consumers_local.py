@@ -1,47 +1,44 @@
 import json
-import asyncio
 import logging
 from channels.generic.websocket import AsyncWebsocketConsumer
+from .engine import GameState, LOCAL_RULES, LEFT, per_second
+from .inputs import InputQueue
+from .protocol import FrameEncoder, negotiate
+from .scheduler import scheduler
 
 logging.basicConfig(level=logging.DEBUG)
 
 class LocalPongGameConsumer(AsyncWebsocketConsumer):
+    def __str__(self):
+        return f"Local {getattr(self, 'channel_name', '?')}"
+
     async def connect(self):
         # Se usa "local" como room_id por defecto (o se puede pasar por URL)
         self.room_id = self.scope["url_route"]["kwargs"].get("room_id", "local")
         self.room_group_name = f"pong_local_{self.room_id}"
         
+        # Subprotocolo binario para los frames si el cliente lo pide (JSON si no)
+        self.subprotocol = negotiate(self.scope)
+        self.encoder = FrameEncoder()
+        
         await self.channel_layer.group_add(self.room_group_name, self.channel_name)
-        await self.accept()
+        await self.accept(self.subprotocol)
         logging.debug("Conexión WebSocket para juego local establecida.")
         
-        # Estado del juego (en porcentajes, 0-100)
-        self.PADDLE_HEIGHT = 20            # Altura de la pala en %
-        self.PADDLE_HALF = self.PADDLE_HEIGHT / 2.0
-        self.paddle_left = 50              # Centro vertical de la pala izquierda
-        self.paddle_right = 50             # Centro vertical de la pala derecha
-        self.paddle_left_speed = 0         # Velocidad en % por frame
-        self.paddle_right_speed = 0
-        
-        # Estado de la pelota (en %)
-        self.ball_x = 50
-        self.ball_y = 50
-        self.ball_vx = 1.0                 # Velocidad horizontal
-        self.ball_vy = 1.0                 # Velocidad vertical
-        
-        # Marcadores
-        self.score_left = 0
-        self.score_right = 0
+        # Estado del juego (en porcentajes, 0-100; ver engine.py)
+        self.state = GameState(scheduler.rules(LOCAL_RULES))
+        # Entradas de cada pala (velocidad en %/s), aplicadas una vez por tick
+        self.left_input = InputQueue()
+        self.right_input = InputQueue()
         
-        # La partida no inicia hasta recibir "start_game" (luego de la cuenta atrás)
-        self.game_task = None
+        # La partida no inicia hasta recibir "start_game" (luego de la cuenta atrás),
+        # entonces se registra en el planificador de ticks
         
         await self.send_initial_state()
         logging.debug("Estado inicial enviado para juego local.")
     
     async def disconnect(self, close_code):
-        if self.game_task:
-            self.game_task.cancel()
+        scheduler.remove(self)
         await self.channel_layer.group_discard(self.room_group_name, self.channel_name)
         logging.debug("Conexión WebSocket para juego local cerrada.")
     
@@ -59,122 +56,85 @@ class LocalPongGameConsumer(AsyncWebsocketConsumer):
     async def handle_paddle_input(self, data):
         """
         Se espera:
-          {"type": "paddle_input", "paddle": "left" o "right", "speed": valor}
+          {"type": "paddle_input", "paddle": "left" o "right", "speed": valor, "seq": n}
         Donde "speed" es la velocidad (delta en %) que se aplicará cada frame.
+        Se aplica en el próximo tick; "seq" se devuelve como ack_left/ack_right.
         """
         paddle = data.get("paddle")
         speed = float(data.get("speed", 0))
         if paddle == "left":
-            self.paddle_left_speed = speed
+            if self.left_input.push(data.get("seq"), speed=per_second(speed)):
+                scheduler.inputs_changed(self)
             logging.debug(f"Pala izquierda: velocidad establecida a {speed}")
         elif paddle == "right":
-            self.paddle_right_speed = speed
+            if self.right_input.push(data.get("seq"), speed=per_second(speed)):
+                scheduler.inputs_changed(self)
             logging.debug(f"Pala derecha: velocidad establecida a {speed}")
     
     async def start_game(self):
         logging.debug("Mensaje start_game recibido: iniciando juego local...")
-        if not self.game_task:
-            # Reinicia la pelota si es necesario
-            self.ball_vx = 1.0 if self.ball_vx >= 0 else -1.0
-            self.ball_vy = 1.0
-            self.game_task = asyncio.create_task(self.game_loop())
+        if self not in scheduler and self.state.winner is None:
+            scheduler.add(self)
     
-    async def game_loop(self):
-        try:
-            max_score = 5
-            # Radio de la pelota en porcentaje: 10px de 800 = 1.25%
-            ball_radius = 1.25
-            # Ubicación de las palas (dibujo en el front)
-            left_paddle_right = 5 + 1.25    # Aproximadamente 6.25%
-            right_paddle_left = 95 - 1.25     # Aproximadamente 93.75%
-            # Umbrales para anotar puntos
-            score_threshold_left = 2    # Debe pasar el 2% en el lado izquierdo
-            score_threshold_right = 98  # Debe pasar el 98% en el lado derecho
-
-            while True:
-                # Actualiza la posición de las palas usando la velocidad fluida
-                self.paddle_left += self.paddle_left_speed
-                self.paddle_right += self.paddle_right_speed
-                self.paddle_left = max(self.PADDLE_HALF, min(100 - self.PADDLE_HALF, self.paddle_left))
-                self.paddle_right = max(self.PADDLE_HALF, min(100 - self.PADDLE_HALF, self.paddle_right))
-                
-                # Actualiza la posición de la pelota
-                self.ball_x += self.ball_vx
-                self.ball_y += self.ball_vy
-                
-                # Rebote vertical
-                if self.ball_y <= 0 or self.ball_y >= 100:
-                    self.ball_vy *= -1
-                
-                # Comprueba si la pelota ha pasado la zona de anotación
-                if self.ball_x - ball_radius <= score_threshold_left:
-                    self.score_right += 1
-                    self.reset_ball()
-                elif self.ball_x + ball_radius >= score_threshold_right:
-                    self.score_left += 1
-                    self.reset_ball()
-                else:
-                    # Chequea colisión con la pala izquierda
-                    if self.ball_x - ball_radius <= left_paddle_right:
-                        if abs(self.ball_y - self.paddle_left) <= self.PADDLE_HALF:
-                            self.ball_vx = abs(self.ball_vx)
-                            self.ball_x = left_paddle_right + ball_radius
-                            self.increase_ball_speed()  # Aumenta velocidad al chocar
-                    # Chequea colisión con la pala derecha
-                    if self.ball_x + ball_radius >= right_paddle_left:
-                        if abs(self.ball_y - self.paddle_right) <= self.PADDLE_HALF:
-                            self.ball_vx = -abs(self.ball_vx)
-                            self.ball_x = right_paddle_left - ball_radius
-                            self.increase_ball_speed()  # Aumenta velocidad al chocar
-                
-                # Envía el estado actual al cliente
-                update = {
-                    "type": "local_game_update",
-                    "ball_x": self.ball_x,
-                    "ball_y": self.ball_y,
-                    "paddle_left": self.paddle_left,
-                    "paddle_right": self.paddle_right,
-                    "score_left": self.score_left,
-                    "score_right": self.score_right,
-                }
-                await self.send(text_data=json.dumps(update))
-                
-                # Fin de partida
-                if self.score_left >= max_score or self.score_right >= max_score:
-                    winner = "Player Left" if self.score_left > self.score_right else "Player Right"
-                    await self.send(text_data=json.dumps({
-                        "type": "game_over",
-                        "score_left": self.score_left,
-                        "score_right": self.score_right,
-                        "winner": winner
-                    }))
-                    break
-                
-                await asyncio.sleep(0.016)
-        except asyncio.CancelledError:
-            logging.debug("Game loop cancelado (socket cerrado).")
+    def inputs(self):
+        """Velocidades de las palas; lo llama el planificador (scheduler.py)."""
+        dt = self.state.rules.dt
+        return (self.left_input.take(dt), self.right_input.take(dt))
     
-    def increase_ball_speed(self):
-        """Aumenta la velocidad de la pelota en un 5% conservando el signo."""
-        self.ball_vx = self.ball_vx * 1.05
-        self.ball_vy = self.ball_vy * 1.05
-        logging.debug(f"Velocidad de la pelota aumentada: vx={self.ball_vx:.2f}, vy={self.ball_vy:.2f}")
+    def after_step(self, event):
+        state = self.state
+        # Solo se emite un snapshot cada scheduler.snapshot_every ticks
+        if state.winner is None and not scheduler.snapshot_due(state):
+            return ()
+        
+        # Envía el estado actual al cliente
+        if self.subprotocol:
+            messages = [self.encoder.encode(
+                state, scheduler.now_ms, (self.left_input.acked, self.right_input.acked)
+            )]
+        else:
+            messages = [{
+                "type": "local_game_update",
+                "tick": state.tick,
+                "t": scheduler.now_ms,
+                "ball_x": state.ball_x,
+                "ball_y": state.ball_y,
+                "paddle_left": state.paddle_left,
+                "paddle_right": state.paddle_right,
+                "score_left": state.score_left,
+                "score_right": state.score_right,
+                "ack_left": self.left_input.acked,
+                "ack_right": self.right_input.acked,
+            }]
+        
+        # Fin de partida
+        if state.winner is not None:
+            scheduler.remove(self)
+            winner = "Player Left" if state.winner == LEFT else "Player Right"
+            messages.append({
+                "type": "game_over",
+                "score_left": state.score_left,
+                "score_right": state.score_right,
+                "winner": winner
+            })
+        return [self.send_messages(messages)]
     
-    def reset_ball(self):
-        self.ball_x = 50
-        self.ball_y = 50
-        self.ball_vx = 1.0 if self.ball_vx < 0 else -1.0
-        self.ball_vy = 1.0
+    async def send_messages(self, messages):
+        for message in messages:
+            if isinstance(message, bytes):
+                await self.send(bytes_data=message)
+            else:
+                await self.send(text_data=json.dumps(message))
     
     async def send_initial_state(self):
         init_state = {
             "type": "initial_state",
-            "paddle_left": self.paddle_left,
-            "paddle_right": self.paddle_right,
-            "ball_x": self.ball_x,
-            "ball_y": self.ball_y,
-            "score_left": self.score_left,
-            "score_right": self.score_right,
+            "paddle_left": self.state.paddle_left,
+            "paddle_right": self.state.paddle_right,
+            "ball_x": self.state.ball_x,
+            "ball_y": self.state.ball_y,
+            "score_left": self.state.score_left,
+            "score_right": self.state.score_right,
         }
         await self.send(text_data=json.dumps(init_state))
 
@@ -0,0 +1,221 @@
+"""
+Núcleo de física de Pong, puro y sin E/S.
+
+Lo usan los tres modos de juego (online, IA y local). Todo se expresa en
+porcentajes del campo (0-100) y las velocidades en %/segundo; cada llamada a
+step() avanza exactamente un tick de duración rules.dt.
+"""
+
+# Frecuencia de los bucles originales: los clientes siguen enviando velocidades
+# en "% por frame" a esta frecuencia (ver per_second()).
+BASE_FPS = 60
+
+# Lados del campo
+LEFT = -1
+RIGHT = 1
+
+# Eventos que devuelve step()
+EVENT_NONE = 0
+EVENT_HIT = 1
+EVENT_SCORE_LEFT = 2
+EVENT_SCORE_RIGHT = 3
+
+
+def per_second(speed_per_frame):
+    """Convierte una velocidad en %/frame (a BASE_FPS) a %/segundo."""
+    return speed_per_frame * BASE_FPS
+
+
+class Rules:
+    """Parámetros inmutables de una modalidad de juego."""
+
+    __slots__ = (
+        "winning_score", "paddle_half", "paddle_face", "goal_line", "ball_radius",
+        "serve_vx", "serve_vy", "speedup_add", "speedup_mul", "serve_delay",
+        "tick_rate", "dt",
+    )
+
+    def __init__(self, winning_score, paddle_half=10.0, paddle_face=5.0, goal_line=5.0,
+                 ball_radius=1.25, serve_vx=60.0, serve_vy=60.0, speedup_add=0.0,
+                 speedup_mul=1.0, serve_delay=0.0, tick_rate=BASE_FPS):
+        self.winning_score = winning_score
+        # Media altura de la pala
+        self.paddle_half = paddle_half
+        # X de la cara de la pala izquierda (la derecha es 100 - paddle_face)
+        self.paddle_face = paddle_face
+        # X a partir de la cual es gol en la izquierda (la derecha es 100 - goal_line)
+        self.goal_line = goal_line
+        self.ball_radius = ball_radius
+        # Velocidad de saque (%/s)
+        self.serve_vx = serve_vx
+        self.serve_vy = serve_vy
+        # Aceleración de la pelota en cada golpe de pala
+        self.speedup_add = speedup_add
+        self.speedup_mul = speedup_mul
+        # Segundos que la pelota sigue de largo tras un gol antes de sacar
+        self.serve_delay = serve_delay
+        self.tick_rate = tick_rate
+        self.dt = 1.0 / tick_rate
+
+    def at_rate(self, tick_rate):
+        """Copia de estas reglas simulada a otra frecuencia (ticks/s)."""
+        rules = Rules.__new__(Rules)
+        for name in Rules.__slots__:
+            setattr(rules, name, getattr(self, name))
+        rules.tick_rate = tick_rate
+        rules.dt = 1.0 / tick_rate
+        return rules
+
+
+# Modalidades: mantienen los valores de los bucles originales de cada consumidor
+ONLINE_RULES = Rules(winning_score=10, serve_delay=1.0)
+AI_RULES = Rules(
+    winning_score=5, paddle_face=6.25, goal_line=0.0,
+    serve_vy=42.0, speedup_add=per_second(0.01),
+)
+LOCAL_RULES = Rules(winning_score=5, paddle_face=6.25, goal_line=2.0, speedup_mul=1.05)
+
+
+class GameState:
+    """Estado compacto de una partida."""
+
+    __slots__ = (
+        "rules", "ball_x", "ball_y", "ball_vx", "ball_vy",
+        "paddle_left", "paddle_right", "score_left", "score_right",
+        "tick", "rally", "serve_timer", "serve_to", "winner",
+    )
+
+    def __init__(self, rules, serve_to=RIGHT):
+        self.rules = rules
+        self.paddle_left = 50.0
+        self.paddle_right = 50.0
+        self.score_left = 0
+        self.score_right = 0
+        # Ticks simulados desde el inicio
+        self.tick = 0
+        # Se incrementa en cada golpe o saque: identifica la trayectoria actual
+        self.rally = 0
+        self.serve_timer = 0.0
+        self.serve_to = serve_to
+        # LEFT / RIGHT cuando la partida ha terminado
+        self.winner = None
+        serve(self, serve_to)
+
+
+def serve(state, toward):
+    """Coloca la pelota en el centro y la lanza hacia el lado `toward`."""
+    rules = state.rules
+    state.ball_x = 50.0
+    state.ball_y = 50.0
+    state.ball_vx = rules.serve_vx * toward
+    state.ball_vy = rules.serve_vy
+    state.serve_timer = 0.0
+    state.rally += 1
+
+
+def _speed_up(state):
+    rules = state.rules
+    vx = (abs(state.ball_vx) + rules.speedup_add) * rules.speedup_mul
+    vy = (abs(state.ball_vy) + rules.speedup_add) * rules.speedup_mul
+    state.ball_vx = vx if state.ball_vx > 0 else -vx
+    state.ball_vy = vy if state.ball_vy > 0 else -vy
+
+
+def _clamp(value, low, high):
+    return low if value < low else high if value > high else value
+
+
+def step(state, inputs):
+    """
+    Avanza la partida un tick.
+
+    `inputs` es una tupla (velocidad pala izquierda, velocidad pala derecha)
+    en %/s. Devuelve uno de los EVENT_*; cuando alguien llega a
+    winning_score, state.winner queda fijado y la partida deja de avanzar.
+    """
+    rules = state.rules
+    dt = rules.dt
+    half = rules.paddle_half
+    left_speed, right_speed = inputs
+
+    state.paddle_left = _clamp(state.paddle_left + left_speed * dt, half, 100 - half)
+    state.paddle_right = _clamp(state.paddle_right + right_speed * dt, half, 100 - half)
+
+    if state.winner is not None:
+        return EVENT_NONE
+    state.tick += 1
+
+    radius = rules.ball_radius
+
+    # Tras un gol la pelota sigue de largo hasta salir del campo y espera al saque
+    if state.serve_timer > 0:
+        if -radius < state.ball_x < 100 + radius:
+            state.ball_x += state.ball_vx * dt
+            state.ball_y += state.ball_vy * dt
+        state.serve_timer -= dt
+        if state.serve_timer <= 0:
+            serve(state, state.serve_to)
+        return EVENT_NONE
+
+    x = state.ball_x + state.ball_vx * dt
+    y = state.ball_y + state.ball_vy * dt
+
+    # Rebote vertical
+    if y <= 0:
+        y = 0.0
+        state.ball_vy = abs(state.ball_vy)
+    elif y >= 100:
+        y = 100.0
+        state.ball_vy = -abs(state.ball_vy)
+
+    face = rules.paddle_face
+    event = EVENT_NONE
+
+    # Colisión con las palas
+    if state.ball_vx < 0 and x - radius <= face and abs(y - state.paddle_left) <= half:
+        x = face + radius
+        state.ball_vx = abs(state.ball_vx)
+        _speed_up(state)
+        state.rally += 1
+        event = EVENT_HIT
+    elif state.ball_vx > 0 and x + radius >= 100 - face and abs(y - state.paddle_right) <= half:
+        x = 100 - face - radius
+        state.ball_vx = -abs(state.ball_vx)
+        _speed_up(state)
+        state.rally += 1
+        event = EVENT_HIT
+
+    state.ball_x = x
+    state.ball_y = y
+
+    # Anotación
+    if event == EVENT_NONE:
+        if x - radius <= rules.goal_line:
+            return _score(state, RIGHT)
+        if x + radius >= 100 - rules.goal_line:
+            return _score(state, LEFT)
+    return event
+
+
+def _score(state, side):
+    """Suma el punto al lado `side` y prepara el siguiente saque hacia él."""
+    rules = state.rules
+    if side == LEFT:
+        state.score_left += 1
+        score = state.score_left
+        event = EVENT_SCORE_LEFT
+    else:
+        state.score_right += 1
+        score = state.score_right
+        event = EVENT_SCORE_RIGHT
+
+    if score >= rules.winning_score:
+        state.winner = side
+        return event
+
+    state.serve_to = side
+    if rules.serve_delay > 0:
+        state.serve_timer = rules.serve_delay
+    else:
+        serve(state, side)
+    return event
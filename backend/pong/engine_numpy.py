@@ -0,0 +1,253 @@
+"""
+Variante vectorizada de engine.step() para muchas salas a la vez.
+
+Guarda el estado de todas las partidas del proceso en arrays de NumPy (una
+posición por sala) y avanza todas en un único paso vectorizado: rebotes,
+colisiones con las palas y anotación sin bucle de Python por sala.
+
+Los consumidores siguen trabajando con un objeto con la misma interfaz que
+engine.GameState: BatchState es una vista sobre la posición de la sala.
+
+Para que el tick entero (no solo la física) no dependa del número de salas,
+las entradas se escriben en los arrays solo cuando cambian (las velocidades
+se conservan de un tick a otro) y due() devuelve, calculado también sobre
+los arrays, solo las salas que tienen algo que hacer en este tick: un evento,
+el final de la partida o un frame que enviar (cada `wake_every` ticks).
+"""
+import numpy as np
+
+from .engine import (
+    GameState, LEFT, RIGHT, EVENT_NONE, EVENT_HIT, EVENT_SCORE_LEFT, EVENT_SCORE_RIGHT,
+)
+
+# Campos de estado: nombre -> (dtype, conversión al leer desde la vista)
+STATE_FIELDS = {
+    "ball_x": (np.float64, float),
+    "ball_y": (np.float64, float),
+    "ball_vx": (np.float64, float),
+    "ball_vy": (np.float64, float),
+    "paddle_left": (np.float64, float),
+    "paddle_right": (np.float64, float),
+    "score_left": (np.int32, int),
+    "score_right": (np.int32, int),
+    "tick": (np.int64, int),
+    "rally": (np.int64, int),
+    "serve_timer": (np.float64, float),
+    "serve_to": (np.int8, int),
+}
+
+# Parámetros de Rules copiados por sala (pueden convivir modalidades distintas)
+RULE_FIELDS = (
+    "winning_score", "paddle_half", "paddle_face", "goal_line", "ball_radius",
+    "serve_vx", "serve_vy", "speedup_add", "speedup_mul", "serve_delay", "dt",
+)
+
+
+def _field(name, cast):
+    def getter(self):
+        return cast(getattr(self._engine, name)[self._slot])
+
+    def setter(self, value):
+        getattr(self._engine, name)[self._slot] = value
+
+    return property(getter, setter)
+
+
+class BatchState:
+    """Vista con la interfaz de GameState sobre una posición de BatchEngine."""
+
+    __slots__ = ("_engine", "_slot", "rules")
+
+    def __init__(self, engine, slot, rules):
+        self._engine = engine
+        self._slot = slot
+        self.rules = rules
+
+    @property
+    def winner(self):
+        winner = int(self._engine.winner[self._slot])
+        return winner or None
+
+    @winner.setter
+    def winner(self, value):
+        self._engine.winner[self._slot] = value or 0
+
+
+for _name, (_dtype, _cast) in STATE_FIELDS.items():
+    setattr(BatchState, _name, _field(_name, _cast))
+
+
+class BatchEngine:
+    """Estado de todas las salas del proceso en arrays (struct of arrays)."""
+
+    def __init__(self, capacity=256):
+        self.capacity = 0
+        self.free = []
+        # Objeto de cada posición (la sala del planificador), para due()
+        self.owners = []
+        self._allocate(capacity)
+
+    def __len__(self):
+        return int(self.active.sum())
+
+    def _allocate(self, capacity):
+        """Crea o amplía los arrays hasta `capacity` posiciones."""
+        old = self.capacity
+        fields = [(name, dtype) for name, (dtype, _) in STATE_FIELDS.items()]
+        fields += [(name, np.float64) for name in RULE_FIELDS]
+        fields += [("winner", np.int8), ("active", np.bool_), ("wake_every", np.int64),
+                   ("in_left", np.float64), ("in_right", np.float64), ("events", np.int8)]
+        for name, dtype in fields:
+            array = np.zeros(capacity, dtype=dtype)
+            if old:
+                array[:old] = getattr(self, name)
+            setattr(self, name, array)
+        self.wake_every[old:] = 1
+        self.free.extend(range(capacity - 1, old - 1, -1))
+        self.owners.extend([None] * (capacity - old))
+        self.capacity = capacity
+
+    # ======================================================
+    #   Altas y bajas
+    # ======================================================
+    def adopt(self, state, owner=None, wake_every=1):
+        """
+        Copia un GameState a una posición libre y devuelve su vista. `owner`
+        es lo que devuelve due() para esa posición cuando le toca actuar.
+        """
+        if not self.free:
+            self._allocate(self.capacity * 2)
+        slot = self.free.pop()
+        rules = state.rules
+        for name in RULE_FIELDS:
+            getattr(self, name)[slot] = getattr(rules, name)
+        for name in STATE_FIELDS:
+            getattr(self, name)[slot] = getattr(state, name)
+        self.winner[slot] = state.winner or 0
+        self.in_left[slot] = 0.0
+        self.in_right[slot] = 0.0
+        self.events[slot] = EVENT_NONE
+        self.wake_every[slot] = max(1, wake_every)
+        self.owners[slot] = owner
+        self.active[slot] = True
+        return BatchState(self, slot, rules)
+
+    def release(self, view):
+        """Libera la posición de la vista y devuelve un GameState equivalente."""
+        state = GameState(view.rules)
+        for name in STATE_FIELDS:
+            setattr(state, name, getattr(view, name))
+        state.winner = view.winner
+        self.active[view._slot] = False
+        self.owners[view._slot] = None
+        self.free.append(view._slot)
+        return state
+
+    # ======================================================
+    #   Paso vectorizado
+    # ======================================================
+    def set_inputs(self, view, inputs):
+        self.in_left[view._slot], self.in_right[view._slot] = inputs
+
+    def event_of(self, view):
+        return int(self.events[view._slot])
+
+    def due(self):
+        """
+        Dueños de las posiciones con algo que hacer tras el último step():
+        evento, partida terminada o tick múltiplo de su wake_every.
+        """
+        mask = self.active & (
+            (self.events != EVENT_NONE) | (self.winner != 0) | (self.tick % self.wake_every == 0)
+        )
+        owners = self.owners
+        return [owners[slot] for slot in np.nonzero(mask)[0].tolist()]
+
+    def _serve(self, mask, toward):
+        self.ball_x[mask] = 50.0
+        self.ball_y[mask] = 50.0
+        self.ball_vx[mask] = self.serve_vx[mask] * toward[mask]
+        self.ball_vy[mask] = self.serve_vy[mask]
+        self.serve_timer[mask] = 0.0
+        self.rally[mask] += 1
+
+    def step(self):
+        """Equivalente vectorizado de engine.step() para todas las salas activas."""
+        dt = self.dt
+        half = self.paddle_half
+        radius = self.ball_radius
+        face = self.paddle_face
+        active = self.active
+        self.events[:] = EVENT_NONE
+
+        # Palas
+        np.clip(self.paddle_left + self.in_left * dt, half, 100 - half,
+                out=self.paddle_left, where=active)
+        np.clip(self.paddle_right + self.in_right * dt, half, 100 - half,
+                out=self.paddle_right, where=active)
+
+        live = active & (self.winner == 0)
+        self.tick[live] += 1
+
+        # Pelota de camino al saque tras un gol
+        serving = live & (self.serve_timer > 0)
+        flying = serving & (-radius < self.ball_x) & (self.ball_x < 100 + radius)
+        self.ball_x[flying] += (self.ball_vx * dt)[flying]
+        self.ball_y[flying] += (self.ball_vy * dt)[flying]
+        self.serve_timer[serving] -= dt[serving]
+        self._serve(serving & (self.serve_timer <= 0), self.serve_to)
+
+        play = live & ~serving
+        x = self.ball_x + self.ball_vx * dt
+        y = self.ball_y + self.ball_vy * dt
+
+        # Rebote vertical
+        top = play & (y <= 0)
+        bottom = play & ~top & (y >= 100)
+        y[top] = 0.0
+        y[bottom] = 100.0
+        self.ball_vy[top] = np.abs(self.ball_vy[top])
+        self.ball_vy[bottom] = -np.abs(self.ball_vy[bottom])
+
+        # Colisión con las palas
+        hit_left = (play & (self.ball_vx < 0) & (x - radius <= face)
+                    & (np.abs(y - self.paddle_left) <= half))
+        hit_right = (play & ~hit_left & (self.ball_vx > 0) & (x + radius >= 100 - face)
+                     & (np.abs(y - self.paddle_right) <= half))
+        hit = hit_left | hit_right
+        x[hit_left] = (face + radius)[hit_left]
+        x[hit_right] = (100 - face - radius)[hit_right]
+        self.ball_vx[hit_left] = np.abs(self.ball_vx[hit_left])
+        self.ball_vx[hit_right] = -np.abs(self.ball_vx[hit_right])
+        for velocity in (self.ball_vx, self.ball_vy):
+            boosted = (np.abs(velocity) + self.speedup_add) * self.speedup_mul
+            velocity[hit] = np.copysign(boosted, velocity)[hit]
+        self.rally[hit] += 1
+        self.events[hit] = EVENT_HIT
+
+        self.ball_x[play] = x[play]
+        self.ball_y[play] = y[play]
+
+        # Anotación
+        loose = play & ~hit
+        goal_right = loose & (x - radius <= self.goal_line)
+        goal_left = loose & ~goal_right & (x + radius >= 100 - self.goal_line)
+        self.score_left[goal_left] += 1
+        self.score_right[goal_right] += 1
+        self.events[goal_left] = EVENT_SCORE_LEFT
+        self.events[goal_right] = EVENT_SCORE_RIGHT
+
+        won_left = goal_left & (self.score_left >= self.winning_score)
+        won_right = goal_right & (self.score_right >= self.winning_score)
+        self.winner[won_left] = LEFT
+        self.winner[won_right] = RIGHT
+
+        serve_left = goal_left & ~won_left
+        serve_right = goal_right & ~won_right
+        scored = serve_left | serve_right
+        self.serve_to[serve_left] = LEFT
+        self.serve_to[serve_right] = RIGHT
+        delayed = scored & (self.serve_delay > 0)
+        self.serve_timer[delayed] = self.serve_delay[delayed]
+        self._serve(scored & ~delayed, self.serve_to)
+        return self.events
@@ -0,0 +1,58 @@
+"""
+Cola de entradas secuenciadas de una pala.
+
+Los clientes numeran cada entrada ("seq", creciente por socket). Las
+entradas no se aplican al llegar: se acumulan aquí y el planificador las
+consume una vez por tick (take()), de modo que una ráfaga de autorepetición
+de teclado cuesta lo mismo que una sola pulsación. El último seq aplicado
+se devuelve en los frames para que el cliente pueda reconciliar su
+predicción.
+"""
+
+# Desplazamiento máximo (%) que puede acumular una pala en un solo tick
+MAX_NUDGE = 10.0
+
+
+class InputQueue:
+    """Entradas pendientes de una pala, coalescidas por tick."""
+
+    __slots__ = ("speed", "nudge", "last_seq", "acked")
+
+    def __init__(self):
+        # Velocidad sostenida en %/s (gana la última recibida)
+        self.speed = 0.0
+        # Desplazamiento puntual en % (se suman y se recortan a MAX_NUDGE)
+        self.nudge = 0.0
+        # Último seq recibido y último seq ya aplicado por el motor
+        self.last_seq = 0
+        self.acked = 0
+
+    def push(self, seq=None, speed=None, nudge=0.0):
+        """
+        Encola una entrada. Devuelve False si es un duplicado o llega fuera de
+        orden (seq no mayor que el último recibido). Los clientes sin seq se
+        aceptan siempre.
+        """
+        if seq is not None:
+            seq = int(seq)
+            if seq <= self.last_seq:
+                return False
+            self.last_seq = seq
+        if speed is not None:
+            self.speed = speed
+        self.nudge += nudge
+        return True
+
+    def take(self, dt):
+        """
+        Consume lo acumulado para este tick y devuelve la velocidad (%/s) que
+        hay que pasarle a engine.step().
+        """
+        nudge = max(-MAX_NUDGE, min(MAX_NUDGE, self.nudge))
+        self.nudge = 0.0
+        self.acked = self.last_seq
+        return self.speed + nudge / dt
+
+    def reset(self):
+        """Olvida la secuencia (p. ej. al reconectar el socket del jugador)."""
+        self.__init__()
@@ -0,0 +1,318 @@
+"""
+Banco de carga de Pong sin navegador.
+
+Abre N salas contra los consumidores reales (online, IA y local) con el
+WebsocketCommunicator de Channels, subiendo por escalones, y por cada
+escalón informa de:
+  - mensajes/s recibidos por los clientes,
+  - jitter de llegada de los frames (p50/p95/p99, en ms, respecto al
+    periodo de snapshot del planificador),
+  - presupuesto del tick usado por el planificador (media / máximo),
+  - CPU por sala (ms de CPU por segundo; incluye a los clientes de prueba,
+    que corren en el mismo proceso),
+  - memoria por sala (tracemalloc, solo con --memory: multiplica el coste
+    de CPU, así que no conviene mezclarlo con las medidas de jitter).
+
+Ejemplos:
+    python manage.py pong_bench --rooms 200 --step 50
+    python manage.py pong_bench --mode online --layer redis --binary
+    python manage.py pong_bench --rooms 100 --fail-p99 20
+    python manage.py pong_bench --rooms 50 --memory
+
+Las partidas de prueba no guardan resultados (results.persist = False): ni
+replays, ni historial, ni estadísticas, rating o clasificación de los
+usuarios del banco. Al terminar solo quedan por borrar sus filas PongRoom.
+"""
+import asyncio
+import itertools
+import time
+import tracemalloc
+import uuid
+
+from channels.db import database_sync_to_async
+from channels.routing import URLRouter
+from channels.testing import WebsocketCommunicator
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand, CommandError
+from django.test import override_settings
+
+from pong.models import PongRoom
+from pong.protocol import BINARY_SUBPROTOCOL
+from pong.results import results
+from pong.routing import websocket_urlpatterns as pong_ws
+from pong.routing_ai import websocket_urlpatterns as pong_ai_ws
+from pong.scheduler import scheduler
+
+User = get_user_model()
+
+MODES = ("online", "ai", "local")
+BENCH_USERS = ("pong_bench_1", "pong_bench_2")
+
+
+def percentile(values, q):
+    """Percentil q (0-100) de una lista ya ordenada."""
+    if not values:
+        return 0.0
+    index = min(len(values) - 1, int(round(q / 100 * (len(values) - 1))))
+    return values[index]
+
+
+class WithUser:
+    """Mete el usuario en el scope (hace de JWTAuthMiddleware)."""
+
+    def __init__(self, app, user):
+        self.app = app
+        self.user = user
+
+    async def __call__(self, scope, receive, send):
+        return await self.app(dict(scope, user=self.user), receive, send)
+
+
+class Stats:
+    """Contadores compartidos por todos los clientes de un escalón."""
+
+    def __init__(self, period):
+        self.period = period
+        self.reset()
+
+    def reset(self):
+        self.messages = 0
+        self.jitter = []
+
+    def frame(self, interval):
+        self.jitter.append(abs(interval - self.period) * 1000)
+
+
+class BenchClient:
+    """Un socket de prueba: lee todo lo que envía el servidor."""
+
+    def __init__(self, app, path, user, binary, stats):
+        self.communicator = WebsocketCommunicator(
+            WithUser(app, user), path,
+            subprotocols=[BINARY_SUBPROTOCOL] if binary else None,
+        )
+        self.stats = stats
+        self.last_frame = None
+        self.finished = False
+        self.reader = None
+        self.seq = itertools.count(1)
+
+    async def connect(self):
+        connected, _ = await self.communicator.connect(timeout=10)
+        if not connected:
+            raise CommandError(f"No se pudo conectar a {self.communicator.scope['path']}")
+        self.reader = asyncio.create_task(self.read())
+
+    async def read(self):
+        while True:
+            message = await self.communicator.receive_output(timeout=3600)
+            if message["type"] != "websocket.send":
+                continue
+            self.stats.messages += 1
+            text = message.get("text")
+            if text is not None and '"game_over"' in text:
+                self.finished = True
+                continue
+            if text is None or 'game_update"' in text:
+                now = time.perf_counter()
+                if self.last_frame is not None:
+                    self.stats.frame(now - self.last_frame)
+                self.last_frame = now
+
+    async def send(self, message):
+        message["seq"] = next(self.seq)
+        await self.communicator.send_json_to(message)
+
+    async def close(self):
+        if self.reader:
+            self.reader.cancel()
+        await self.communicator.disconnect()
+
+
+class BenchRoom:
+    """Una partida de prueba; se reabre al terminar para mantener la carga."""
+
+    def __init__(self, mode, app, users, binary, stats):
+        self.mode = mode
+        self.app = app
+        self.users = users
+        self.binary = binary
+        self.stats = stats
+        self.clients = []
+        self.room_ids = []
+
+    async def open(self):
+        if self.mode == "online":
+            room_id = str(uuid.uuid4())
+            self.room_ids.append(room_id)
+            paths = [(f"/ws/pong/{room_id}/", user) for user in self.users]
+        elif self.mode == "ai":
+            paths = [(f"/ws/pong_ai/bench{uuid.uuid4().hex[:8]}/", self.users[0])]
+        else:
+            paths = [("/ws/local_pong/", self.users[0])]
+
+        self.clients = [BenchClient(self.app, path, user, self.binary, self.stats)
+                        for path, user in paths]
+        for client in self.clients:
+            await client.connect()
+        await self.clients[0].send({"type": "start_game"})
+
+    async def close(self):
+        for client in self.clients:
+            await client.close()
+        self.clients = []
+
+    async def send_input(self, direction):
+        client = self.clients[0]
+        if self.mode == "online":
+            await client.send({"type": "move_paddle", "direction": 5 * direction})
+        else:
+            await client.send({"type": "paddle_input", "paddle": "left", "speed": 3 * direction})
+
+    async def drive(self, inputs_hz):
+        """Envía entradas periódicas y reabre la partida cuando termina."""
+        direction = 1
+        while True:
+            await asyncio.sleep(1 / inputs_hz)
+            if any(client.finished for client in self.clients):
+                await self.close()
+                await self.open()
+                continue
+            direction = -direction
+            await self.send_input(direction)
+
+
+class Command(BaseCommand):
+    help = "Banco de carga: N salas de Pong contra los consumidores reales"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--rooms", type=int, default=50, help="Salas al final de la rampa")
+        parser.add_argument("--step", type=int, default=10, help="Salas añadidas por escalón")
+        parser.add_argument("--duration", type=float, default=5.0, help="Segundos medidos por escalón")
+        parser.add_argument("--mode", choices=MODES + ("all",), default="all")
+        parser.add_argument("--layer", choices=("memory", "redis"), default="memory",
+                            help="Channel layer: en memoria o el Redis de CHANNEL_LAYERS")
+        parser.add_argument("--redis-url", default=None,
+                            help="Redis a usar con --layer redis (por defecto el de settings)")
+        parser.add_argument("--binary", action="store_true", help="Negocia el protocolo binario")
+        parser.add_argument("--inputs-hz", type=float, default=10.0,
+                            help="Entradas de pala por segundo y sala")
+        parser.add_argument("--memory", action="store_true",
+                            help="Mide la memoria por sala con tracemalloc (más lento)")
+        parser.add_argument("--fail-p99", type=float, default=None,
+                            help="Falla si el jitter p99 del último escalón supera estos ms")
+
+    def handle(self, *args, **options):
+        if options["layer"] == "memory":
+            layers = {"default": {"BACKEND": "channels.layers.InMemoryChannelLayer"}}
+        else:
+            layers = settings.CHANNEL_LAYERS
+            if options["redis_url"]:
+                layers = {"default": {
+                    "BACKEND": "channels_redis.core.RedisChannelLayer",
+                    "CONFIG": {"hosts": [options["redis_url"]]},
+                }}
+
+        with override_settings(CHANNEL_LAYERS=layers):
+            rows = asyncio.run(self.bench(options))
+
+        if options["fail_p99"] is not None and rows and rows[-1]["p99"] > options["fail_p99"]:
+            raise CommandError(
+                f"Jitter p99 {rows[-1]['p99']:.1f} ms > {options['fail_p99']} ms "
+                f"con {rows[-1]['rooms']} salas"
+            )
+
+    async def bench(self, options):
+        # El proceso es solo del banco: no hace falta volver a activarla
+        results.persist = False
+        users = await self.get_bench_users()
+        app = URLRouter(pong_ws + pong_ai_ws)
+        stats = Stats(scheduler.snapshot_every / scheduler.tick_rate)
+        modes = itertools.cycle(MODES if options["mode"] == "all" else (options["mode"],))
+
+        self.stdout.write(
+            f"🏓 pong_bench: {options['mode']} / {options['layer']} / "
+            f"{'binario' if options['binary'] else 'JSON'}; "
+            f"{scheduler.tick_rate} ticks/s, snapshot cada {scheduler.snapshot_every} ticks"
+        )
+        self.stdout.write(
+            f"{'salas':>6} {'msgs/s':>9} {'p50':>7} {'p95':>7} {'p99':>7} "
+            f"{'tick med':>9} {'tick máx':>9} {'CPU/sala':>10} {'mem/sala':>10}"
+        )
+
+        if options["memory"]:
+            tracemalloc.start()
+        baseline = tracemalloc.get_traced_memory()[0] if tracemalloc.is_tracing() else 0
+
+        bench_rooms = []
+        drivers = []
+        rows = []
+        try:
+            target = 0
+            while target < options["rooms"]:
+                target = min(options["rooms"], target + options["step"])
+                while len(bench_rooms) < target:
+                    room = BenchRoom(next(modes), app, users, options["binary"], stats)
+                    await room.open()
+                    bench_rooms.append(room)
+                    drivers.append(asyncio.create_task(room.drive(options["inputs_hz"])))
+
+                # Calentamiento y medida
+                await asyncio.sleep(1.0)
+                rows.append(await self.measure(stats, len(bench_rooms), options["duration"], baseline))
+        finally:
+            for driver in drivers:
+                driver.cancel()
+            await asyncio.gather(*drivers, return_exceptions=True)
+            for room in bench_rooms:
+                await room.close()
+            if tracemalloc.is_tracing():
+                tracemalloc.stop()
+            await results.flush()
+            await self.cleanup(bench_rooms)
+        return rows
+
+    async def measure(self, stats, rooms, duration, baseline):
+        stats.reset()
+        budgets = []
+        cpu_start = time.process_time()
+        wall_start = time.perf_counter()
+        while time.perf_counter() - wall_start < duration:
+            await asyncio.sleep(0.1)
+            budgets.append(scheduler.budget_used)
+        wall = time.perf_counter() - wall_start
+        cpu = time.process_time() - cpu_start
+
+        jitter = sorted(stats.jitter)
+        memory = None
+        if tracemalloc.is_tracing():
+            memory = (tracemalloc.get_traced_memory()[0] - baseline) / rooms / 1024
+        row = {
+            "rooms": rooms,
+            "msgs": stats.messages / wall,
+            "p50": percentile(jitter, 50),
+            "p95": percentile(jitter, 95),
+            "p99": percentile(jitter, 99),
+            "budget_avg": sum(budgets) / len(budgets) if budgets else 0.0,
+            "budget_max": max(budgets, default=0.0),
+            "cpu": cpu / wall / rooms * 1000,
+            "memory": memory,
+        }
+        self.stdout.write(
+            f"{row['rooms']:>6} {row['msgs']:>9.0f} {row['p50']:>6.1f}ms {row['p95']:>6.1f}ms "
+            f"{row['p99']:>6.1f}ms {row['budget_avg']:>9.0%} {row['budget_max']:>9.0%} "
+            f"{row['cpu']:>7.2f}ms/s "
+            + (f"{memory:>7.1f}KiB" if memory is not None else f"{'-':>10}")
+        )
+        return row
+
+    @database_sync_to_async
+    def get_bench_users(self):
+        return [User.objects.get_or_create(username=username)[0] for username in BENCH_USERS]
+
+    @database_sync_to_async
+    def cleanup(self, bench_rooms):
+        """Filas PongRoom que aún no hubiera borrado el sumidero de resultados."""
+        room_ids = [room_id for room in bench_rooms for room_id in room.room_ids]
+        PongRoom.objects.filter(id__in=room_ids).delete()
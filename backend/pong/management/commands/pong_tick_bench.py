@@ -0,0 +1,87 @@
+"""
+Banco del tick del planificador sin sockets.
+
+Mide TickScheduler.advance() completo (entradas, física, after_step() y
+construcción de los envíos) con N salas online reales (GameRoom) sin
+miembros, para cada motor (PONG_ENGINE python / numpy). Los dos jugadores de
+cada sala envían entradas a --inputs-hz, como lo harían sus sockets. Los
+envíos se esperan fuera de la medida.
+
+Ejemplos:
+    python manage.py pong_tick_bench --rooms 2000 --ticks 200
+    python manage.py pong_tick_bench --rooms 5000 --engine numpy
+"""
+import asyncio
+import time
+import uuid
+
+from django.core.management.base import BaseCommand, CommandError
+from django.test import override_settings
+
+from pong.replay import ReplayRecorder
+from pong.rooms import GameRoom
+from pong.scheduler import scheduler
+
+ENGINES = ("python", "numpy")
+IN_MEMORY_LAYERS = {"default": {"BACKEND": "channels.layers.InMemoryChannelLayer"}}
+
+
+class Command(BaseCommand):
+    help = "Banco del tick completo del planificador (advance()) con cada motor de física"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--rooms", type=int, default=2000, help="Salas simuladas")
+        parser.add_argument("--ticks", type=int, default=200, help="Ticks medidos por motor")
+        parser.add_argument("--engine", choices=ENGINES + ("both",), default="both")
+        parser.add_argument("--inputs-hz", type=float, default=10.0,
+                            help="Entradas por segundo de cada jugador")
+
+    def handle(self, *args, **options):
+        engines = ENGINES if options["engine"] == "both" else (options["engine"],)
+        if scheduler.rooms:
+            raise CommandError("El planificador ya tiene salas: el banco necesita uno vacío")
+        with override_settings(CHANNEL_LAYERS=IN_MEMORY_LAYERS):
+            results = {engine: asyncio.run(self.bench(engine, options)) for engine in engines}
+
+        if len(results) == 2:
+            self.stdout.write(f"numpy / python: x{results['python'] / results['numpy']:.2f}")
+
+    async def bench(self, engine, options):
+        batch = scheduler.batch
+        task = scheduler.task
+        scheduler.batch = scheduler._make_batch() if engine == "numpy" else None
+        if engine == "numpy" and scheduler.batch is None:
+            raise CommandError("NumPy no está instalado")
+        # El bucle del planificador no corre: el banco llama a advance() a mano
+        scheduler.task = asyncio.get_running_loop().create_future()
+        rooms = [GameRoom(str(uuid.uuid4())) for _ in range(options["rooms"])]
+        try:
+            for room in rooms:
+                room.recorder = ReplayRecorder()
+                scheduler.add(room)
+            # Cada jugador envía una entrada cada `every` ticks, repartidos entre salas
+            every = max(1, round(scheduler.tick_rate / options["inputs_hz"]))
+            elapsed = 0.0
+            for tick in range(options["ticks"]):
+                for index in range(tick % every, len(rooms), every):
+                    room = rooms[index]
+                    direction = 1 if (tick // every) % 2 else -1
+                    room.push_input("paddle_1", None, direction)
+                    room.push_input("paddle_2", None, -direction)
+                started = time.perf_counter()
+                sends = scheduler.advance(list(scheduler.rooms))
+                elapsed += time.perf_counter() - started
+                await asyncio.gather(*sends, return_exceptions=True)
+        finally:
+            for room in rooms:
+                scheduler.remove(room)
+            scheduler.task.cancel()
+            scheduler.batch = batch
+            scheduler.task = task
+
+        per_tick = elapsed / options["ticks"] * 1000
+        self.stdout.write(
+            f"{engine:>6}: {options['rooms']} salas, {per_tick:.2f} ms/tick "
+            f"({per_tick / scheduler.period / 10:.0f}% del periodo de {scheduler.period * 1000:.1f} ms)"
+        )
+        return per_tick
@@ -0,0 +1,28 @@
+"""
+Elimina las salas PongRoom abandonadas (ver pong/reaper.py).
+
+Las salas que simulan los workers se reconocen por sus marcas en Redis: sin
+Redis el comando falla en lugar de borrar partidas en curso.
+
+Ejemplos:
+    python manage.py reap_pong_rooms
+    python manage.py reap_pong_rooms --older-than 600 --batch-size 1000
+"""
+from asgiref.sync import async_to_sync
+from django.core.management.base import BaseCommand
+
+from pong.reaper import BATCH_SIZE, STALE_AFTER, reaper
+
+
+class Command(BaseCommand):
+    help = "Elimina por lotes las salas de Pong abandonadas"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--older-than", type=int, default=STALE_AFTER,
+                            help="Antigüedad mínima en segundos (por defecto PONG_ROOM_STALE_AFTER)")
+        parser.add_argument("--batch-size", type=int, default=BATCH_SIZE,
+                            help="Filas revisadas por consulta")
+
+    def handle(self, *args, **options):
+        removed = async_to_sync(reaper.reap)(options["older_than"], options["batch_size"])
+        self.stdout.write(self.style.SUCCESS(f"{removed} salas abandonadas eliminadas"))
@@ -0,0 +1,144 @@
+"""
+Métricas del bucle de juego de este proceso (worker).
+
+Histogramas de latencias (en ms) por worker y por sala:
+  - tick:      duración del tick (física + after_step + flush de envíos);
+               en cada sala, solo su física y su after_step
+  - lateness:  retraso con el que arranca el tick respecto a su hora
+  - send:      lo que tarda en entregarse el frame de una sala (fan-out local)
+  - group_send: latencia de los group_send al channel layer (Redis)
+y el contador de frames perdidos (ticks saltados al resincronizar el reloj
+y envíos fallidos).
+
+Se consultan en /api/pong/metrics/ (solo admin) y el planificador escribe
+un resumen periódico en el log (ver TickScheduler.run()).
+"""
+import bisect
+import logging
+import time
+
+# Límites superiores de los buckets (ms); el último recoge todo lo demás
+BUCKETS = (0.1, 0.25, 0.5, 1, 2, 4, 8, 16, 32, 64, 128, 256, 512, 1024, float("inf"))
+
+
+class Histogram:
+    """Histograma de buckets fijos, acumulado desde el arranque del proceso."""
+
+    __slots__ = ("counts", "count", "total", "max")
+
+    def __init__(self):
+        self.counts = [0] * len(BUCKETS)
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+
+    def observe(self, ms):
+        self.counts[bisect.bisect_left(BUCKETS, ms)] += 1
+        self.count += 1
+        self.total += ms
+        if ms > self.max:
+            self.max = ms
+
+    def percentile(self, q):
+        """Estimación del percentil q (0-100): límite superior de su bucket."""
+        if not self.count:
+            return 0.0
+        rank = q / 100 * self.count
+        seen = 0
+        for bound, n in zip(BUCKETS, self.counts):
+            seen += n
+            if seen >= rank:
+                return min(bound, self.max)
+        return self.max
+
+    def to_dict(self):
+        return {
+            "count": self.count,
+            "mean": self.total / self.count if self.count else 0.0,
+            "max": self.max,
+            "p50": self.percentile(50),
+            "p95": self.percentile(95),
+            "p99": self.percentile(99),
+            "buckets": {str(bound): n for bound, n in zip(BUCKETS, self.counts) if n},
+        }
+
+
+class LoopMetrics:
+    """Conjunto de histogramas de un worker o de una sala."""
+
+    NAMES = ("tick", "lateness", "send", "group_send")
+
+    def __init__(self):
+        for name in self.NAMES:
+            setattr(self, name, Histogram())
+        self.dropped_frames = 0
+
+    def to_dict(self):
+        data = {name: getattr(self, name).to_dict() for name in self.NAMES}
+        data["dropped_frames"] = self.dropped_frames
+        return data
+
+
+class WorkerMetrics(LoopMetrics):
+    """
+    Métricas del worker, más las de cada sala que el planificador esté
+    avanzando. También guarda una ventana que se vacía en cada resumen del log.
+    """
+
+    def __init__(self):
+        super().__init__()
+        self.rooms = {}
+        self.window = LoopMetrics()
+
+    def room(self, room):
+        metrics = self.rooms.get(room)
+        if metrics is None:
+            metrics = self.rooms[room] = LoopMetrics()
+        return metrics
+
+    def forget(self, room):
+        self.rooms.pop(room, None)
+
+    def observe(self, name, ms, room=None):
+        getattr(self, name).observe(ms)
+        getattr(self.window, name).observe(ms)
+        # Solo salas activas en el planificador (no se resucitan las ya terminadas)
+        if room in self.rooms:
+            getattr(self.rooms[room], name).observe(ms)
+
+    def drop(self, frames, rooms=()):
+        self.dropped_frames += frames
+        self.window.dropped_frames += frames
+        for room in rooms:
+            self.room(room).dropped_frames += frames
+
+    def to_dict(self):
+        data = super().to_dict()
+        # Copia: el endpoint lo lee desde otro hilo mientras el bucle lo modifica
+        rooms = list(self.rooms.items())
+        data["rooms"] = {str(room): metrics.to_dict() for room, metrics in rooms}
+        return data
+
+    def log_summary(self, rooms):
+        """Resume la ventana desde el último resumen y la reinicia."""
+        window = self.window
+        logging.info(
+            f"⏱️ {rooms} salas | tick p50/p99 {window.tick.percentile(50):.1f}/"
+            f"{window.tick.percentile(99):.1f} ms | retraso p99 {window.lateness.percentile(99):.1f} ms"
+            f" | envío p99 {window.send.percentile(99):.1f} ms"
+            f" | group_send p99 {window.group_send.percentile(99):.1f} ms"
+            f" | frames perdidos {window.dropped_frames}"
+        )
+        self.window = LoopMetrics()
+
+
+metrics = WorkerMetrics()
+
+
+async def timed_group_send(channel_layer, group, message, room=None):
+    """group_send midiendo su latencia (histograma "group_send")."""
+    started = time.perf_counter()
+    try:
+        await channel_layer.group_send(group, message)
+    finally:
+        metrics.observe("group_send", (time.perf_counter() - started) * 1000, room)
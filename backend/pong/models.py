@@ -9,7 +9,8 @@ class PongRoom(models.Model):
     # Se usan nombres de related_name más específicos para evitar colisiones
     player1 = models.ForeignKey(User, related_name="pong_rooms_as_player1", on_delete=models.CASCADE, null=True, blank=True)
     player2 = models.ForeignKey(User, related_name="pong_rooms_as_player2", on_delete=models.CASCADE, null=True, blank=True)
-    created_at = models.DateTimeField(auto_now_add=True)
+    # Indexado: el limpiador de salas abandonadas (pong/reaper.py) recorre por antigüedad
+    created_at = models.DateTimeField(auto_now_add=True, db_index=True)
 
     def __str__(self):
         return f"PongRoom {self.id} - {self.player1} vs {self.player2}"
@@ -45,3 +46,56 @@ class PongRoom(models.Model):
         else:
             self.save()
 
+
+
+class Tournament(models.Model):
+    """Torneo de eliminación directa jugado en salas online (ver pong/tournaments.py)."""
+    RUNNING = "running"
+    FINISHED = "finished"
+    STATUS_CHOICES = [(RUNNING, "En curso"), (FINISHED, "Terminado")]
+
+    id = models.UUIDField(default=uuid.uuid4, primary_key=True, editable=False)
+    name = models.CharField(max_length=100)
+    created_by = models.ForeignKey(User, related_name="tournaments_created", on_delete=models.SET_NULL, null=True, blank=True)
+    players = models.ManyToManyField(User, related_name="tournaments")
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default=RUNNING)
+    winner = models.ForeignKey(User, related_name="tournaments_won", on_delete=models.SET_NULL, null=True, blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    finished_at = models.DateTimeField(null=True, blank=True)
+
+    def __str__(self):
+        return f"Torneo {self.name} ({self.status})"
+
+
+class TournamentMatch(models.Model):
+    """
+    Partida del cuadro. La ronda 1 es la primera; el ganador de (ronda, posición)
+    pasa a (ronda + 1, posición // 2). Cada partida tiene su propia sala online.
+    """
+    PENDING = "pending"
+    READY = "ready"
+    FINISHED = "finished"
+    STATUS_CHOICES = [(PENDING, "Esperando rivales"), (READY, "Lista para jugar"), (FINISHED, "Terminada")]
+
+    tournament = models.ForeignKey(Tournament, related_name="matches", on_delete=models.CASCADE)
+    round = models.PositiveSmallIntegerField()
+    position = models.PositiveSmallIntegerField()
+    player1 = models.ForeignKey(User, related_name="tournament_matches_as_player1", on_delete=models.SET_NULL, null=True, blank=True)
+    player2 = models.ForeignKey(User, related_name="tournament_matches_as_player2", on_delete=models.SET_NULL, null=True, blank=True)
+    winner = models.ForeignKey(User, related_name="tournament_matches_won", on_delete=models.SET_NULL, null=True, blank=True)
+    score1 = models.IntegerField(null=True, blank=True)
+    score2 = models.IntegerField(null=True, blank=True)
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default=PENDING)
+    # Cuándo quedó lista: pasado PONG_TOURNAMENT_NO_SHOW se resuelve por incomparecencia
+    ready_at = models.DateTimeField(null=True, blank=True)
+    # Sala online (room_id de /ws/pong/<room_id>/) donde se juega la partida
+    room_id = models.UUIDField(default=uuid.uuid4, unique=True, editable=False)
+
+    class Meta:
+        ordering = ["round", "position"]
+        constraints = [
+            models.UniqueConstraint(fields=["tournament", "round", "position"], name="unique_tournament_slot"),
+        ]
+
+    def __str__(self):
+        return f"{self.tournament.name} R{self.round}#{self.position}: {self.player1} vs {self.player2}"
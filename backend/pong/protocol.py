@@ -0,0 +1,105 @@
+"""
+Formato binario compacto para los frames de partida ("game_update").
+
+Se negocia al conectar con el subprotocolo WebSocket BINARY_SUBPROTOCOL; los
+clientes que no lo piden siguen recibiendo JSON.
+
+Cada frame es little-endian:
+    u8  kind      (FRAME_GAME_UPDATE)
+    u8  flags     (FLAG_*)
+    u32 seq       número de frame del stream
+    u32 tick      tick de simulación del servidor
+    u32 t         reloj monotónico del servidor en ms (para interpolar)
+    i16 ball_x    coordenadas en punto fijo (valor * SCALE)
+    i16 ball_y
+    [i16 paddle_left, i16 paddle_right]   si FLAG_PADDLES
+    [u8 score_left, u8 score_right]       si FLAG_SCORES
+    [u32 ack_left, u32 ack_right]         si FLAG_ACKS
+
+Palas, marcador y acks (último seq de entrada aplicado a cada pala, ver
+inputs.py) solo viajan cuando cambian respecto al frame anterior del stream,
+o en los keyframes (FLAG_KEYFRAME), que los llevan siempre.
+"""
+import struct
+
+BINARY_SUBPROTOCOL = "pong.bin.v1"
+
+FRAME_GAME_UPDATE = 1
+
+FLAG_PADDLES = 0x01
+FLAG_SCORES = 0x02
+FLAG_KEYFRAME = 0x04
+FLAG_ACKS = 0x08
+
+# Resolución del punto fijo: centésimas de %
+SCALE = 100
+# Un keyframe cada segundo (a 30 snapshots/s) por si se pierde algún mensaje
+KEYFRAME_EVERY = 30
+
+_HEADER = struct.Struct("<BBIIIhh")
+_PADDLES = struct.Struct("<hh")
+_SCORES = struct.Struct("<BB")
+_ACKS = struct.Struct("<II")
+
+
+def negotiate(scope):
+    """Devuelve el subprotocolo binario si el cliente lo ofrece, o None (JSON)."""
+    if BINARY_SUBPROTOCOL in scope.get("subprotocols", ()):
+        return BINARY_SUBPROTOCOL
+    return None
+
+
+def fixed(value):
+    """Convierte un porcentaje a punto fijo i16."""
+    return max(-32768, min(32767, int(round(value * SCALE))))
+
+
+class FrameEncoder:
+    """
+    Codifica los frames de un stream (una sala). Recuerda lo último enviado
+    para omitir palas y marcador cuando no cambian.
+    """
+
+    __slots__ = ("seq", "paddles", "scores", "acks", "keyframe")
+
+    def __init__(self):
+        self.seq = 0
+        self.paddles = None
+        self.scores = None
+        self.acks = None
+        self.keyframe = True
+
+    def force_keyframe(self):
+        """El próximo frame irá completo (p. ej. al unirse un cliente)."""
+        self.keyframe = True
+
+    def encode(self, state, t_ms, acks=(0, 0)):
+        self.seq = (self.seq + 1) & 0xFFFFFFFF
+        paddles = (fixed(state.paddle_left), fixed(state.paddle_right))
+        scores = (state.score_left, state.score_right)
+
+        flags = 0
+        if self.keyframe or self.seq % KEYFRAME_EVERY == 0:
+            flags = FLAG_KEYFRAME | FLAG_PADDLES | FLAG_SCORES | FLAG_ACKS
+            self.keyframe = False
+        if paddles != self.paddles:
+            flags |= FLAG_PADDLES
+        if scores != self.scores:
+            flags |= FLAG_SCORES
+        if acks != self.acks:
+            flags |= FLAG_ACKS
+
+        frame = _HEADER.pack(
+            FRAME_GAME_UPDATE, flags, self.seq, state.tick & 0xFFFFFFFF, t_ms & 0xFFFFFFFF,
+            fixed(state.ball_x), fixed(state.ball_y),
+        )
+        if flags & FLAG_PADDLES:
+            frame += _PADDLES.pack(*paddles)
+            self.paddles = paddles
+        if flags & FLAG_SCORES:
+            frame += _SCORES.pack(*scores)
+            self.scores = scores
+        if flags & FLAG_ACKS:
+            frame += _ACKS.pack(acks[0] & 0xFFFFFFFF, acks[1] & 0xFFFFFFFF)
+            self.acks = acks
+        return frame
@@ -0,0 +1,207 @@
+"""
+Limpieza de salas PongRoom abandonadas.
+
+Las filas PongRoom se borran al acabar la partida (results.py) o al quedarse
+la sala vacía (rooms.py), pero un worker que se cae a mitad de partida, o una
+sala creada desde la API en la que nunca se llega a jugar, dejan filas
+huérfanas.
+
+RoomReaper borra las filas con más de STALE_AFTER segundos que no
+correspondan a una sala viva: ni simulada en este worker ni marcada como
+viva en Redis por otro proceso. Con PONG_CLUSTER la marca es el dueño
+vigente (cluster.OWNER_KEY, que el dueño renueva en cada latido); sin él,
+cada worker renueva ALIVE_KEY de sus salas en cada vuelta del bucle. Se
+miran las dos claves en ambos modos, y si Redis no responde no se borra
+nada: `reap_pong_rooms` corre en otro proceso y no ve las salas de los
+workers. Recorre la tabla por el índice de created_at en
+lotes de BATCH_SIZE (paginación por (created_at, id), sin OFFSET), así que
+cada consulta está acotada aunque la tabla haya crecido.
+
+Corre cada REAP_INTERVAL segundos en cada worker con salas online y también
+a mano con `python manage.py reap_pong_rooms`.
+
+El mismo bucle resuelve cada WALKOVER_INTERVAL las partidas de torneo que
+llevan más de tournaments.NO_SHOW_AFTER listas sin jugarse (walkover()): si
+en la sala hay un solo jugador sentado, gana él; si no se ha presentado
+ninguno, pasa el cabeza de serie (player1). Una partida en curso, o con los
+dos jugadores en la sala, no se toca. El resultado se aplica al cuadro con
+tournaments.record_results(), como el de una partida jugada, pero sin
+historial ni rating.
+"""
+import asyncio
+import logging
+from datetime import timedelta
+
+from channels.db import database_sync_to_async
+from channels.layers import get_channel_layer
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Q
+from django.utils import timezone
+
+from backend.redis_pool import get_redis
+from . import tournaments
+from .cluster import OWNER_KEY, cluster
+from .models import PongRoom, TournamentMatch
+from .results import MatchResult
+from .rooms import rooms
+
+# Antigüedad (s) a partir de la cual una sala sin partida viva se da por abandonada
+STALE_AFTER = getattr(settings, "PONG_ROOM_STALE_AFTER", 3600)
+# Segundos entre pasadas del limpiador y filas revisadas por consulta
+REAP_INTERVAL = 300
+BATCH_SIZE = 500
+# Segundos entre revisiones de partidas de torneo sin jugar
+WALKOVER_INTERVAL = 30
+
+# Sin PONG_CLUSTER: sala simulada por algún worker (la renueva en cada vuelta)
+ALIVE_KEY = "pong:room:{room_id}:alive"
+ALIVE_TTL = 3 * WALKOVER_INTERVAL
+
+
+class RoomReaper:
+    """Tarea periódica de limpieza de salas de este worker."""
+
+    def __init__(self):
+        self.task = None
+
+    def ensure_running(self):
+        """Arranca el bucle la primera vez que se usa una sala online."""
+        if self.task is None or self.task.done():
+            self.task = asyncio.create_task(self.run())
+
+    async def run(self):
+        passes = 0
+        while True:
+            try:
+                await self.beat()
+            except Exception as e:
+                logging.warning(f"⚠️ No se pudieron marcar las salas vivas: {e}")
+            await asyncio.sleep(WALKOVER_INTERVAL)
+            passes += 1
+            try:
+                awarded = await self.walkover()
+                if awarded:
+                    logging.info(f"🏳️ {awarded} partidas de torneo resueltas por incomparecencia")
+            except Exception as e:
+                logging.warning(f"⚠️ Error resolviendo incomparecencias de torneo: {e}")
+            if passes % (REAP_INTERVAL // WALKOVER_INTERVAL):
+                continue
+            try:
+                removed = await self.reap()
+                if removed:
+                    logging.info(f"🧹 {removed} salas abandonadas eliminadas")
+            except Exception as e:
+                logging.warning(f"⚠️ Error limpiando salas abandonadas: {e}")
+
+    async def reap(self, stale_after=STALE_AFTER, batch_size=BATCH_SIZE):
+        """Borra las salas abandonadas y devuelve cuántas se han eliminado."""
+        cutoff = timezone.now() - timedelta(seconds=stale_after)
+        removed = 0
+        after = None
+        while True:
+            batch = await stale_rooms(cutoff, after, batch_size)
+            if not batch:
+                break
+            after = batch[-1]
+            room_ids = [room_id for room_id, _ in batch]
+            live = await self.live(room_ids)
+            removed += await delete_rooms([room_id for room_id in room_ids if str(room_id) not in live])
+            if len(batch) < batch_size:
+                break
+        return removed
+
+    async def walkover(self, no_show=tournaments.NO_SHOW_AFTER):
+        """Resuelve las partidas de torneo vencidas sin jugar; devuelve cuántas."""
+        overdue = await overdue_matches(timezone.now() - timedelta(seconds=no_show), BATCH_SIZE)
+        if not overdue:
+            return 0
+        live = await self.live([room_id for room_id, _, _ in overdue])
+        awarded = []
+        for room_id, player1_id, player2_id in overdue:
+            room = rooms.get(room_id)
+            if room is not None:
+                if room.in_progress or room.closed:
+                    continue
+                present = [
+                    seat.user_id for seat in room.seats.values()
+                    if seat is not None and seat.consumers
+                ]
+                # Con los dos en la sala, la partida la arrancan ellos
+                if len(present) != 1:
+                    continue
+                winner_id = present[0]
+            elif str(room_id) in live:
+                # La simula otro worker: la resuelve su propio limpiador
+                continue
+            else:
+                winner_id = player1_id
+            awarded.append(MatchResult(room_id, False, player1_id, player2_id, None, None, winner_id))
+        if not awarded:
+            return 0
+
+        events = await record_walkovers(awarded)
+        for result in awarded:
+            room = rooms.get(result.room_id)
+            if room is not None:
+                await room.end_by_walkover(result.winner_id)
+        if events:
+            await tournaments.announce(get_channel_layer(), events)
+        return len(awarded)
+
+    async def beat(self):
+        """Sin PONG_CLUSTER, marca en Redis las salas que simula este worker."""
+        room_ids = rooms.ids()
+        if cluster.enabled or not room_ids:
+            return
+        async with get_redis().pipeline(transaction=False) as pipe:
+            for room_id in room_ids:
+                pipe.set(ALIVE_KEY.format(room_id=room_id), 1, ex=ALIVE_TTL)
+            await pipe.execute()
+
+    async def live(self, room_ids):
+        """De esas salas, las que tienen partida viva en este worker o en otro."""
+        live = set(rooms.ids())
+        async with get_redis().pipeline(transaction=False) as pipe:
+            for room_id in room_ids:
+                pipe.exists(OWNER_KEY.format(room_id=room_id), ALIVE_KEY.format(room_id=room_id))
+            marked = await pipe.execute()
+        live.update(str(room_id) for room_id, count in zip(room_ids, marked) if count)
+        return live
+
+
+reaper = RoomReaper()
+
+
+@database_sync_to_async
+def stale_rooms(cutoff, after, batch_size):
+    """Siguiente lote de (id, created_at) anteriores a cutoff, por antigüedad."""
+    queryset = PongRoom.objects.filter(created_at__lt=cutoff)
+    if after is not None:
+        room_id, created_at = after
+        queryset = queryset.filter(Q(created_at__gt=created_at) | Q(created_at=created_at, id__gt=room_id))
+    return list(queryset.order_by("created_at", "id").values_list("id", "created_at")[:batch_size])
+
+
+@database_sync_to_async
+def overdue_matches(cutoff, batch_size):
+    """(room_id, player1_id, player2_id) de partidas de torneo listas desde antes de cutoff."""
+    return list(
+        TournamentMatch.objects.filter(status=TournamentMatch.READY)
+        .filter(Q(ready_at__lt=cutoff) | Q(ready_at__isnull=True))
+        .values_list("room_id", "player1_id", "player2_id")[:batch_size]
+    )
+
+
+@database_sync_to_async
+def record_walkovers(results):
+    with transaction.atomic():
+        return tournaments.record_results(results)
+
+
+@database_sync_to_async
+def delete_rooms(room_ids):
+    if not room_ids:
+        return 0
+    deleted, _ = PongRoom.objects.filter(id__in=room_ids).delete()
+    return deleted
@@ -0,0 +1,164 @@
+"""
+Grabación compacta de partidas (replays) y lectura por trozos.
+
+Durante la partida cada snapshot se codifica con el mismo formato binario que
+los frames en directo (protocol.py: punto fijo, keyframe cada KEYFRAME_EVERY
+frames y deltas entre medias) y se guarda en un anillo de tamaño fijo en
+memoria. Al acabar, el sumidero de resultados (results.py) vuelca el anillo
+una sola vez a un fichero de replay, que no se vuelve a modificar.
+
+Formato del fichero (little-endian):
+    cabecera   _HEADER: magic, versión, tick_rate, snapshot_every, frames, keyframes
+    índice     _INDEX por keyframe: tick, desplazamiento del frame en el cuerpo
+    cuerpo     por frame: u16 longitud + frame de protocol.py
+
+El índice permite saltar a cualquier punto leyendo solo la cabecera, el
+índice y el trozo pedido, sin cargar el replay entero.
+"""
+import bisect
+import struct
+
+from .protocol import FLAG_KEYFRAME, FrameEncoder
+
+MAGIC = b"PONGRPL1"
+VERSION = 1
+
+_HEADER = struct.Struct("<8sBHHII")
+_INDEX = struct.Struct("<II")
+_LENGTH = struct.Struct("<H")
+# Posición del tick dentro de un frame (ver protocol._HEADER)
+_TICK = struct.Struct("<I")
+_TICK_OFFSET = 6
+
+# Snapshots que caben en el anillo: 10 minutos a 30 snapshots/s. El anillo es
+# un único bytearray que crece con la partida (1 byte de longitud + 18-32 bytes
+# por frame, ~27 con las palas moviéndose sin parar): ~500 KiB si se llena
+MAX_FRAMES = 10 * 60 * 30
+# Frames máximos de un trozo servido por la API (~10 s a 30 snapshots/s)
+MAX_CHUNK_FRAMES = 300
+
+
+class ReplayRecorder:
+    """
+    Anillo de frames de una partida. Si la partida supera MAX_FRAMES se
+    pierden los más antiguos y el replay empieza en el primer keyframe que
+    quede.
+
+    Los frames van seguidos en un bytearray, cada uno precedido de su longitud
+    (u8, ver protocol.py: nunca pasan de 32 bytes), sin un objeto por frame.
+    """
+
+    __slots__ = ("encoder", "capacity", "buffer", "start", "count")
+
+    def __init__(self, capacity=MAX_FRAMES):
+        self.encoder = FrameEncoder()
+        self.capacity = capacity
+        self.buffer = bytearray()
+        # Desplazamiento del frame más antiguo que se conserva
+        self.start = 0
+        self.count = 0
+
+    def __len__(self):
+        return self.count
+
+    def record(self, state, t_ms, acks=(0, 0)):
+        frame = self.encoder.encode(state, t_ms, acks)
+        buffer = self.buffer
+        buffer.append(len(frame))
+        buffer += frame
+        if self.count < self.capacity:
+            self.count += 1
+            return
+        # Anillo lleno: se descarta el más antiguo y, cuando lo descartado
+        # ocupa más de la mitad, se compacta (coste amortizado O(1) por frame)
+        self.start += 1 + buffer[self.start]
+        if 2 * self.start > len(buffer):
+            del buffer[:self.start]
+            self.start = 0
+
+    def frames(self):
+        """Frames conservados, del más antiguo al más reciente."""
+        buffer = self.buffer
+        offset = self.start
+        while offset < len(buffer):
+            length = buffer[offset]
+            yield bytes(buffer[offset + 1:offset + 1 + length])
+            offset += 1 + length
+
+    def dump(self, tick_rate, snapshot_every):
+        """Contenido completo del fichero de replay."""
+        frames = list(self.frames())
+        start = next((i for i, frame in enumerate(frames) if frame[1] & FLAG_KEYFRAME), len(frames))
+        index = []
+        body = bytearray()
+        for frame in frames[start:]:
+            if frame[1] & FLAG_KEYFRAME:
+                index.append(_INDEX.pack(_TICK.unpack_from(frame, _TICK_OFFSET)[0], len(body)))
+            body += _LENGTH.pack(len(frame))
+            body += frame
+        header = _HEADER.pack(
+            MAGIC, VERSION, tick_rate, snapshot_every, len(frames) - start, len(index)
+        )
+        return header + b"".join(index) + bytes(body)
+
+
+class ReplayReader:
+    """Lee la cabecera y el índice de un replay y sirve trozos bajo demanda."""
+
+    def __init__(self, fileobj):
+        self.file = fileobj
+        magic, version, self.tick_rate, self.snapshot_every, self.frames, keyframes = (
+            _HEADER.unpack(fileobj.read(_HEADER.size))
+        )
+        if magic != MAGIC or version != VERSION:
+            raise ValueError("No es un replay de Pong válido")
+        index = fileobj.read(_INDEX.size * keyframes)
+        self.keyframes = [_INDEX.unpack_from(index, i * _INDEX.size) for i in range(keyframes)]
+        self.keyframe_ticks = [tick for tick, _ in self.keyframes]
+        self.body = _HEADER.size + len(index)
+
+    def last_tick(self):
+        """Tick del último frame: se leen solo los frames tras el último keyframe."""
+        if not self.keyframes:
+            return 0
+        tick, offset = self.keyframes[-1]
+        self.file.seek(self.body + offset)
+        while True:
+            prefix = self.file.read(_LENGTH.size)
+            if len(prefix) < _LENGTH.size:
+                return tick
+            frame = self.file.read(_LENGTH.unpack(prefix)[0])
+            tick = _TICK.unpack_from(frame, _TICK_OFFSET)[0]
+
+    def info(self):
+        last_tick = self.last_tick()
+        return {
+            "tick_rate": self.tick_rate,
+            "snapshot_every": self.snapshot_every,
+            "frames": self.frames,
+            "duration": last_tick / self.tick_rate if self.tick_rate else 0,
+            "keyframes": self.keyframe_ticks,
+        }
+
+    def chunk(self, tick=0, max_frames=MAX_CHUNK_FRAMES):
+        """
+        Frames (u16 longitud + frame, como en el fichero) desde el último
+        keyframe anterior o igual a `tick`. Devuelve (tick_inicial, bytes, frames).
+        """
+        if not self.keyframes:
+            return 0, b"", 0
+        position = max(0, bisect.bisect_right(self.keyframe_ticks, tick) - 1)
+        start_tick, offset = self.keyframes[position]
+        self.file.seek(self.body + offset)
+
+        data = bytearray()
+        count = 0
+        while count < max_frames:
+            prefix = self.file.read(_LENGTH.size)
+            if len(prefix) < _LENGTH.size:
+                break
+            frame = self.file.read(_LENGTH.unpack(prefix)[0])
+            data += prefix
+            data += frame
+            count += 1
+        return start_tick, bytes(data), count
@@ -0,0 +1,213 @@
+"""
+Sumidero de resultados de partidas online.
+
+Al terminar una partida el GameRoom no toca la BD: encola un MatchResult y
+sigue. Una tarea del proceso agrupa los resultados que lleguen en
+FLUSH_INTERVAL (hasta BATCH_SIZE) y los escribe en una sola transacción:
+
+  - un bulk_create de MatchHistory,
+  - un único UPDATE de wins/losses con expresiones F() y del rating Elo
+    (Case/When por usuario, ver users/leaderboard.py),
+  - un único DELETE de las filas PongRoom de esas partidas,
+  - el avance de los cuadros de torneo de esas salas (tournaments.py).
+
+Antes de la transacción vuelca el replay de cada partida (replay.py) a su
+fichero, que queda referenciado desde MatchHistory.replay. Después replica
+los nuevos ratings en la clasificación de Redis.
+
+Así una avalancha de finales simultáneos cuesta un puñado de consultas en
+lugar de varias por partida.
+
+Con `results.persist = False` (partidas sintéticas, p. ej. pong_bench) los
+resultados se descartan: sin replay, historial, estadísticas, rating ni
+clasificación; solo se borran las filas PongRoom de esas salas.
+"""
+import asyncio
+import logging
+import uuid
+from collections import Counter
+
+from channels.db import database_sync_to_async
+from channels.layers import get_channel_layer
+from django.contrib.auth import get_user_model
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.db import transaction
+from django.db.models import Case, F, Value, When
+
+from users import leaderboard
+from users.models import MatchHistory
+from . import tournaments
+from .models import PongRoom
+from .scheduler import scheduler
+
+User = get_user_model()
+
+# Espera máxima (s) para juntar resultados y tamaño máximo de un lote
+FLUSH_INTERVAL = 0.25
+BATCH_SIZE = 500
+
+
+class MatchResult:
+    """Resultado de una partida terminada (ids de usuario, no objetos)."""
+
+    __slots__ = ("room_id", "persisted", "player1_id", "player2_id", "score1", "score2",
+                 "winner_id", "mode", "replay")
+
+    def __init__(self, room_id, persisted, player1_id, player2_id, score1, score2, winner_id,
+                 mode=MatchHistory.ONLINE, replay=None):
+        # UUID de la sala (None si no es un UUID) y si tiene fila PongRoom a borrar
+        self.room_id = room_id
+        self.persisted = persisted
+        self.player1_id = player1_id
+        self.player2_id = player2_id
+        self.score1 = score1
+        self.score2 = score2
+        self.winner_id = winner_id
+        # Las partidas contra la IA (player2_id None) no suman estadísticas
+        self.mode = mode
+        # ReplayRecorder de la partida; se vuelca a fichero al escribir el lote
+        self.replay = replay
+
+    @property
+    def loser_id(self):
+        if self.winner_id == self.player1_id:
+            return self.player2_id
+        if self.winner_id == self.player2_id:
+            return self.player1_id
+        return None
+
+
+class ResultSink:
+    """Cola de resultados del proceso y su tarea de volcado por lotes."""
+
+    def __init__(self):
+        self.queue = None
+        self.task = None
+        # False: los resultados no dejan rastro en la BD ni en Redis
+        self.persist = True
+
+    def submit(self, result):
+        """Encola un resultado; se escribirá en el próximo lote."""
+        if self.queue is None:
+            self.queue = asyncio.Queue()
+        self.queue.put_nowait(result)
+        if self.task is None or self.task.done():
+            self.task = asyncio.create_task(self.run())
+
+    async def run(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            batch = [await self.queue.get()]
+            deadline = loop.time() + FLUSH_INTERVAL
+            while len(batch) < BATCH_SIZE:
+                timeout = deadline - loop.time()
+                if timeout <= 0:
+                    break
+                try:
+                    batch.append(await asyncio.wait_for(self.queue.get(), timeout))
+                except asyncio.TimeoutError:
+                    break
+            await self.write(batch)
+
+    async def flush(self):
+        """Escribe ya todo lo pendiente (p. ej. antes de cerrar el proceso)."""
+        batch = []
+        while self.queue is not None and not self.queue.empty():
+            batch.append(self.queue.get_nowait())
+        if batch:
+            await self.write(batch)
+
+    async def write(self, batch):
+        if not self.persist:
+            try:
+                await discard_results(batch)
+            except Exception as e:
+                logging.warning(f"⚠️ No se pudieron borrar las salas de {len(batch)} partidas: {e}")
+            return
+        try:
+            events, ratings = await write_results(batch)
+            logging.debug(f"💾 {len(batch)} resultados de partida guardados")
+        except Exception as e:
+            logging.error(f"❌ No se pudieron guardar {len(batch)} resultados de partida: {e}")
+            return
+        try:
+            await leaderboard.update(ratings)
+        except Exception as e:
+            # La BD manda: rebuild_leaderboard la vuelve a sincronizar
+            logging.warning(f"⚠️ No se pudo actualizar la clasificación: {e}")
+        # Siguientes partidas de torneo ya listas y torneos terminados
+        if events:
+            await tournaments.announce(get_channel_layer(), events)
+
+
+results = ResultSink()
+
+
+@database_sync_to_async
+def write_results(batch):
+    ranked = [result for result in batch if result.mode == MatchHistory.ONLINE and result.loser_id]
+    wins = Counter(result.winner_id for result in ranked)
+    losses = Counter(result.loser_id for result in ranked)
+    replays = [save_replay(result.replay) for result in batch]
+    with transaction.atomic():
+        MatchHistory.objects.bulk_create([
+            MatchHistory(
+                player1_id=result.player1_id,
+                player2_id=result.player2_id,
+                score1=result.score1,
+                score2=result.score2,
+                winner_id=result.winner_id,
+                mode=result.mode,
+                replay=replay,
+            )
+            for result, replay in zip(batch, replays)
+        ])
+        ratings = {}
+        if ranked:
+            ratings = leaderboard.apply(ranked)
+            User.objects.filter(id__in=set(wins) | set(losses)).update(
+                wins=F("wins") + _per_user(wins),
+                losses=F("losses") + _per_user(losses),
+                rating=Case(
+                    *(When(id=user_id, then=Value(rating)) for user_id, (_, rating) in ratings.items()),
+                    default=F("rating"),
+                ),
+            )
+        _delete_rooms(batch)
+        return tournaments.record_results(batch), ratings
+
+
+@database_sync_to_async
+def discard_results(batch):
+    """Resultados sin persistencia: solo se borran sus filas PongRoom."""
+    _delete_rooms(batch)
+
+
+def save_replay(recorder):
+    """Escribe el replay en su propio fichero (solo se crea, nunca se modifica)."""
+    if recorder is None or not len(recorder):
+        return None
+    data = recorder.dump(scheduler.tick_rate, scheduler.snapshot_every)
+    try:
+        return default_storage.save(f"replays/{uuid.uuid4()}.pongrpl", ContentFile(data))
+    except OSError as e:
+        # Sin replay, pero el resultado se guarda igual
+        logging.warning(f"⚠️ No se pudo guardar un replay: {e}")
+        return None
+
+
+def _delete_rooms(batch):
+    room_ids = [result.room_id for result in batch if result.persisted and result.room_id]
+    if room_ids:
+        PongRoom.objects.filter(id__in=room_ids).delete()
+
+
+def _per_user(counts):
+    """Incremento de cada usuario del lote (0 para los que no aparecen)."""
+    if not counts:
+        return Value(0)
+    return Case(
+        *(When(id=user_id, then=Value(count)) for user_id, count in counts.items()),
+        default=Value(0),
+    )
@@ -0,0 +1,626 @@
+import json
+import uuid
+import logging
+import asyncio
+import math
+from channels.db import database_sync_to_async
+from channels.layers import get_channel_layer
+from django.conf import settings
+from .engine import GameState, ONLINE_RULES, LEFT, RIGHT
+from .inputs import InputQueue
+from .metrics import metrics, timed_group_send
+from .models import PongRoom, TournamentMatch
+from .protocol import FrameEncoder
+from .replay import ReplayRecorder
+from .results import MatchResult, results
+from .scheduler import scheduler
+from .spectators import SpectatorFeed
+
+# Segundos que se guarda el asiento de un jugador que pierde la conexión a
+# mitad de partida (con la partida en pausa) antes de darlo por ido
+RECONNECT_GRACE = getattr(settings, "PONG_RECONNECT_GRACE", 10)
+
+
+class Seat:
+    """Asiento de un jugador: su usuario y los sockets con los que está conectado."""
+
+    __slots__ = ("user_id", "username", "consumers", "grace")
+
+    def __init__(self, user):
+        self.user_id = user.id
+        self.username = user.username
+        self.consumers = set()
+        # Temporizador del periodo de gracia mientras el jugador no tiene socket
+        self.grace = None
+
+    @property
+    def away(self):
+        return self.grace is not None
+
+
+class GameRoom:
+    """
+    Motor autoritativo de una sala online.
+
+    Hay un único GameRoom por room_id en cada proceso. El planificador de ticks
+    lo avanza independientemente de cualquier socket: los consumidores solo le
+    empujan entradas (movimientos de pala secuenciados, ver inputs.py) y
+    reciben sus frames.
+
+    La física corre a PONG_TICK_RATE, pero solo se emite un snapshot cada
+    scheduler.snapshot_every ticks (PONG_SNAPSHOT_RATE/s). Los frames se
+    entregan directamente a los receptores de este proceso, sin pasar por
+    Redis: consumidores locales y, con PONG_CLUSTER, un RemoteHub por cada
+    worker con jugadores de la sala (ver cluster.py). El grupo de la sala en
+    el channel layer queda para los eventos poco frecuentes (room_update,
+    game_over). Los espectadores reciben un stream aparte a menor frecuencia
+    (ver spectators.py).
+
+    Los asientos (quién es player1/player2) también viven aquí, no en la BD:
+    PongRoom solo se escribe al empezar la partida y se borra al acabar. La
+    única lectura es la primera vez que alguien entra, para saber si la sala
+    es de una partida de torneo: entonces solo se sientan sus dos jugadores,
+    cada uno en su pala (ver load_players()).
+
+    Si un jugador pierde su último socket a mitad de partida, su asiento se
+    guarda RECONNECT_GRACE segundos y la partida se pausa (sale del
+    planificador con su estado intacto en memoria). Si vuelve a tiempo, la
+    partida sigue desde ese mismo estado sin tocar la BD; si no, pierde por
+    abandono (ver forfeit()) y la sala queda cerrada: nadie más puede
+    sentarse en su asiento ni seguir la partida.
+
+    Los consumidores usan join()/leave()/move()/request_start(), el mismo
+    interfaz que cluster.RemoteRoom cuando la sala la simula otro worker.
+    """
+
+    def __init__(self, room_id):
+        self.room_id = room_id
+        self.room_group_name = f"pong_{room_id}"
+        self.channel_layer = get_channel_layer()
+
+        # Receptores de frames de la sala en este proceso y, de ellos, los que
+        # necesitan JSON y los que negociaron el protocolo binario (protocol.py).
+        # Un RemoteHub puede estar en ambos conjuntos.
+        self.members = set()
+        self.text_members = set()
+        self.binary_members = set()
+        self.encoder = FrameEncoder()
+        # Stream reducido para los espectadores de la sala
+        self.feed = SpectatorFeed(self.room_id)
+
+        # Asientos de los jugadores (ver claim_seat())
+        self.seats = {"paddle_1": None, "paddle_2": None}
+        # True mientras haya una fila PongRoom de la partida en curso
+        self.persisted = False
+        # Partida en pausa esperando a que vuelva un jugador (ver hold_seat())
+        self.paused = False
+        # Partida acabada por abandono: no admite jugadores nuevos ni otra partida
+        self.closed = False
+        # Ids (player1, player2) de la partida de torneo de la sala, o None si
+        # puede sentarse cualquiera; se leen de la BD una vez (load_players())
+        self.allowed = None
+        self.players_loaded = False
+
+        # Entradas pendientes de cada pala; se aplican una vez por tick
+        self.queues = {"paddle_1": InputQueue(), "paddle_2": InputQueue()}
+
+        # Estado de la partida (ver engine.py) y su grabación (ver replay.py)
+        self.state = GameState(scheduler.rules(ONLINE_RULES))
+        self.recorder = None
+
+        self.finish_task = None
+
+    def __str__(self):
+        return f"GameRoom {self.room_id}"
+
+    @property
+    def running(self):
+        return self in scheduler
+
+    @property
+    def wake_every(self):
+        """Ticks entre llamadas a after_step(): frames de jugadores y de espectadores."""
+        return math.gcd(scheduler.snapshot_every, self.feed.every)
+
+    @property
+    def in_progress(self):
+        return self.running or self.paused
+
+    @property
+    def holding(self):
+        """True si algún asiento está guardado para un jugador desconectado."""
+        return any(seat is not None and seat.away for seat in self.seats.values())
+
+    # ======================================================
+    #   Miembros y entradas
+    # ======================================================
+    async def join(self, member, receiver=None):
+        """
+        Sienta al miembro (consumidor local o cluster.RemotePlayer) si queda
+        asiento, suscribe su receptor de frames (él mismo por defecto) y avisa
+        a la sala. Devuelve su pala o None (espectador).
+        """
+        # Receptor suscrito antes del primer await: con un miembro la sala ya no
+        # puede liberarse (rooms.release) mientras se leen los jugadores
+        self.attach(receiver or member, bool(member.subprotocol))
+        await self.load_players()
+        paddle_key = self.claim_seat(member)
+        # Un socket nuevo numera sus entradas desde cero
+        if paddle_key:
+            self.reset_inputs(paddle_key)
+        await self.send_room_update()
+        return paddle_key
+
+    async def leave(self, member, detach=True):
+        """
+        Libera el asiento del miembro y, si la sala se queda sin receptores, la
+        suelta del registro. Con detach=False el receptor lo gestiona quien
+        llama (un RemoteHub con más jugadores).
+        """
+        self.leave_seat(member)
+        if detach:
+            self.detach(member)
+        # El motor sigue corriendo mientras quede alguien en la sala (o un
+        # asiento guardado a la espera de que vuelva su jugador)
+        if not self.members and not self.holding:
+            rooms.release(self.room_id)
+        await self.send_room_update()
+
+    async def move(self, member, seq, direction):
+        """
+        Encola un movimiento de la pala del miembro. Devuelve None si no está
+        sentado y False si la entrada es un duplicado o llega fuera de orden.
+        """
+        paddle_key = self.seat_of(member)
+        if paddle_key is None:
+            return None
+        return self.push_input(paddle_key, seq, direction)
+
+    async def request_start(self, member):
+        """Cualquiera de los dos jugadores puede arrancarla: start() es idempotente."""
+        if self.seat_of(member):
+            self.start()
+
+    def attach(self, receiver, binary=False):
+        self.members.add(receiver)
+        if binary:
+            if receiver not in self.binary_members:
+                # El recién llegado necesita palas y marcador completos
+                self.encoder.force_keyframe()
+            self.binary_members.add(receiver)
+        else:
+            self.text_members.add(receiver)
+
+    def detach(self, receiver):
+        """Quita un receptor de la sala y devuelve cuántos quedan."""
+        self.members.discard(receiver)
+        self.text_members.discard(receiver)
+        self.binary_members.discard(receiver)
+        return len(self.members)
+
+    def claim_seat(self, consumer):
+        """
+        Sienta al usuario del consumidor y devuelve su pala, o None si la sala
+        está llena. Si ya tenía asiento (otro socket suyo) lo comparte. No hay
+        ningún await: en el event loop la reclamación es atómica.
+        """
+        user = consumer.user
+        for key, seat in self.seats.items():
+            if seat is not None and seat.user_id == user.id:
+                seat.consumers.add(consumer)
+                # Reconexión dentro del periodo de gracia: la partida sigue
+                if seat.away:
+                    seat.grace.cancel()
+                    seat.grace = None
+                    logging.debug(f"🔌 {seat.username} vuelve a la sala {self.room_id}")
+                    self.resume()
+                return key
+        if self.closed:
+            return None
+        if self.allowed is not None:
+            # Sala de torneo: cada jugador del cuadro en su pala, nadie más
+            if user.id not in self.allowed:
+                return None
+            key = "paddle_1" if user.id == self.allowed[0] else "paddle_2"
+            if self.seats[key] is not None:
+                return None
+            seat = self.seats[key] = Seat(user)
+            seat.consumers.add(consumer)
+            return key
+        for key, seat in self.seats.items():
+            if seat is None:
+                seat = self.seats[key] = Seat(user)
+                seat.consumers.add(consumer)
+                return key
+        return None
+
+    def leave_seat(self, consumer):
+        """
+        Libera el asiento cuando se va el último socket de ese jugador, salvo
+        a mitad de partida: entonces se le guarda (ver hold_seat()).
+        """
+        for key, seat in self.seats.items():
+            if seat is not None and consumer in seat.consumers:
+                seat.consumers.discard(consumer)
+                if not seat.consumers:
+                    if self.in_progress:
+                        self.hold_seat(key)
+                    else:
+                        self.seats[key] = None
+                return key
+        return None
+
+    async def load_players(self):
+        """
+        Jugadores permitidos si la sala es de una partida de torneo. Mientras
+        la partida espera rivales se vuelve a consultar en cada entrada; una
+        partida ya terminada (p. ej. por incomparecencia) deja la sala cerrada.
+        """
+        if self.players_loaded:
+            return
+        room_uuid = _room_uuid(self.room_id)
+        match = await tournament_players(room_uuid) if room_uuid is not None else None
+        if match is None:
+            self.players_loaded = True
+            return
+        player1_id, player2_id, status = match
+        self.allowed = (player1_id, player2_id)
+        if status == TournamentMatch.FINISHED:
+            self.closed = True
+        self.players_loaded = status != TournamentMatch.PENDING
+
+    def hold_seat(self, key):
+        """Guarda el asiento RECONNECT_GRACE segundos y pausa la partida."""
+        seat = self.seats[key]
+        seat.grace = asyncio.get_running_loop().call_later(
+            RECONNECT_GRACE, self.expire_seat, key, seat
+        )
+        self.pause()
+        logging.debug(f"⏸️ {seat.username} sin conexión: sala {self.room_id} en pausa")
+
+    def expire_seat(self, key, seat):
+        """
+        Fin del periodo de gracia sin reconexión. Con rival sentado, pierde
+        la partida por abandono; la partida nunca se reanuda con un asiento
+        vacío que pudiera ocupar otro usuario.
+        """
+        if self.seats[key] is not seat or not seat.away:
+            return
+        seat.grace = None
+        logging.debug(f"⌛ {seat.username} no ha vuelto a la sala {self.room_id}")
+        if self.seats[_other(key)] is not None:
+            self.forfeit(key)
+            return
+        # Sin rival no hay resultado que guardar: la partida se descarta
+        self.seats[key] = None
+        self.paused = False
+        self.closed = True
+        if self.members:
+            asyncio.create_task(self.persist_end())
+        else:
+            rooms.release(self.room_id)
+        asyncio.create_task(self.send_room_update())
+
+    def forfeit(self, key):
+        """
+        El jugador de `key` pierde por abandono: gana el otro con el marcador
+        actual, el resultado va al sumidero como el de cualquier partida y la
+        sala se cierra y se libera en cuanto no le queden sockets.
+        """
+        self.stop()
+        self.paused = False
+        self.closed = True
+        # Si el rival también está fuera, su plazo ya no importa
+        for seat in self.seats.values():
+            if seat is not None and seat.away:
+                seat.grace.cancel()
+                seat.grace = None
+        state = self.state
+        state.winner = RIGHT if key == "paddle_1" else LEFT
+        self.recorder.record(state, scheduler.now_ms, self.acks)
+        self.finish_task = asyncio.create_task(self.declare_winner(state.winner))
+        rooms.release(self.room_id)
+        logging.debug(f"🏳️ Abandono en la sala {self.room_id}: gana {self.seats[_other(key)].username}")
+
+    def seat_of(self, member):
+        """Pala del asiento que ocupa el miembro, o None."""
+        for key, seat in self.seats.items():
+            if seat is not None and member in seat.consumers:
+                return key
+        return None
+
+    def players(self):
+        return {"player1": self.player1_name, "player2": self.player2_name}
+
+    def room_update(self):
+        """Evento con los jugadores sentados y los que se esperan de vuelta."""
+        away = [seat.username for seat in self.seats.values() if seat is not None and seat.away]
+        return {"type": "room_update", "players": self.players(), "away": away}
+
+    @property
+    def player1_name(self):
+        seat = self.seats["paddle_1"]
+        return seat.username if seat else None
+
+    @property
+    def player2_name(self):
+        seat = self.seats["paddle_2"]
+        return seat.username if seat else None
+
+    def slot_of(self, username):
+        """Devuelve la pala ("paddle_1"/"paddle_2") del usuario o None."""
+        for key, seat in self.seats.items():
+            if username and seat is not None and seat.username == username:
+                return key
+        return None
+
+    def push_input(self, paddle_key, seq, direction):
+        """Encola un movimiento de `direction` % de la pala; se aplica en el próximo tick."""
+        accepted = self.queues[paddle_key].push(seq, nudge=direction)
+        if accepted:
+            scheduler.inputs_changed(self)
+        return accepted
+
+    def reset_inputs(self, paddle_key):
+        """El jugador (re)conecta y empieza su secuencia de entradas desde cero."""
+        self.queues[paddle_key].reset()
+        scheduler.inputs_changed(self)
+
+    @property
+    def acks(self):
+        return (self.queues["paddle_1"].acked, self.queues["paddle_2"].acked)
+
+    # ======================================================
+    #   Ciclo de vida
+    # ======================================================
+    def start(self):
+        """Arranca la partida si no hay ya una en curso (idempotente)."""
+        if self.in_progress or self.closed:
+            return False
+        self.state = GameState(scheduler.rules(ONLINE_RULES))
+        self.recorder = ReplayRecorder()
+        self.encoder.force_keyframe()
+        self.feed.force_keyframe()
+        scheduler.add(self)
+        # Write-behind: la BD se entera de la partida sin bloquear el arranque
+        asyncio.create_task(self.persist_start())
+        logging.debug(f"🏁 Iniciando partida Pong en la sala {self.room_id}")
+        return True
+
+    def stop(self):
+        scheduler.remove(self)
+
+    def pause(self):
+        """Saca la partida del planificador conservando su estado."""
+        if self.running:
+            self.stop()
+            self.paused = True
+
+    def resume(self):
+        """Reanuda la partida pausada cuando ya no falta ningún jugador."""
+        if not self.paused or self.holding:
+            return
+        self.paused = False
+        # Los clientes (re)conectados necesitan palas y marcador completos
+        self.encoder.force_keyframe()
+        self.feed.force_keyframe()
+        scheduler.add(self)
+        logging.debug(f"▶️ Partida reanudada en la sala {self.room_id}")
+
+    # ======================================================
+    #   Persistencia (solo al empezar y al acabar la partida)
+    # ======================================================
+    async def persist_start(self):
+        seats = self.seats
+        # Se marca antes del await: database_sync_to_async ejecuta en orden, así
+        # que un persist_end() posterior siempre borrará después de guardar
+        self.persisted = True
+        try:
+            await save_room(
+                self.room_id,
+                seats["paddle_1"].user_id if seats["paddle_1"] else None,
+                seats["paddle_2"].user_id if seats["paddle_2"] else None,
+            )
+        except Exception as e:
+            logging.warning(f"⚠️ No se pudo guardar la sala {self.room_id}: {e}")
+
+    async def persist_end(self):
+        if not self.persisted:
+            return
+        self.persisted = False
+        try:
+            await delete_room(self.room_id)
+        except Exception as e:
+            logging.warning(f"⚠️ No se pudo borrar la sala {self.room_id}: {e}")
+
+    # ======================================================
+    #   Tick => lo llama el planificador (scheduler.py)
+    # ======================================================
+    def inputs(self):
+        dt = self.state.rules.dt
+        return (self.queues["paddle_1"].take(dt), self.queues["paddle_2"].take(dt))
+
+    def after_step(self, event):
+        state = self.state
+        # El reparto a espectadores va en su propia tarea: no entra en el flush
+        if self.feed.due(state) or state.winner is not None:
+            self.feed.publish(state, scheduler.now_ms)
+        if state.winner is None and not scheduler.snapshot_due(state):
+            return ()
+        self.recorder.record(state, scheduler.now_ms, self.acks)
+        sends = [self.send_game_update()]
+
+        if state.winner is not None:
+            self.stop()
+            # El resultado va a la BD por lotes: no se bloquea el tick
+            self.finish_task = asyncio.create_task(self.declare_winner(state.winner))
+            logging.debug(f"🏁 Partida finalizada en la sala {self.room_id}")
+        return sends
+
+    async def send_game_update(self):
+        """
+        Codifica el frame una sola vez por sala (JSON y/o binario, según lo
+        que hayan negociado los miembros) y lo entrega a cada miembro local.
+        """
+        state = self.state
+        t_ms = scheduler.now_ms
+        text = frame = None
+        if self.text_members:
+            text = json.dumps({
+                "type": "game_update",
+                "tick": state.tick,
+                "t": t_ms,
+                "ball_x": state.ball_x,
+                "ball_y": state.ball_y,
+                "score1": state.score_left,
+                "score2": state.score_right,
+                "paddle1": state.paddle_left,
+                "paddle2": state.paddle_right,
+                "ack1": self.queues["paddle_1"].acked,
+                "ack2": self.queues["paddle_2"].acked,
+            })
+        if self.binary_members:
+            frame = self.encoder.encode(state, t_ms, self.acks)
+        results = await asyncio.gather(
+            *(member.send_frame(text, frame) for member in list(self.members)),
+            return_exceptions=True,
+        )
+        failed = sum(isinstance(result, Exception) for result in results)
+        if failed:
+            metrics.drop(failed, (self,) if self in metrics.rooms else ())
+
+    async def send_room_update(self):
+        """Publica los jugadores sentados a todos los sockets de la sala."""
+        event = self.room_update()
+        self.feed.broadcast(event)
+        await timed_group_send(self.channel_layer, self.room_group_name, event)
+
+    async def end_by_walkover(self, winner_id):
+        """Partida de torneo dada por ganada sin jugar (el rival no se presentó)."""
+        self.closed = True
+        winner = next(
+            (seat.username for seat in self.seats.values() if seat is not None and seat.user_id == winner_id),
+            None,
+        )
+        game_over = {"type": "game_over", "score1": 0, "score2": 0, "winner": winner}
+        self.feed.broadcast(game_over)
+        await timed_group_send(
+            self.channel_layer,
+            self.room_group_name,
+            {"type": "game_update", "data": game_over}
+        )
+
+    async def declare_winner(self, winner):
+        """
+        Envía 'game_over' con score1, score2 y 'winner' a todos en la sala y
+        encola el resultado en el sumidero (results.py), que guarda la partida,
+        suma la victoria/derrota, borra la fila PongRoom y, si es una partida
+        de torneo, hace avanzar al ganador en el próximo lote.
+        """
+        state = self.state
+        seat_1, seat_2 = self.seats["paddle_1"], self.seats["paddle_2"]
+        winner_seat = seat_1 if winner == LEFT else seat_2
+        winner_name = winner_seat.username if winner_seat else None
+
+        # Solo cuenta si los dos jugadores seguían sentados
+        if seat_1 and seat_2:
+            results.submit(MatchResult(
+                _room_uuid(self.room_id), self.persisted, seat_1.user_id, seat_2.user_id,
+                state.score_left, state.score_right, winner_seat.user_id,
+                replay=self.recorder,
+            ))
+            self.persisted = False
+        else:
+            await self.persist_end()
+
+        # Enviamos el mensaje de game over a todos
+        game_over = {
+            "type": "game_over",
+            "score1": state.score_left,
+            "score2": state.score_right,
+            "winner": winner_name
+        }
+        self.feed.broadcast(game_over)
+        await timed_group_send(
+            self.channel_layer,
+            self.room_group_name,
+            {"type": "game_update", "data": game_over}
+        )
+
+
+class RoomRegistry:
+    """
+    Registro de salas activas del proceso (worker). Es el dueño de los
+    GameRoom: sobreviven a la desconexión de cualquier socket y solo se
+    liberan cuando la sala se queda sin miembros.
+    """
+
+    def __init__(self):
+        self._rooms = {}
+
+    def __len__(self):
+        return len(self._rooms)
+
+    def get(self, room_id):
+        return self._rooms.get(str(room_id))
+
+    def ids(self):
+        return list(self._rooms)
+
+    def get_or_create(self, room_id):
+        room_id = str(room_id)
+        room = self._rooms.get(room_id)
+        if room is None:
+            room = GameRoom(room_id)
+            self._rooms[room_id] = room
+        return room
+
+    def release(self, room_id):
+        """Detiene y olvida la sala si ya no le quedan miembros ni asientos guardados."""
+        room = self._rooms.get(str(room_id))
+        if room is not None and not room.members and not room.holding:
+            room.stop()
+            del self._rooms[str(room_id)]
+            # Partida abandonada a medias: también se borra su fila
+            if room.persisted:
+                asyncio.create_task(room.persist_end())
+
+
+rooms = RoomRegistry()
+
+
+def _other(key):
+    return "paddle_2" if key == "paddle_1" else "paddle_1"
+
+
+def _room_uuid(room_id):
+    """PongRoom usa UUID como clave: las salas con otro id no se persisten."""
+    try:
+        return uuid.UUID(str(room_id))
+    except ValueError:
+        return None
+
+
+@database_sync_to_async
+def save_room(room_id, player1_id, player2_id):
+    room_uuid = _room_uuid(room_id)
+    if room_uuid is None:
+        return
+    PongRoom.objects.update_or_create(
+        id=room_uuid, defaults={"player1_id": player1_id, "player2_id": player2_id}
+    )
+
+
+@database_sync_to_async
+def tournament_players(room_uuid):
+    """(player1_id, player2_id, estado) de la partida de torneo de la sala, o None."""
+    return TournamentMatch.objects.filter(room_id=room_uuid).values_list(
+        "player1_id", "player2_id", "status"
+    ).first()
+
+
+@database_sync_to_async
+def delete_room(room_id):
+    room_uuid = _room_uuid(room_id)
+    if room_uuid is not None:
+        PongRoom.objects.filter(id=room_uuid).delete()
@@ -0,0 +1,237 @@
+import logging
+import asyncio
+import time
+from django.conf import settings
+from .engine import BASE_FPS, step
+from .metrics import metrics
+
+
+class TickScheduler:
+    """
+    Planificador único de ticks para todas las partidas del proceso (worker).
+
+    En lugar de una tarea con asyncio.sleep() por partida, una sola tarea
+    avanza todas las salas registradas sobre un reloj compartido corregido de
+    deriva y después envía de golpe todos los frames producidos en el tick.
+
+    Las salas registradas exponen su estado en `state` (engine.GameState) e
+    implementan:
+      - inputs(): velocidades de las palas para este tick.
+      - after_step(event): reacciona al evento de engine.step() y devuelve las
+        corrutinas de envío que se esperarán al final del tick.
+    y opcionalmente:
+      - wake_every: cada cuántos ticks necesita after_step() aunque no haya
+        evento (por defecto snapshot_every).
+      - dynamic_inputs = True si inputs() cambia en cada tick sin entradas
+        nuevas (la IA); si no, la sala avisa con inputs_changed().
+
+    Con PONG_ENGINE = "numpy" la física de todas las salas se avanza en un único
+    paso vectorizado (ver engine_numpy.py) y el resto del tick tampoco recorre
+    todas las salas: inputs() solo se llama a las que han recibido entradas
+    (y a las dinámicas), y after_step() solo a las que tienen un evento, han
+    terminado o envían frame en este tick (BatchEngine.due()).
+
+    La simulación corre a tick_rate ticks/s, pero las salas solo envían un
+    snapshot cada snapshot_every ticks (ver snapshot_due()); cada snapshot
+    lleva el tick y la marca de tiempo del servidor para que el cliente
+    interpole entre ellos.
+
+    Cada tick alimenta las métricas del worker y de cada sala (metrics.py):
+    duración, retraso respecto a su hora, latencia de envío y frames perdidos.
+    """
+
+    def __init__(self, tick_rate=BASE_FPS, snapshot_rate=BASE_FPS, engine="python"):
+        self.tick_rate = tick_rate
+        self.period = 1.0 / tick_rate
+        self.snapshot_every = max(1, round(tick_rate / snapshot_rate))
+        # Cada cuántos ticks se escribe el resumen de métricas en el log (~10 s)
+        self.log_every = tick_rate * 10
+        self.rooms = set()
+        self.task = None
+        self.batch = self._make_batch() if engine == "numpy" else None
+        # Con self.batch: salas cuyas entradas hay que volver a leer (las que
+        # avisaron en este tick y, un tick más, las del anterior, para que un
+        # desplazamiento puntual no se quede aplicado) y salas dinámicas
+        self.dirty = set()
+        self.settling = set()
+        self.dynamic = set()
+        self._rules = {}
+        # Reloj monotónico del servidor (ms) al empezar el tick en curso
+        self.now_ms = 0
+
+        # Estadísticas del último tick
+        self.ticks = 0
+        self.rooms_ticked = 0
+        self.budget_used = 0.0
+
+    def __contains__(self, room):
+        return room in self.rooms
+
+    def __len__(self):
+        return len(self.rooms)
+
+    @staticmethod
+    def _make_batch():
+        try:
+            from .engine_numpy import BatchEngine
+        except ImportError:
+            logging.warning("⚠️ PONG_ENGINE=numpy pero NumPy no está instalado: se usa engine.step()")
+            return None
+        return BatchEngine()
+
+    def rules(self, base):
+        """Reglas de una modalidad (engine.*_RULES) a la frecuencia del planificador."""
+        rules = self._rules.get(id(base))
+        if rules is None:
+            rules = self._rules[id(base)] = base.at_rate(self.tick_rate)
+        return rules
+
+    def snapshot_due(self, state):
+        """True si en este tick toca enviar snapshot de la partida."""
+        return state.tick % self.snapshot_every == 0
+
+    def inputs_changed(self, room):
+        """La sala ha recibido entradas: inputs() se leerá en el próximo tick."""
+        if self.batch is not None:
+            self.dirty.add(room)
+
+    def add(self, room):
+        """Registra una sala y arranca el bucle si estaba parado."""
+        if room in self.rooms:
+            return
+        if self.batch is not None:
+            wake_every = getattr(room, "wake_every", self.snapshot_every)
+            room.state = self.batch.adopt(room.state, room, wake_every)
+            if getattr(room, "dynamic_inputs", False):
+                self.dynamic.add(room)
+            self.dirty.add(room)
+        self.rooms.add(room)
+        metrics.room(room)
+        if self.task is None or self.task.done():
+            self.task = asyncio.create_task(self.run())
+
+    def remove(self, room):
+        if room not in self.rooms:
+            return
+        self.rooms.discard(room)
+        metrics.forget(room)
+        if self.batch is not None:
+            room.state = self.batch.release(room.state)
+            self.dirty.discard(room)
+            self.settling.discard(room)
+            self.dynamic.discard(room)
+
+    def advance(self, rooms):
+        """
+        Avanza la física de las salas y devuelve sus envíos (ya envueltos
+        para medir su latencia, ver _timed_send()).
+        """
+        if self.batch is not None:
+            return self._advance_batch()
+        sends = []
+        perf = time.perf_counter
+        for room in rooms:
+            started = perf()
+            try:
+                event = step(room.state, room.inputs())
+                sends.extend(self._timed_send(room, send) for send in room.after_step(event) or ())
+            except Exception as e:
+                logging.error(f"❌ Error en el tick de {room}: {e}")
+                self.remove(room)
+                continue
+            room_metrics = metrics.rooms.get(room)
+            if room_metrics is not None:
+                room_metrics.tick.observe((perf() - started) * 1000)
+        return sends
+
+    def _advance_batch(self):
+        """advance() con BatchEngine: solo se visitan las salas que lo necesitan."""
+        batch = self.batch
+        polled = self.dirty | self.settling | self.dynamic
+        self.settling = self.dirty
+        self.dirty = set()
+        for room in polled:
+            try:
+                batch.set_inputs(room.state, room.inputs())
+            except Exception as e:
+                logging.error(f"❌ Error leyendo las entradas de {room}: {e}")
+                self.remove(room)
+        batch.step()
+
+        sends = []
+        perf = time.perf_counter
+        for room in batch.due():
+            started = perf()
+            try:
+                event = batch.event_of(room.state)
+                sends.extend(self._timed_send(room, send) for send in room.after_step(event) or ())
+            except Exception as e:
+                logging.error(f"❌ Error en el tick de {room}: {e}")
+                self.remove(room)
+                continue
+            room_metrics = metrics.rooms.get(room)
+            if room_metrics is not None:
+                room_metrics.tick.observe((perf() - started) * 1000)
+        return sends
+
+    async def _timed_send(self, room, send):
+        """Espera un envío de la sala midiendo su latencia desde el inicio del flush."""
+        started = time.perf_counter()
+        try:
+            await send
+        except Exception:
+            metrics.drop(1, (room,) if room in metrics.rooms else ())
+            raise
+        finally:
+            metrics.observe("send", (time.perf_counter() - started) * 1000, room)
+
+    async def run(self):
+        loop = asyncio.get_running_loop()
+        next_tick = loop.time()
+        logging.debug("⏱️ Planificador de ticks iniciado")
+        try:
+            while self.rooms:
+                started = loop.time()
+                self.now_ms = int(started * 1000) & 0xFFFFFFFF
+                metrics.observe("lateness", max(0.0, started - next_tick) * 1000)
+
+                rooms = list(self.rooms)
+                ticked = len(rooms)
+                sends = self.advance(rooms)
+
+                # Un único flush con los frames de todas las salas
+                if sends:
+                    results = await asyncio.gather(*sends, return_exceptions=True)
+                    for result in results:
+                        if isinstance(result, Exception):
+                            logging.warning(f"⚠️ Error enviando frame: {result}")
+
+                now = loop.time()
+                self.ticks += 1
+                self.rooms_ticked = ticked
+                self.budget_used = (now - started) / self.period
+                metrics.observe("tick", (now - started) * 1000)
+                if self.ticks % self.log_every == 0:
+                    metrics.log_summary(len(self.rooms))
+
+                # Reloj corregido de deriva: se apunta al siguiente múltiplo del
+                # periodo; si vamos tarde se resincroniza en vez de acumular retraso
+                next_tick += self.period
+                delay = next_tick - now
+                if delay < 0:
+                    # Los ticks que no caben se pierden (la partida no los recupera)
+                    skipped = int(-delay / self.period)
+                    if skipped:
+                        metrics.drop(skipped, [room for room in self.rooms if room in metrics.rooms])
+                    next_tick = now
+                    delay = 0
+                await asyncio.sleep(delay)
+        finally:
+            logging.debug("⏱️ Planificador de ticks detenido")
+
+
+scheduler = TickScheduler(
+    tick_rate=getattr(settings, "PONG_TICK_RATE", BASE_FPS),
+    snapshot_rate=getattr(settings, "PONG_SNAPSHOT_RATE", BASE_FPS),
+    engine=getattr(settings, "PONG_ENGINE", "python"),
+)
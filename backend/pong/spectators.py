@@ -0,0 +1,216 @@
+"""
+Espectadores de las salas online.
+
+Los espectadores no se sientan ni entran en el grupo de la sala del channel
+layer: con miles de ellos cada room_update o game_over serían miles de
+mensajes en Redis. En su lugar:
+
+  - Cada sala tiene un SpectatorFeed en el worker que la simula (su dueño,
+    ver cluster.py) con su propio stream a PONG_SPECTATOR_RATE frames/s,
+    codificado una sola vez (JSON y binario, protocol.py).
+  - Cada worker agrupa sus espectadores de una sala en un Audience. El dueño
+    entrega cada frame a su Audience local y envía un único mensaje
+    ("pong.spectate") a cada worker con espectadores de la sala, que lo
+    reparte entre los suyos.
+  - El reparto local corre en su propia tarea (Audience.relay()), por tandas
+    de FANOUT_BATCH sockets, fuera del flush del planificador y del bucle de
+    mensajes del clúster: una final con miles de espectadores no retrasa los
+    ticks de los jugadores. Si el reparto anterior aún no ha terminado, el
+    frame se descarta para esos espectadores (el siguiente keyframe los pone
+    al día).
+
+Los room_update y game_over de la sala también llegan a los espectadores por
+este camino (como texto) en lugar de por el grupo.
+"""
+import asyncio
+import json
+import logging
+
+from channels.layers import get_channel_layer
+from django.conf import settings
+
+from .protocol import FrameEncoder
+from .scheduler import scheduler
+
+# Sockets a los que se entrega antes de ceder el event loop al planificador
+FANOUT_BATCH = 256
+
+
+class Audience:
+    """Espectadores de una sala conectados a este worker."""
+
+    def __init__(self, room_id):
+        self.room_id = room_id
+        self.members = set()
+        self.text_members = set()
+        self.binary_members = set()
+        # Worker dueño si la sala se simula en otro worker (None si es local)
+        self.owner = None
+        # Reparto en curso (ver relay())
+        self.task = None
+        # Frames descartados porque el reparto anterior no había terminado
+        self.skipped = 0
+
+    def __len__(self):
+        return len(self.members)
+
+    def add(self, consumer):
+        self.members.add(consumer)
+        if consumer.subprotocol:
+            self.binary_members.add(consumer)
+        else:
+            self.text_members.add(consumer)
+
+    def discard(self, consumer):
+        self.members.discard(consumer)
+        self.text_members.discard(consumer)
+        self.binary_members.discard(consumer)
+        return len(self.members)
+
+    def relay(self, text, frame):
+        """
+        Lanza el reparto en su propia tarea, en orden. Un frame que llega con
+        el reparto anterior aún en curso se descarta; los eventos (sin frame
+        binario) esperan su turno.
+        """
+        previous = self.task
+        busy = previous is not None and not previous.done()
+        if busy and frame is not None:
+            self.skipped += 1
+            return False
+        self.task = asyncio.create_task(self._relay(previous if busy else None, text, frame))
+        return True
+
+    async def _relay(self, previous, text, frame):
+        if previous is not None:
+            await asyncio.wait((previous,))
+        await self.deliver(text, frame)
+
+    async def deliver(self, text, frame):
+        """Entrega un frame (o un evento en texto) a todos, por tandas."""
+        members = list(self.members)
+        failed = 0
+        for start in range(0, len(members), FANOUT_BATCH):
+            results = await asyncio.gather(
+                *(member.send_frame(text, frame) for member in members[start:start + FANOUT_BATCH]),
+                return_exceptions=True,
+            )
+            failed += sum(isinstance(result, Exception) for result in results)
+            # Deja pasar al planificador entre tandas
+            await asyncio.sleep(0)
+        if failed:
+            logging.debug(f"⚠️ {failed} espectadores sin frame en la sala {self.room_id}")
+
+
+class SpectatorFeed:
+    """
+    Stream reducido de una sala para sus espectadores, en el worker dueño.
+    Lo alimenta GameRoom.after_step() y no guarda espectadores propios: los
+    busca en el registro (spectators) en cada envío, así que sobrevive a que
+    la sala se cree o se libere antes o después de que lleguen.
+    """
+
+    def __init__(self, room_id, rate=None):
+        self.room_id = room_id
+        rate = rate or getattr(settings, "PONG_SPECTATOR_RATE", 10)
+        self.every = max(1, round(scheduler.tick_rate / rate))
+        self.encoder = FrameEncoder()
+        self.task = None
+
+    def force_keyframe(self):
+        self.encoder.force_keyframe()
+
+    def due(self, state):
+        return state.tick % self.every == 0
+
+    def publish(self, state, t_ms):
+        """Codifica el frame de espectadores y lanza su reparto (sin esperarlo)."""
+        audience = spectators.audiences.get(self.room_id)
+        workers = spectators.watchers.get(self.room_id)
+        if not audience and not workers:
+            return
+        # Los envíos a otros workers del frame anterior aún en curso
+        if self.task is not None and not self.task.done():
+            return
+        text = None
+        if workers or audience.text_members:
+            text = json.dumps({
+                "type": "game_update",
+                "tick": state.tick,
+                "t": t_ms,
+                "ball_x": state.ball_x,
+                "ball_y": state.ball_y,
+                "score1": state.score_left,
+                "score2": state.score_right,
+                "paddle1": state.paddle_left,
+                "paddle2": state.paddle_right,
+            })
+        # Siempre hay frame binario: es lo que distingue un frame de un evento
+        frame = self.encoder.encode(state, t_ms)
+        self.task = asyncio.create_task(spectators.fan_out(self.room_id, text, frame))
+
+    def broadcast(self, data):
+        """Evento poco frecuente (room_update, game_over): nunca se descarta."""
+        if self.room_id in spectators.audiences or self.room_id in spectators.watchers:
+            asyncio.create_task(spectators.fan_out(self.room_id, json.dumps(data), None))
+
+
+class SpectatorRegistry:
+    """Espectadores de este worker y, en el dueño, workers que miran cada sala."""
+
+    def __init__(self):
+        # room_id -> Audience local
+        self.audiences = {}
+        # room_id -> canales de otros workers con espectadores de la sala
+        self.watchers = {}
+
+    def add(self, room_id, consumer):
+        """Añade el espectador; devuelve su Audience y si es el primero del worker."""
+        audience = self.audiences.get(room_id)
+        first = audience is None
+        if first:
+            audience = self.audiences[room_id] = Audience(room_id)
+        audience.add(consumer)
+        return audience, first
+
+    def discard(self, room_id, consumer):
+        """Quita el espectador; devuelve el Audience si se ha quedado vacío."""
+        audience = self.audiences.get(room_id)
+        if audience is None or audience.discard(consumer):
+            return None
+        del self.audiences[room_id]
+        return audience
+
+    def watch(self, room_id, worker):
+        self.watchers.setdefault(room_id, set()).add(worker)
+
+    def unwatch(self, room_id, worker):
+        workers = self.watchers.get(room_id)
+        if workers is not None:
+            workers.discard(worker)
+            if not workers:
+                del self.watchers[room_id]
+
+    async def fan_out(self, room_id, text, frame):
+        """Un mensaje por worker con espectadores y reparto local en este."""
+        workers = list(self.watchers.get(room_id, ()))
+        if workers:
+            channel_layer = get_channel_layer()
+            results = await asyncio.gather(
+                *(channel_layer.send(worker, {
+                    "type": "pong.spectate",
+                    "room_id": room_id,
+                    "text": text,
+                    "frame": frame,
+                }) for worker in workers),
+                return_exceptions=True,
+            )
+            for worker, result in zip(workers, results):
+                if isinstance(result, Exception):
+                    logging.warning(f"⚠️ No se pudo enviar a los espectadores de {worker}: {result}")
+        audience = self.audiences.get(room_id)
+        if audience:
+            audience.relay(text, frame)
+
+
+spectators = SpectatorRegistry()
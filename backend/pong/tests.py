@@ -1,3 +1,707 @@
-from django.test import TestCase
+import asyncio
+import io
+import time
+import unittest
+from datetime import timedelta
+from unittest import mock
 
-# Create your tests here.
+from asgiref.sync import async_to_sync, sync_to_async
+from channels.layers import get_channel_layer
+from django.contrib.auth import get_user_model
+from django.test import SimpleTestCase, TransactionTestCase, override_settings
+from django.utils import timezone
+
+from . import engine, tournaments
+from .ai import PongAI, fold, intercept_y
+from .cluster import OWNER_KEY, WORKERS_KEY, Cluster, RemoteRoom
+from .engine import AI_RULES, LEFT, LOCAL_RULES, ONLINE_RULES, RIGHT, GameState
+from .inputs import MAX_NUDGE, InputQueue
+from users.models import MatchHistory
+from .models import PongRoom, Tournament, TournamentMatch
+from .protocol import (
+    _ACKS, _HEADER, _PADDLES, _SCORES, BINARY_SUBPROTOCOL, FLAG_ACKS, FLAG_KEYFRAME,
+    FLAG_PADDLES, FLAG_SCORES, KEYFRAME_EVERY, SCALE, FrameEncoder, negotiate,
+)
+from .reaper import ALIVE_KEY, reaper
+from .replay import ReplayReader, ReplayRecorder
+from .results import MatchResult, ResultSink
+from .rooms import GameRoom, rooms
+from .scheduler import TickScheduler
+
+try:
+    from fakeredis import aioredis as fakeredis
+except ImportError:
+    fakeredis = None
+
+try:
+    from .engine_numpy import BatchEngine
+except ImportError:
+    BatchEngine = None
+
+User = get_user_model()
+
+IN_MEMORY_LAYERS = {"default": {"BACKEND": "channels.layers.InMemoryChannelLayer"}}
+
+ALL_RULES = {"online": ONLINE_RULES, "ai": AI_RULES, "local": LOCAL_RULES}
+
+
+def make_state(rules, **fields):
+    state = GameState(rules)
+    for name, value in fields.items():
+        setattr(state, name, value)
+    return state
+
+
+def follow(paddle, y, dt, max_speed=120.0):
+    """Velocidad (%/s) de una pala que persigue la Y de la pelota."""
+    return max(-max_speed, min(max_speed, (y - paddle) / dt))
+
+
+class EngineTests(SimpleTestCase):
+    """Física de un tick (engine.step y engine._score) con las reglas de cada modo."""
+
+    def test_paddle_bounces_the_ball(self):
+        for mode, rules in ALL_RULES.items():
+            with self.subTest(mode):
+                contact = rules.paddle_face + rules.ball_radius
+                state = make_state(rules, ball_x=contact + 0.5, ball_y=50.0, ball_vx=-60.0, ball_vy=30.0)
+                rally = state.rally
+
+                self.assertEqual(engine.step(state, (0.0, 0.0)), engine.EVENT_HIT)
+                self.assertEqual(state.ball_x, contact)
+                self.assertEqual(state.rally, rally + 1)
+                self.assertEqual(state.ball_vx, (60.0 + rules.speedup_add) * rules.speedup_mul)
+                self.assertEqual(state.ball_vy, (30.0 + rules.speedup_add) * rules.speedup_mul)
+
+    def test_ball_bounces_off_the_walls(self):
+        state = make_state(ONLINE_RULES, ball_y=0.5, ball_vy=-60.0)
+        self.assertEqual(engine.step(state, (0.0, 0.0)), engine.EVENT_NONE)
+        self.assertEqual((state.ball_y, state.ball_vy), (0.0, 60.0))
+
+    def test_paddles_stay_on_the_field(self):
+        state = make_state(ONLINE_RULES)
+        engine.step(state, (-1e6, 1e6))
+        half = ONLINE_RULES.paddle_half
+        self.assertEqual((state.paddle_left, state.paddle_right), (half, 100 - half))
+
+    def test_missed_ball_scores_for_the_other_side(self):
+        for mode, rules in ALL_RULES.items():
+            with self.subTest(mode):
+                state = make_state(rules, ball_x=rules.goal_line + rules.ball_radius + 0.5,
+                                   ball_y=20.0, ball_vx=-60.0, paddle_left=80.0)
+                self.assertEqual(engine.step(state, (0.0, 0.0)), engine.EVENT_SCORE_RIGHT)
+                self.assertEqual((state.score_left, state.score_right), (0, 1))
+                self.assertEqual(state.serve_to, RIGHT)
+
+    def test_serve_waits_for_the_rules_delay(self):
+        for mode, rules in ALL_RULES.items():
+            with self.subTest(mode):
+                state = make_state(rules, ball_x=100 - rules.goal_line - rules.ball_radius - 0.5,
+                                   ball_y=20.0, ball_vx=60.0, paddle_right=80.0)
+                self.assertEqual(engine.step(state, (0.0, 0.0)), engine.EVENT_SCORE_LEFT)
+                ticks = 0
+                while state.serve_timer > 0:
+                    # La pelota sigue de largo hasta el saque
+                    self.assertNotEqual(state.ball_x, 50.0)
+                    self.assertEqual(engine.step(state, (0.0, 0.0)), engine.EVENT_NONE)
+                    ticks += 1
+                self.assertAlmostEqual(ticks * rules.dt, rules.serve_delay, delta=rules.dt)
+                self.assertEqual((state.ball_x, state.ball_y), (50.0, 50.0))
+                self.assertEqual(state.ball_vx, rules.serve_vx * LEFT)
+
+    def test_game_stops_at_winning_score(self):
+        rules = LOCAL_RULES
+        state = make_state(rules, ball_x=rules.goal_line + rules.ball_radius + 0.5, ball_y=20.0,
+                           ball_vx=-60.0, paddle_left=80.0, score_right=rules.winning_score - 1)
+        self.assertEqual(engine.step(state, (0.0, 0.0)), engine.EVENT_SCORE_RIGHT)
+        self.assertEqual(state.winner, RIGHT)
+        tick, ball = state.tick, (state.ball_x, state.ball_y)
+        self.assertEqual(engine.step(state, (0.0, 0.0)), engine.EVENT_NONE)
+        self.assertEqual((state.tick, (state.ball_x, state.ball_y)), (tick, ball))
+
+
+def decode(frame):
+    """Frame binario -> (flags, campos), el inverso de FrameEncoder.encode."""
+    _, flags, seq, tick, t_ms, ball_x, ball_y = _HEADER.unpack_from(frame)
+    fields = {"seq": seq, "tick": tick, "t": t_ms, "ball": (ball_x / SCALE, ball_y / SCALE)}
+    offset = _HEADER.size
+    for flag, name, layout in ((FLAG_PADDLES, "paddles", _PADDLES), (FLAG_SCORES, "scores", _SCORES),
+                               (FLAG_ACKS, "acks", _ACKS)):
+        if flags & flag:
+            fields[name] = layout.unpack_from(frame, offset)
+            offset += layout.size
+    if offset != len(frame):
+        raise ValueError("frame con bytes de más")
+    return flags, fields
+
+
+class ProtocolTests(SimpleTestCase):
+    """Frames binarios (protocol.py): keyframes completos y deltas."""
+
+    def test_negotiate(self):
+        self.assertEqual(negotiate({"subprotocols": ["x", BINARY_SUBPROTOCOL]}), BINARY_SUBPROTOCOL)
+        self.assertIsNone(negotiate({"subprotocols": ["x"]}))
+        self.assertIsNone(negotiate({}))
+
+    def test_keyframe_then_deltas_round_trip(self):
+        encoder = FrameEncoder()
+        state = make_state(ONLINE_RULES, ball_x=12.34, ball_y=56.78, paddle_left=30.0, tick=7)
+
+        flags, fields = decode(encoder.encode(state, 1000, acks=(3, 4)))
+        self.assertTrue(flags & FLAG_KEYFRAME)
+        self.assertEqual(fields, {"seq": 1, "tick": 7, "t": 1000, "ball": (12.34, 56.78),
+                                  "paddles": (3000, 5000), "scores": (0, 0), "acks": (3, 4)})
+
+        # Sin cambios: solo la cabecera con la pelota
+        flags, fields = decode(encoder.encode(state, 1033, acks=(3, 4)))
+        self.assertEqual(flags, 0)
+        self.assertEqual(set(fields), {"seq", "tick", "t", "ball"})
+
+        state.paddle_right = 61.5
+        state.score_left = 2
+        flags, fields = decode(encoder.encode(state, 1066, acks=(3, 5)))
+        self.assertEqual(flags, FLAG_PADDLES | FLAG_SCORES | FLAG_ACKS)
+        self.assertEqual((fields["paddles"], fields["scores"], fields["acks"]), ((3000, 6150), (2, 0), (3, 5)))
+
+        encoder.force_keyframe()
+        flags, fields = decode(encoder.encode(state, 1100, acks=(3, 5)))
+        self.assertTrue(flags & FLAG_KEYFRAME)
+        self.assertEqual(fields["paddles"], (3000, 6150))
+
+    def test_periodic_keyframe(self):
+        encoder = FrameEncoder()
+        state = make_state(ONLINE_RULES)
+        keyframes = []
+        for _ in range(2 * KEYFRAME_EVERY):
+            flags, fields = decode(encoder.encode(state, 0))
+            if flags & FLAG_KEYFRAME:
+                keyframes.append(fields["seq"])
+        self.assertEqual(keyframes, [1, KEYFRAME_EVERY, 2 * KEYFRAME_EVERY])
+
+
+class ReplayTests(SimpleTestCase):
+    """Anillo de frames de una partida y lectura del fichero (replay.py)."""
+
+    def record(self, recorder, ticks):
+        state = make_state(ONLINE_RULES)
+        for tick in ticks:
+            state.tick = tick
+            state.ball_x = tick % 100
+            recorder.record(state, tick * 8)
+
+    def test_full_ring_keeps_the_newest_frames(self):
+        recorder = ReplayRecorder(capacity=2 * KEYFRAME_EVERY)
+        self.record(recorder, range(1, 10 * KEYFRAME_EVERY + 1))
+        self.assertEqual(len(recorder), 2 * KEYFRAME_EVERY)
+        ticks = [decode(frame)[1]["tick"] for frame in recorder.frames()]
+        self.assertEqual(ticks, list(range(8 * KEYFRAME_EVERY + 1, 10 * KEYFRAME_EVERY + 1)))
+        # Compactado: lo descartado no se queda en el buffer
+        self.assertLessEqual(recorder.start, len(recorder.buffer) // 2)
+
+    def test_dump_starts_at_a_keyframe_and_reports_the_last_tick(self):
+        recorder = ReplayRecorder(capacity=2 * KEYFRAME_EVERY)
+        self.record(recorder, range(4, 4 * (3 * KEYFRAME_EVERY + 10), 4))
+        reader = ReplayReader(io.BytesIO(recorder.dump(120, 4)))
+        info = reader.info()
+
+        self.assertEqual(info["frames"], KEYFRAME_EVERY + 10)
+        last_tick = 4 * (3 * KEYFRAME_EVERY + 9)
+        self.assertEqual(info["duration"], last_tick / 120)
+        start_tick, data, count = reader.chunk(0)
+        self.assertEqual((start_tick, count), (info["keyframes"][0], KEYFRAME_EVERY + 10))
+
+
+class InputQueueTests(SimpleTestCase):
+    """Entradas secuenciadas de una pala (inputs.py)."""
+
+    def test_duplicates_and_out_of_order_are_dropped(self):
+        queue = InputQueue()
+        self.assertTrue(queue.push(1, speed=60.0))
+        self.assertFalse(queue.push(1, speed=-60.0))
+        self.assertTrue(queue.push(3, speed=30.0))
+        self.assertFalse(queue.push(2, speed=-60.0))
+        # Clientes sin seq: siempre se aceptan
+        self.assertTrue(queue.push(None, speed=15.0))
+        self.assertEqual((queue.speed, queue.last_seq), (15.0, 3))
+
+    def test_take_acks_last_seq_and_coalesces_nudges(self):
+        queue = InputQueue()
+        dt = ONLINE_RULES.dt
+        for seq in range(1, 6):
+            queue.push(seq, nudge=1.0)
+        self.assertEqual(queue.acked, 0)
+        self.assertAlmostEqual(queue.take(dt), 5.0 / dt)
+        self.assertEqual(queue.acked, 5)
+        # El desplazamiento se consume; la velocidad sostenida se queda
+        queue.push(6, speed=40.0, nudge=100.0)
+        self.assertAlmostEqual(queue.take(dt), 40.0 + MAX_NUDGE / dt)
+        self.assertEqual(queue.take(dt), 40.0)
+
+        queue.reset()
+        self.assertTrue(queue.push(1))
+        self.assertEqual(queue.acked, 0)
+
+
+class AITests(SimpleTestCase):
+    """Predicción cerrada de la IA (ai.py) frente a la simulación tick a tick."""
+
+    def test_fold(self):
+        for unfolded, folded in ((30, 30), (-10, 10), (110, 90), (200, 0), (250, 50), (-250, 50)):
+            self.assertEqual(fold(unfolded), folded)
+
+    def simulate_intercept(self, state):
+        """Y de la pelota al llegar a la pala derecha; la izquierda siempre la devuelve."""
+        rules = state.rules
+        right_x = 100 - rules.paddle_face - rules.ball_radius
+        while not (state.ball_vx > 0 and state.ball_x >= right_x):
+            state.paddle_left = min(max(state.ball_y, rules.paddle_half), 100 - rules.paddle_half)
+            state.paddle_right = 10.0 if state.ball_y > 50 else 90.0
+            engine.step(state, (0.0, 0.0))
+        return state.ball_y
+
+    def test_intercept_matches_simulation(self):
+        rules = AI_RULES.at_rate(12000)
+        for ball_x, ball_vx, ball_vy in ((50.0, 60.0, 42.0), (50.0, 60.0, -150.0),
+                                         (70.0, -60.0, 42.0), (30.0, -90.0, 200.0)):
+            with self.subTest(vx=ball_vx, vy=ball_vy):
+                state = make_state(rules, ball_x=ball_x, ball_y=40.0, ball_vx=ball_vx, ball_vy=ball_vy)
+                predicted = intercept_y(state)
+                self.assertAlmostEqual(predicted, self.simulate_intercept(state), delta=0.2)
+
+    def test_no_intercept_without_trajectory(self):
+        self.assertIsNone(intercept_y(make_state(AI_RULES, ball_vx=0.0)))
+        self.assertIsNone(intercept_y(make_state(AI_RULES, ball_x=99.0, ball_vx=60.0)))
+
+    def test_prediction_is_cached_per_rally(self):
+        ai = PongAI("hard")
+        state = make_state(AI_RULES, ball_vx=60.0)
+        with mock.patch("pong.ai.random.random", return_value=1.0), \
+                mock.patch("pong.ai.random.uniform", return_value=0.0), \
+                mock.patch("pong.ai.intercept_y", wraps=intercept_y) as predict:
+            target = ai.plan(state)
+            state.ball_y = 10.0
+            self.assertEqual(ai.plan(state), target)
+            self.assertEqual(predict.call_count, 1)
+            state.rally += 1
+            self.assertNotEqual(ai.plan(state), target)
+            self.assertEqual(predict.call_count, 2)
+
+
+@unittest.skipIf(BatchEngine is None, "numpy no está instalado")
+class BatchEngineTests(SimpleTestCase):
+    """BatchEngine.step (engine_numpy.py) da lo mismo que engine.step, sala a sala."""
+
+    def test_matches_scalar_engine(self):
+        batch = BatchEngine(capacity=2)
+        games = []
+        for index, rules in enumerate(ALL_RULES.values()):
+            for serve_to in (LEFT, RIGHT):
+                state = GameState(rules, serve_to=serve_to)
+                state.paddle_left += 3 * index
+                games.append((state, batch.adopt(GameState(rules, serve_to=serve_to))))
+                games[-1][1].paddle_left = state.paddle_left
+
+        events = {}
+        for tick in range(5000):
+            for state, view in games:
+                # Palas imperfectas: hay golpes, goles y saques en todas las salas
+                inputs = (follow(state.paddle_left, state.ball_y + 8, state.rules.dt, 50.0),
+                          follow(state.paddle_right, state.ball_y - 5, state.rules.dt, 45.0))
+                batch.set_inputs(view, inputs)
+                events[view] = engine.step(state, inputs)
+            batch.step()
+            for state, view in games:
+                self.assertEqual(batch.event_of(view), events[view], f"tick {tick}")
+                for name in ("ball_x", "ball_y", "ball_vx", "ball_vy", "paddle_left", "paddle_right",
+                             "serve_timer"):
+                    self.assertAlmostEqual(getattr(view, name), getattr(state, name), places=9,
+                                           msg=f"{name} en el tick {tick}")
+                for name in ("score_left", "score_right", "tick", "rally", "serve_to", "winner"):
+                    self.assertEqual(getattr(view, name), getattr(state, name), f"{name} en el tick {tick}")
+
+        self.assertTrue(any(state.winner for state, _ in games))
+
+    def test_scheduler_visits_only_due_rooms(self):
+        """
+        Con BatchEngine el planificador solo lee las entradas que han cambiado
+        y solo llama a after_step() en los ticks con algo que hacer, pero las
+        partidas y los frames son los mismos que con engine.step().
+        """
+
+        class Room:
+            dynamic_inputs = False
+
+            def __init__(self, sched, rules, serve_to):
+                self.scheduler = sched
+                self.state = GameState(sched.rules(rules), serve_to=serve_to)
+                self.speeds = (0.0, 0.0)
+                self.polled = 0
+                self.frames = []
+
+            def steer(self, speeds):
+                self.speeds = speeds
+                self.scheduler.inputs_changed(self)
+
+            def inputs(self):
+                self.polled += 1
+                return self.speeds
+
+            def after_step(self, event):
+                state = self.state
+                if event or state.winner is not None or self.scheduler.snapshot_due(state):
+                    self.frames.append((state.tick, event, round(state.ball_x, 9),
+                                        round(state.paddle_left, 9), state.score_left, state.score_right))
+                return ()
+
+        runs = {}
+        for engine_name in ("python", "numpy"):
+            sched = TickScheduler(tick_rate=120, snapshot_rate=30, engine=engine_name)
+            # El bucle no arranca: los ticks se dan a mano con advance()
+            sched.task = mock.Mock(done=lambda: False)
+            room_list = [Room(sched, rules, serve_to)
+                         for rules in ALL_RULES.values() for serve_to in (LEFT, RIGHT)]
+            for room in room_list:
+                sched.add(room)
+            for tick in range(3000):
+                # Entradas de vez en cuando, como las de un socket
+                if tick % 40 == 0:
+                    for index, room in enumerate(room_list):
+                        state = room.state
+                        room.steer((follow(state.paddle_left, state.ball_y + index, state.rules.dt, 60.0),
+                                    follow(state.paddle_right, state.ball_y - 4, state.rules.dt, 60.0)))
+                sched.advance(list(sched.rooms))
+            for room in room_list:
+                sched.remove(room)
+            runs[engine_name] = room_list
+
+        for scalar, batched in zip(runs["python"], runs["numpy"]):
+            self.assertEqual(batched.frames, scalar.frames)
+            self.assertTrue(any(frame[1] for frame in batched.frames))
+            # Cada entrada se lee en su tick y en el siguiente, no en todos
+            self.assertLess(batched.polled, scalar.polled / 10)
+
+
+class FakeUser:
+    def __init__(self, user_id, username):
+        self.id = user_id
+        self.username = username
+
+
+class FakeConsumer:
+    """Socket de jugador mínimo: lo que GameRoom usa de PongGameConsumer."""
+
+    subprotocol = None
+
+    def __init__(self, user):
+        self.user = user
+        self.channel_name = f"player.{user.username}"
+        self.game = None
+
+    async def send_frame(self, text, frame):
+        pass
+
+
+@override_settings(CHANNEL_LAYERS=IN_MEMORY_LAYERS)
+@mock.patch("pong.rooms.RECONNECT_GRACE", 0.01)
+@mock.patch("pong.rooms.save_room", mock.AsyncMock())
+@mock.patch("pong.rooms.delete_room", mock.AsyncMock())
+class ReconnectGraceTests(SimpleTestCase):
+    """Asiento guardado de un jugador que pierde la conexión (rooms.GameRoom)."""
+
+    async def start_match(self, room_id):
+        room = rooms.get_or_create(room_id)
+        self.addCleanup(rooms._rooms.pop, room_id, None)
+        self.addCleanup(room.stop)
+        alice, bob = FakeConsumer(FakeUser(1, "alice")), FakeConsumer(FakeUser(2, "bob"))
+        self.assertEqual(await room.join(alice), "paddle_1")
+        self.assertEqual(await room.join(bob), "paddle_2")
+        self.assertTrue(room.start())
+        return room, alice, bob
+
+    async def test_expired_seat_forfeits_to_connected_player(self):
+        with mock.patch("pong.rooms.results.submit") as submit:
+            room, alice, bob = await self.start_match("forfeit")
+            room.state.score_right = 3
+            await room.leave(bob)
+            self.assertTrue(room.paused)
+
+            await asyncio.sleep(0.05)
+            await room.finish_task
+
+        self.assertTrue(room.closed)
+        self.assertFalse(room.in_progress)
+        result = submit.call_args.args[0]
+        self.assertEqual((result.player1_id, result.player2_id), (1, 2))
+        # Gana quien sigue conectado aunque fuera perdiendo
+        self.assertEqual(result.winner_id, 1)
+        self.assertEqual((result.score1, result.score2), (0, 3))
+
+    async def test_held_seat_is_not_given_to_another_user(self):
+        with mock.patch("pong.rooms.results.submit"):
+            room, alice, bob = await self.start_match("no-stranger")
+            await room.leave(bob)
+            carol = FakeConsumer(FakeUser(3, "carol"))
+            self.assertIsNone(await room.join(carol))
+
+            await asyncio.sleep(0.05)
+            await room.finish_task
+            self.assertIsNone(room.claim_seat(carol))
+            await room.request_start(carol)
+            self.assertFalse(room.in_progress)
+            self.assertEqual(room.players(), {"player1": "alice", "player2": "bob"})
+
+
+    async def test_room_is_not_released_while_a_player_joins(self):
+        room_id = "5f0c6a4e-0000-4000-8000-000000000001"
+        room = rooms.get_or_create(room_id)
+        self.addCleanup(rooms._rooms.pop, room_id, None)
+        alice, bob = FakeConsumer(FakeUser(1, "alice")), FakeConsumer(FakeUser(2, "bob"))
+        room.attach(alice)
+        loading = asyncio.Event()
+        gate = asyncio.Event()
+
+        async def slow_lookup(room_uuid):
+            loading.set()
+            await gate.wait()
+            return None
+
+        with mock.patch("pong.rooms.tournament_players", slow_lookup):
+            joining = asyncio.create_task(room.join(bob))
+            await loading.wait()
+            # El último miembro se va mientras bob espera a la BD
+            await room.leave(alice)
+            self.assertIs(rooms.get(room_id), room)
+            gate.set()
+            self.assertEqual(await joining, "paddle_1")
+        self.assertIs(rooms.get(room_id), room)
+
+@unittest.skipIf(fakeredis is None, "fakeredis no está instalado")
+@override_settings(CHANNEL_LAYERS=IN_MEMORY_LAYERS)
+class DeadWorkerTests(SimpleTestCase):
+    """Un worker del clúster (cluster.py) deja de latir con jugadores en salas."""
+
+    async def start_cluster(self):
+        self.redis = fakeredis.FakeRedis(decode_responses=True)
+        patcher = mock.patch("pong.cluster.get_redis", return_value=self.redis)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.cluster = Cluster(enabled=True)
+        self.cluster.worker_id = "pongworker!alive"
+        self.cluster.channel_layer = get_channel_layer()
+        # Sin tareas de latido ni de recepción: se llama a mano
+        self.cluster._started = asyncio.get_running_loop().create_future()
+        self.cluster._started.set_result(None)
+        now = time.time()
+        await self.redis.zadd(WORKERS_KEY, {"pongworker!alive": now, "pongworker!dead": now - 60})
+
+    async def settle(self):
+        """Espera a las altas y bajas de jugadores remotos en curso."""
+        while self.cluster._room_tasks:
+            await asyncio.gather(*self.cluster._room_tasks.values())
+
+    async def test_frames_do_not_wait_behind_a_join(self):
+        await self.start_cluster()
+        room_id = "5f0c6a4e-0000-4000-8000-000000000002"
+        self.addCleanup(rooms._rooms.pop, room_id, None)
+        gate = asyncio.Event()
+
+        async def slow_lookup(room_uuid):
+            await gate.wait()
+            return None
+
+        alice = FakeConsumer(FakeUser(1, "alice"))
+        alice.send_frame = mock.AsyncMock()
+        proxy = self.cluster.proxies["other-room"] = RemoteRoom(self.cluster, "other-room", "pongworker!dead")
+        proxy.members.add(alice)
+        join = {"type": "pong.join", "room_id": room_id, "worker": "pongworker!other",
+                "member": "player.bob", "user_id": 2, "username": "bob", "subprotocol": None}
+        with mock.patch("pong.rooms.tournament_players", slow_lookup):
+            await self.cluster.dispatch(join)
+            await self.cluster.dispatch(dict(join, type="pong.leave"))
+            await self.cluster.dispatch({"type": "pong.frame", "room_id": "other-room", "text": "{}", "frame": None})
+            alice.send_frame.assert_awaited_once_with("{}", None)
+
+            gate.set()
+            await self.settle()
+        # La baja se aplica después del alta, no antes
+        self.assertEqual(self.cluster.hubs, {})
+        self.assertIsNone(rooms.get(room_id))
+
+    async def test_hubs_of_dead_worker_are_dropped(self):
+        await self.start_cluster()
+        self.addCleanup(rooms._rooms.pop, "hub-room", None)
+        await self.cluster.dispatch({
+            "type": "pong.join", "room_id": "hub-room", "worker": "pongworker!dead",
+            "member": "player.bob", "user_id": 2, "username": "bob", "subprotocol": None,
+        })
+        await self.settle()
+        room = rooms.get("hub-room")
+        self.assertEqual(room.players()["player1"], "bob")
+
+        await self.cluster.drop_dead_workers()
+
+        self.assertEqual(self.cluster.hubs, {})
+        self.assertFalse(room.members)
+        self.assertIsNone(rooms.get("hub-room"))
+
+    async def test_players_of_dead_owner_move_to_new_owner(self):
+        await self.start_cluster()
+        self.addCleanup(rooms._rooms.pop, "orphan-room", None)
+        await self.redis.set(OWNER_KEY.format(room_id="orphan-room"), "pongworker!dead")
+        alice = FakeConsumer(FakeUser(1, "alice"))
+        proxy = self.cluster.proxies["orphan-room"] = RemoteRoom(self.cluster, "orphan-room", "pongworker!dead")
+        alice.game = proxy
+        await proxy.join(alice)
+
+        await self.cluster.drop_dead_workers()
+
+        self.assertEqual(self.cluster.proxies, {})
+        self.assertEqual(await self.redis.get(OWNER_KEY.format(room_id="orphan-room")), "pongworker!alive")
+        self.assertIs(alice.game, rooms.get("orphan-room"))
+        self.assertEqual(alice.game.seat_of(alice), "paddle_1")
+
+
+@override_settings(CHANNEL_LAYERS=IN_MEMORY_LAYERS)
+class TournamentRoomTests(TransactionTestCase):
+    """Salas de partidas de torneo: quién se sienta y qué pasa si alguien no se presenta."""
+
+    def setUp(self):
+        self.alice = User.objects.create_user(username="alice", password="x", email="alice@example.com")
+        self.bob = User.objects.create_user(username="bob", password="x", email="bob@example.com")
+        self.carol = User.objects.create_user(username="carol", password="x", email="carol@example.com")
+        self.tournament, _ = tournaments.create_tournament("Copa", self.alice, [self.alice, self.bob])
+        self.match = self.tournament.matches.get()
+        self.room_id = str(self.match.room_id)
+        self.addCleanup(rooms._rooms.pop, self.room_id, None)
+        if fakeredis is not None:
+            # Marcas de salas vivas en otros workers (reaper.live)
+            patcher = mock.patch("pong.reaper.get_redis", return_value=fakeredis.FakeRedis(decode_responses=True))
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+    def overdue(self):
+        TournamentMatch.objects.filter(pk=self.match.pk).update(
+            ready_at=timezone.now() - timedelta(seconds=tournaments.NO_SHOW_AFTER + 1)
+        )
+
+    def test_only_bracket_players_can_sit(self):
+        async def scenario():
+            room = rooms.get_or_create(self.room_id)
+            # En su pala aunque llegue primero el segundo jugador
+            self.assertEqual(await room.join(FakeConsumer(self.bob)), "paddle_2")
+            self.assertIsNone(await room.join(FakeConsumer(self.carol)))
+            self.assertEqual(await room.join(FakeConsumer(self.alice)), "paddle_1")
+            room.stop()
+        async_to_sync(scenario)()
+
+    @unittest.skipIf(fakeredis is None, "fakeredis no está instalado")
+    def test_no_show_awards_walkover_to_present_player(self):
+        async def scenario():
+            room = rooms.get_or_create(self.room_id)
+            await room.join(FakeConsumer(self.bob))
+            self.assertEqual(await reaper.walkover(), 0)
+            await sync_to_async(self.overdue)()
+            self.assertEqual(await reaper.walkover(), 1)
+            self.assertTrue(room.closed)
+        async_to_sync(scenario)()
+
+        self.match.refresh_from_db()
+        self.tournament.refresh_from_db()
+        self.assertEqual(self.match.status, TournamentMatch.FINISHED)
+        self.assertEqual(self.match.winner_id, self.bob.id)
+        self.assertEqual(self.tournament.status, Tournament.FINISHED)
+
+    @unittest.skipIf(fakeredis is None, "fakeredis no está instalado")
+    def test_no_show_of_both_players_advances_the_seed(self):
+        self.overdue()
+        self.assertEqual(async_to_sync(reaper.walkover)(), 1)
+        self.match.refresh_from_db()
+        self.assertEqual(self.match.winner_id, self.alice.id)
+
+    def test_top_seeds_get_byes_and_meet_only_in_the_final(self):
+        seeds = [
+            User.objects.create_user(username=f"seed{i}", password="x", email=f"seed{i}@example.com")
+            for i in range(1, 7)
+        ]
+        tournament, _ = tournaments.create_tournament("Seeds", seeds[0], seeds)
+        first_round = {
+            match.position: (match.player1_id, match.player2_id, match.status)
+            for match in tournament.matches.filter(round=1)
+        }
+        ids = [user.id for user in seeds]
+        # 1-8, 4-5, 2-7, 3-6 con 6 jugadores: 1 y 2 pasan sin jugar, en mitades distintas
+        self.assertEqual(first_round, {
+            0: (ids[0], None, TournamentMatch.FINISHED),
+            1: (ids[3], ids[4], TournamentMatch.READY),
+            2: (ids[1], None, TournamentMatch.FINISHED),
+            3: (ids[2], ids[5], TournamentMatch.READY),
+        })
+        semis = dict(tournament.matches.filter(round=2).values_list("position", "player1_id"))
+        self.assertEqual(semis, {0: ids[0], 1: ids[1]})
+
+    def test_pending_match_is_served_to_its_players(self):
+        next_match = tournaments.serialize(self.tournament, self.bob)["next_match"]
+        self.assertEqual(next_match, {"round": 1, "room": self.room_id, "opponent": "alice"})
+        self.assertIsNone(tournaments.serialize(self.tournament, self.carol)["next_match"])
+
+
+@unittest.skipIf(fakeredis is None, "fakeredis no está instalado")
+class ReaperTests(TransactionTestCase):
+    """El limpiador (reaper.py) no borra salas que simula otro proceso."""
+
+    def setUp(self):
+        self.redis = fakeredis.FakeRedis(decode_responses=True)
+        patcher = mock.patch("pong.reaper.get_redis", return_value=self.redis)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.room = PongRoom.objects.create()
+        PongRoom.objects.update(created_at=timezone.now() - timedelta(hours=2))
+        self.room_id = str(self.room.id)
+        self.alive_key = ALIVE_KEY.format(room_id=self.room_id)
+
+    async def redis_call(self, method, *args):
+        return await getattr(self.redis, method)(*args)
+
+    def test_room_simulated_by_another_worker_is_kept(self):
+        # Lo que haría el latido del worker que la simula
+        async def other_worker():
+            rooms.get_or_create(self.room_id)
+            try:
+                await reaper.beat()
+            finally:
+                rooms._rooms.pop(self.room_id)
+        async_to_sync(other_worker)()
+        self.assertTrue(async_to_sync(self.redis_call)("exists", self.alive_key))
+
+        self.assertEqual(async_to_sync(reaper.reap)(), 0)
+        self.assertTrue(PongRoom.objects.filter(id=self.room.id).exists())
+
+        async_to_sync(self.redis_call)("delete", self.alive_key)
+        self.assertEqual(async_to_sync(reaper.reap)(), 1)
+        self.assertFalse(PongRoom.objects.exists())
+
+    def test_nothing_is_deleted_without_redis(self):
+        with mock.patch.object(self.redis, "pipeline", side_effect=ConnectionError):
+            with self.assertRaises(ConnectionError):
+                async_to_sync(reaper.reap)()
+        self.assertTrue(PongRoom.objects.exists())
+
+
+class ResultSinkTests(TransactionTestCase):
+    """Volcado de resultados (results.py) con la persistencia desactivada."""
+
+    def test_results_are_discarded_when_persistence_is_off(self):
+        alice = User.objects.create_user(username="alice", password="x", email="alice@example.com")
+        bob = User.objects.create_user(username="bob", password="x", email="bob@example.com")
+        room = PongRoom.objects.create(player1=alice, player2=bob)
+        sink = ResultSink()
+        sink.persist = False
+
+        with mock.patch("pong.results.leaderboard.update") as update:
+            async_to_sync(sink.write)([MatchResult(room.id, True, alice.id, bob.id, 5, 2, alice.id)])
+
+        update.assert_not_called()
+        self.assertFalse(PongRoom.objects.exists())
+        self.assertFalse(MatchHistory.objects.exists())
+        alice.refresh_from_db()
+        self.assertEqual((alice.wins, alice.rating), (0, User._meta.get_field("rating").default))
@@ -0,0 +1,275 @@
+"""
+Motor de torneos en el servidor.
+
+El cuadro completo (todas las rondas) se crea de una vez al empezar el torneo:
+una fila TournamentMatch por partida, cada una con su propio room_id. Las
+partidas de una misma ronda se juegan a la vez, cada una en su GameRoom, así
+que un torneo de N jugadores dura log2(N) rondas de tiempo real.
+
+  - create_tournament(): crea el cuadro, resuelve los byes (si N no es
+    potencia de 2) y devuelve los eventos de las partidas ya listas.
+  - record_results(): lo llama el sumidero de resultados (results.py) dentro
+    de su transacción con los resultados de un lote; da por terminadas las
+    partidas de torneo de esas salas, hace avanzar a los ganadores y devuelve
+    los eventos de las partidas que quedan listas y de los torneos acabados.
+  - announce(): envía esos eventos. Cada partida lista se anuncia con un
+    'start_game' (el mismo que las invitaciones) a sus dos jugadores.
+
+El aviso es de una sola vez y solo llega a quien esté conectado: un jugador
+que entra más tarde recupera la partida que le toca en la API (serialize(),
+campo "next_match"). En la sala de una partida de torneo solo pueden
+sentarse sus dos jugadores (rooms.GameRoom.load_players()), y si pasado
+NO_SHOW_AFTER alguno no se ha presentado, la partida se da por ganada al
+otro (reaper.py, walkover()), también a través de record_results().
+"""
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.db import transaction
+from django.utils import timezone
+
+from users.groups import send_to_users
+from .models import Tournament, TournamentMatch
+
+User = get_user_model()
+
+MIN_PLAYERS = 2
+MAX_PLAYERS = 64
+# Segundos que tiene una partida lista para jugarse antes de resolverse por incomparecencia
+NO_SHOW_AFTER = getattr(settings, "PONG_TOURNAMENT_NO_SHOW", 300)
+
+
+def bracket_size(players):
+    """Potencia de 2 más pequeña que da cabida a todos los jugadores."""
+    return 1 << (players - 1).bit_length()
+
+
+def seed_order(size):
+    """
+    Cabezas de serie (1..size) en el orden de las posiciones de la ronda 1:
+    1 contra size, 2 contra size - 1... repartidos en espejo entre las dos
+    mitades, así que 1 y 2 solo pueden cruzarse en la final (y los cuatro
+    primeros, en semifinales).
+    """
+    order = [1]
+    while len(order) < size:
+        total = 2 * len(order) + 1
+        order = [seed for top in order for seed in (top, total - top)]
+    return order
+
+
+class Bracket:
+    """
+    Vista en memoria de las partidas sin terminar de un torneo, indexadas por
+    (ronda, posición), para hacer avanzar a los ganadores sin más consultas.
+    """
+
+    def __init__(self, tournament, matches, rounds):
+        self.tournament = tournament
+        self.rounds = rounds
+        self.matches = {(match.round, match.position): match for match in matches}
+        # Partidas modificadas, por (ronda, posición): las nuevas aún no tienen pk
+        self.changed = {}
+        self.ready = []
+
+    def finish(self, match, winner_id, score1=None, score2=None):
+        match.winner_id = winner_id
+        match.score1 = score1
+        match.score2 = score2
+        match.status = TournamentMatch.FINISHED
+        self.changed[(match.round, match.position)] = match
+
+        if match.round == self.rounds:
+            tournament = self.tournament
+            tournament.winner_id = winner_id
+            tournament.status = Tournament.FINISHED
+            tournament.finished_at = timezone.now()
+            return
+
+        following = self.matches[(match.round + 1, match.position // 2)]
+        if match.position % 2 == 0:
+            following.player1_id = winner_id
+        else:
+            following.player2_id = winner_id
+        self.changed[(following.round, following.position)] = following
+        if following.player1_id and following.player2_id:
+            self.make_ready(following)
+
+    def make_ready(self, match):
+        match.status = TournamentMatch.READY
+        match.ready_at = timezone.now()
+        self.ready.append(match)
+
+
+@transaction.atomic
+def create_tournament(name, creator, players):
+    """
+    Crea el torneo con su cuadro y devuelve (torneo, eventos). `players` es la
+    lista de usuarios en orden de cabeza de serie.
+    """
+    size = bracket_size(len(players))
+    rounds = size.bit_length() - 1
+    tournament = Tournament.objects.create(name=name, created_by=creator)
+    tournament.players.set(players)
+
+    matches = [
+        TournamentMatch(tournament=tournament, round=round_, position=position)
+        for round_ in range(1, rounds + 1)
+        for position in range(size >> round_)
+    ]
+    bracket = Bracket(tournament, matches, rounds)
+
+    # Ronda 1 por cabezas de serie: los rivales que faltan (serie > N) son
+    # byes, así que pasan directamente los mejores cabezas de serie
+    order = seed_order(size)
+    for position in range(size // 2):
+        match = bracket.matches[(1, position)]
+        top, bottom = order[2 * position], order[2 * position + 1]
+        match.player1_id = players[top - 1].id
+        if bottom > len(players):
+            bracket.finish(match, match.player1_id)
+        else:
+            match.player2_id = players[bottom - 1].id
+            bracket.make_ready(match)
+
+    TournamentMatch.objects.bulk_create(matches)
+    return tournament, events(bracket)
+
+
+def record_results(results):
+    """
+    Aplica al cuadro los resultados de partidas de torneo de un lote (se
+    llama dentro de la transacción de results.write_results). Devuelve los
+    eventos a anunciar.
+    """
+    by_room = {result.room_id: result for result in results if result.room_id}
+    if not by_room:
+        return []
+    finished = list(
+        TournamentMatch.objects.select_for_update()
+        .filter(room_id__in=by_room, status=TournamentMatch.READY)
+    )
+    if not finished:
+        return []
+
+    tournament_ids = {match.tournament_id for match in finished}
+    tournaments = Tournament.objects.in_bulk(tournament_ids)
+    pending = TournamentMatch.objects.filter(tournament_id__in=tournament_ids).exclude(
+        status=TournamentMatch.FINISHED
+    )
+    brackets = {}
+    for match in pending:
+        brackets.setdefault(match.tournament_id, []).append(match)
+    # La final sigue pendiente mientras el torneo no acaba: su ronda es la última
+    brackets = {
+        tournament_id: Bracket(
+            tournaments[tournament_id], matches, max(match.round for match in matches)
+        )
+        for tournament_id, matches in brackets.items()
+    }
+
+    collected = []
+    for match in finished:
+        result = by_room[match.room_id]
+        players = {match.player1_id, match.player2_id}
+        # Solo cuentan las partidas entre los dos jugadores del cuadro
+        if {result.player1_id, result.player2_id} != players:
+            continue
+        bracket = brackets[match.tournament_id]
+        # Misma instancia que en el índice del cuadro
+        match = bracket.matches[(match.round, match.position)]
+        if result.player1_id == match.player1_id:
+            score1, score2 = result.score1, result.score2
+        else:
+            score1, score2 = result.score2, result.score1
+        bracket.finish(match, result.winner_id, score1, score2)
+
+    for bracket in brackets.values():
+        if not bracket.changed:
+            continue
+        TournamentMatch.objects.bulk_update(
+            list(bracket.changed.values()),
+            ["player1", "player2", "winner", "score1", "score2", "status", "ready_at"],
+        )
+        if bracket.tournament.status == Tournament.FINISHED:
+            bracket.tournament.save(update_fields=["winner", "status", "finished_at"])
+        collected.extend(events(bracket))
+    return collected
+
+
+def events(bracket):
+    """
+    (ids de destinatarios, evento) de channel layer para las partidas listas
+    y el fin del torneo.
+    """
+    tournament = bracket.tournament
+    user_ids = {tournament.winner_id}
+    for match in bracket.ready:
+        user_ids.update((match.player1_id, match.player2_id))
+    names = dict(User.objects.filter(id__in=user_ids - {None}).values_list("id", "username"))
+
+    collected = []
+    for match in bracket.ready:
+        player_1, player_2 = names[match.player1_id], names[match.player2_id]
+        collected.append(((match.player1_id, match.player2_id), {
+            "type": "start_game",
+            "game_data": {
+                "from": player_1,
+                "to": player_2,
+                "room": str(match.room_id),
+                "player_1": player_1,
+                "player_2": player_2,
+                "tournament": str(tournament.id),
+                "round": match.round,
+            },
+        }))
+    if tournament.status == Tournament.FINISHED:
+        collected.append((list(tournament.players.values_list("id", flat=True)), {
+            "type": "tournament_finished",
+            "tournament": str(tournament.id),
+            "name": tournament.name,
+            "winner": names.get(tournament.winner_id),
+        }))
+    return collected
+
+
+async def announce(channel_layer, collected):
+    for user_ids, event in collected:
+        await send_to_users(channel_layer, user_ids, event)
+
+
+def serialize(tournament, user=None):
+    """
+    Torneo con su cuadro completo para la API. Con `user`, incluye en
+    "next_match" la partida lista que le toca jugar (o None).
+    """
+    matches = list(tournament.matches.select_related("player1", "player2", "winner"))
+    next_match = None
+    if user is not None:
+        for match in matches:
+            if match.status == TournamentMatch.READY and user.id in (match.player1_id, match.player2_id):
+                opponent = match.player2 if match.player1_id == user.id else match.player1
+                next_match = {
+                    "round": match.round,
+                    "room": str(match.room_id),
+                    "opponent": opponent.username if opponent else None,
+                }
+                break
+    return {
+        "id": str(tournament.id),
+        "name": tournament.name,
+        "status": tournament.status,
+        "winner": tournament.winner.username if tournament.winner else None,
+        "created_at": tournament.created_at.strftime("%Y-%m-%d %H:%M"),
+        "matches": [{
+            "round": match.round,
+            "position": match.position,
+            "player1": match.player1.username if match.player1 else None,
+            "player2": match.player2.username if match.player2 else None,
+            "winner": match.winner.username if match.winner else None,
+            "score1": match.score1,
+            "score2": match.score2,
+            "status": match.status,
+            "room": str(match.room_id),
+        } for match in matches],
+        "next_match": next_match,
+    }
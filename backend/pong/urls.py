@@ -1,10 +1,19 @@
 from django.urls import path
 from .views import create_pong_room, join_pong_room
-from .api_views import StartGameAPIView, MovePaddleAPIView
+from .api_views import (
+    StartGameAPIView, MovePaddleAPIView, PongMetricsAPIView,
+    TournamentListCreateAPIView, TournamentDetailAPIView,
+    ReplayInfoAPIView, ReplayFramesAPIView,
+)
 
 urlpatterns = [
     path("create/", create_pong_room, name="create_pong_room"),
     path("join/<uuid:room_id>/", join_pong_room, name="join_pong_room"),
     path('api/pong/local/start/', StartGameAPIView.as_view(), name='start_game'),
     path('api/pong/local/move/', MovePaddleAPIView.as_view(), name='move_paddle'),
+    path("metrics/", PongMetricsAPIView.as_view(), name="pong_metrics"),
+    path("tournaments/", TournamentListCreateAPIView.as_view(), name="pong_tournaments"),
+    path("tournaments/<uuid:tournament_id>/", TournamentDetailAPIView.as_view(), name="pong_tournament_detail"),
+    path("replays/<int:match_id>/", ReplayInfoAPIView.as_view(), name="pong_replay"),
+    path("replays/<int:match_id>/frames/", ReplayFramesAPIView.as_view(), name="pong_replay_frames"),
 ]
@@ -2,22 +2,38 @@ import json
 import jwt
 import logging
 import uuid
-import redis
 from channels.generic.websocket import AsyncWebsocketConsumer
 from django.contrib.auth import get_user_model
 from channels.db import database_sync_to_async
 from django.conf import settings
+from backend.redis_pool import get_redis
+from . import presence
+from .groups import ONLINE_GROUP, send_to_users, user_group
+from .matchmaking import matchmaker
 
 # Configuración de logging
 logging.basicConfig(level=logging.DEBUG)
 
-# Se establece la conexión con Redis (cliente síncrono, se envolverá en funciones asíncronas)
-redis_client = redis.StrictRedis(host="redis", port=6379, db=0, decode_responses=True)
+# Clave de la invitación pendiente de cada usuario
+INVITE_KEY = "invite:{username}"
+# Segundos que dura una invitación sin responder
+INVITE_TTL = 30
+
 User = get_user_model()
 
 class OnlineUsersConsumer(AsyncWebsocketConsumer):
     """
     Este consumidor gestiona la conexión de usuarios online, invitaciones y el inicio de partidas.
+
+    Redis se usa con el cliente asíncrono compartido (backend/redis_pool.py),
+    no desde el pool de hilos de database_sync_to_async, que queda para el
+    ORM. Las operaciones de varios comandos van en un solo pipeline.
+
+    Presencia (ver presence.py): al conectar se envía la lista completa
+    ("presence_snapshot") o, con ?since=<versión>, solo los cambios perdidos
+    ("presence_delta"); después, un evento user_online/user_offline por
+    cambio (o un presence_delta si el barrido saca a varios a la vez). Con
+    ?presence=friends solo se reciben los de sus amigos.
     """
 
     async def connect(self):
@@ -27,17 +43,30 @@ class OnlineUsersConsumer(AsyncWebsocketConsumer):
             await self.close()
             return
 
-        await self.add_user(self.user.username)
-        await self.channel_layer.group_add("online_users", self.channel_name)
+        params = self.query_params()
+        self.friends = None
+        if params.get("presence") == "friends":
+            self.friends = set(await self.get_friends())
+
+        # Primero a los grupos: los eventos que lleguen mientras tanto esperan
+        # a que termine connect() y el cliente descarta los ya incluidos
+        await self.channel_layer.group_add(ONLINE_GROUP, self.channel_name)
+        await self.channel_layer.group_add(user_group(self.user.id), self.channel_name)
         await self.accept()
-        await self.send_online_users()
+        presence.heartbeat.ensure_running()
+        await self.publish_presence(online=True)
+        await self.send_presence(params.get("since"))
 
     async def disconnect(self, close_code):
-        """Al desconectar, se remueve el usuario de Redis y se notifica la actualización."""
+        """
+        Al desconectar se resta la conexión del usuario. Solo con la última
+        (ninguna otra pestaña abierta) pasa a offline y sale de la cola.
+        """
         if self.user:
-            await self.remove_user(self.user.username)
-            await self.channel_layer.group_discard("online_users", self.channel_name)
-            await self.send_online_users()
+            await self.channel_layer.group_discard(ONLINE_GROUP, self.channel_name)
+            await self.channel_layer.group_discard(user_group(self.user.id), self.channel_name)
+            if await self.publish_presence(online=False):
+                await matchmaker.leave(self.user.username)
 
     async def receive(self, text_data):
         """Procesa los mensajes entrantes y delega acciones según el tipo de mensaje."""
@@ -49,6 +78,10 @@ class OnlineUsersConsumer(AsyncWebsocketConsumer):
             await self.handle_accept_invite(data)
         elif msg_type == "cancel_invite":
             await self.handle_cancel_invite(data)
+        elif msg_type == "queue_join":
+            await self.handle_queue_join()
+        elif msg_type == "queue_leave":
+            await self.handle_queue_leave()
 
     async def handle_invite(self, data):
         """Gestiona el envío de una invitación entre usuarios."""
@@ -56,14 +89,17 @@ class OnlineUsersConsumer(AsyncWebsocketConsumer):
         to_user = data["to"]
         if from_user == to_user:
             return
-        # Evita enviar una nueva invitación si ya existe una pendiente.
-        if await self.get_invite(f"invite:{to_user}"):
+        to_id = await self.get_user_id(to_user)
+        if to_id is None:
             return
         room_id = str(uuid.uuid4())
-        invite_payload = json.dumps({"from": from_user, "room": room_id})
-        await self.set_invite(f"invite:{to_user}", invite_payload, ex=30)
+        # Se guarda el id de quien invita para avisarle al aceptar sin ir a la BD
+        invite_payload = json.dumps({"from": from_user, "from_id": self.user.id, "room": room_id})
+        # Evita enviar una nueva invitación si ya existe una pendiente.
+        if not await self.set_invite(to_user, invite_payload):
+            return
         await self.channel_layer.group_send(
-            "online_users",
+            user_group(to_id),
             {
                 "type": "invite",
                 "from": from_user,
@@ -73,9 +109,8 @@ class OnlineUsersConsumer(AsyncWebsocketConsumer):
         )
 
     async def invite(self, event):
-        """Envía el mensaje de invitación solo al usuario destinatario."""
-        if event["to"] == self.user.username:
-            await self.send(text_data=json.dumps(event))
+        """Invitación recibida (solo llega al grupo del destinatario)."""
+        await self.send(text_data=json.dumps(event))
 
     async def handle_accept_invite(self, data):
         """
@@ -86,12 +121,11 @@ class OnlineUsersConsumer(AsyncWebsocketConsumer):
         """
         accepting_user = data["from"]
         inviting_user = data["to"]
-        stored_invite = await self.get_invite(f"invite:{accepting_user}")
+        stored_invite = await self.take_invite(accepting_user)
         if not stored_invite:
             return
         invite_data = json.loads(stored_invite)
         room_id = invite_data["room"]
-        await self.delete_invite(f"invite:{accepting_user}")
 
         game_start_data = {
             "from": inviting_user,
@@ -100,51 +134,111 @@ class OnlineUsersConsumer(AsyncWebsocketConsumer):
             "player_1": inviting_user,
             "player_2": accepting_user,
         }
-        await self.channel_layer.group_send(
-            "online_users",
-            {"type": "start_game", "game_data": game_start_data}
+        await send_to_users(
+            self.channel_layer,
+            (invite_data.get("from_id"), self.user.id),
+            {"type": "start_game", "game_data": game_start_data},
         )
 
     async def start_game(self, event):
-        """Envía el evento 'start_game' solo a los usuarios involucrados en la partida."""
-        game_data = event.get("game_data", {})
-        if game_data.get("player_1") == self.user.username or game_data.get("player_2") == self.user.username:
-            await self.send(text_data=json.dumps(event))
+        """Inicio de partida (solo llega a los grupos de los dos jugadores)."""
+        await self.send(text_data=json.dumps(event))
+
+    async def tournament_finished(self, event):
+        """Fin de un torneo del servidor (solo llega a quienes lo jugaron)."""
+        await self.send(text_data=json.dumps(event))
+
+    async def friend_update(self, event):
+        """Lista de amigos cambiada (ver AddFriendView/RemoveFriendView)."""
+        if self.friends is not None:
+            self.friends = set(event["friends"])
+        await self.send(text_data=json.dumps({"type": "friend_update", "friends": event["friends"]}))
 
     async def handle_cancel_invite(self, data):
         """Gestiona la cancelación de una invitación."""
         from_user = data["from"]
         to_user = data["to"]
-        await self.delete_invite(f"invite:{to_user}")
+        await self.delete_invite(to_user)
+        to_id = await self.get_user_id(to_user)
+        if to_id is None:
+            return
         await self.channel_layer.group_send(
-            "online_users",
+            user_group(to_id),
             {"type": "cancel_invite", "from": from_user, "to": to_user}
         )
 
     async def cancel_invite(self, event):
-        """Envía la notificación de cancelación solo al destinatario de la invitación."""
-        if event["to"] == self.user.username:
-            await self.send(text_data=json.dumps(event))
+        """Invitación cancelada (solo llega al grupo del destinatario)."""
+        await self.send(text_data=json.dumps(event))
 
-    async def send_online_users(self):
-        """Recupera y difunde la lista actualizada de usuarios online."""
-        users = await self.get_online_users()
-        await self.channel_layer.group_send(
-            "online_users", {"type": "update_users", "users": users}
-        )
+    async def handle_queue_join(self):
+        """
+        Entra en la cola de emparejamiento con su rating actual. Cuando se
+        encuentre rival llegará un 'start_game' como el de las invitaciones.
+        """
+        rating = await self.get_rating()
+        queued = await matchmaker.join(self.user.username, rating)
+        await self.send(text_data=json.dumps({
+            "type": "queue_status", "status": "queued", "rating": rating, "queued": queued,
+        }))
+
+    async def handle_queue_leave(self):
+        """Sale de la cola de emparejamiento."""
+        await matchmaker.leave(self.user.username)
+        await self.send(text_data=json.dumps({"type": "queue_status", "status": "left"}))
+
+    async def publish_presence(self, online):
+        """
+        Suma o resta esta conexión y difunde el cambio si el usuario pasa a
+        online/offline. Al restar, devuelve True si era su última conexión.
+        """
+        if online:
+            await presence.publish(await presence.connect(self.user.username))
+            return False
+        last, events = await presence.disconnect(self.user.username)
+        await presence.publish(events)
+        return last
 
-    async def update_users(self, event):
-        """Envía la lista actualizada de usuarios online al cliente actual."""
-        await self.send(text_data=json.dumps({"users": event["users"]}))
+    async def send_presence(self, since=None):
+        """Cambios desde la versión `since` del cliente o, si no, la lista completa."""
+        if since is not None:
+            try:
+                resumed = await presence.changes_since(int(since), self.friends)
+            except ValueError:
+                resumed = None
+            if resumed is not None:
+                version, events = resumed
+                await self.send(text_data=json.dumps({
+                    "type": "presence_delta", "version": version, "events": events,
+                }))
+                return
+        version, users = await presence.snapshot(self.friends)
+        await self.send(text_data=json.dumps({
+            "type": "presence_snapshot", "version": version, "users": users,
+        }))
+
+    async def presence_update(self, event):
+        """Eventos user_online/user_offline; con filtro de amigos, solo los suyos."""
+        events = event["events"]
+        if self.friends is not None:
+            events = [data for data in events if data["username"] in self.friends]
+        if len(events) == 1:
+            await self.send(text_data=json.dumps(events[0]))
+        elif events:
+            await self.send(text_data=json.dumps({
+                "type": "presence_delta", "version": events[-1]["version"], "events": events,
+            }))
+
+    def query_params(self):
+        query_string = self.scope["query_string"].decode()
+        return dict(q.split("=", 1) for q in query_string.split("&") if "=" in q)
 
     async def get_user_from_token(self):
         """
         Extrae y decodifica el token JWT de la query string para obtener el usuario.
         Retorna None si el token es inválido o ha expirado.
         """
-        query_string = self.scope["query_string"].decode()
-        params = dict(q.split("=") for q in query_string.split("&") if "=" in q)
-        token = params.get("token", None)
+        token = self.query_params().get("token", None)
         if not token:
             return None
         try:
@@ -154,34 +248,33 @@ class OnlineUsersConsumer(AsyncWebsocketConsumer):
         except (jwt.ExpiredSignatureError, jwt.DecodeError, User.DoesNotExist):
             return None
 
-    # Operaciones con Redis encapsuladas en funciones asíncronas
-
     @database_sync_to_async
-    def add_user(self, username):
-        """Añade un usuario al conjunto de usuarios online en Redis."""
-        redis_client.sadd("online_users", username)
+    def get_user_id(self, username):
+        return User.objects.filter(username=username).values_list("id", flat=True).first()
 
     @database_sync_to_async
-    def remove_user(self, username):
-        """Elimina un usuario del conjunto de usuarios online en Redis."""
-        redis_client.srem("online_users", username)
+    def get_friends(self):
+        return list(self.user.friends.values_list("username", flat=True))
 
     @database_sync_to_async
-    def get_online_users(self):
-        """Recupera la lista de usuarios online desde Redis."""
-        return list(redis_client.smembers("online_users"))
+    def get_rating(self):
+        """Rating actualizado del usuario (puede haber cambiado tras otra partida)."""
+        return User.objects.values_list("rating", flat=True).get(id=self.user.id)
 
-    @database_sync_to_async
-    def get_invite(self, key):
-        """Obtiene el valor de una invitación almacenada en Redis."""
-        return redis_client.get(key)
+    # Operaciones con Redis (cliente asíncrono, un viaje de ida y vuelta cada una)
 
-    @database_sync_to_async
-    def set_invite(self, key, value, ex):
-        """Establece una invitación en Redis con expiración."""
-        return redis_client.set(key, value, ex=ex)
+    async def set_invite(self, to_user, value):
+        """Guarda la invitación a `to_user` si no tiene ya una pendiente (SET NX)."""
+        return await get_redis().set(INVITE_KEY.format(username=to_user), value, ex=INVITE_TTL, nx=True)
 
-    @database_sync_to_async
-    def delete_invite(self, key):
-        """Elimina una invitación de Redis."""
-        return redis_client.delete(key)
+    async def take_invite(self, to_user):
+        """Lee y borra a la vez la invitación pendiente de `to_user`."""
+        async with get_redis().pipeline(transaction=True) as pipe:
+            pipe.get(INVITE_KEY.format(username=to_user))
+            pipe.delete(INVITE_KEY.format(username=to_user))
+            invite, _ = await pipe.execute()
+        return invite
+
+    async def delete_invite(self, to_user):
+        """Elimina la invitación pendiente de `to_user`."""
+        return await get_redis().delete(INVITE_KEY.format(username=to_user))
@@ -0,0 +1,22 @@
+"""
+Grupos del channel layer para los sockets de usuarios (OnlineUsersConsumer).
+
+Cada socket entra en ONLINE_GROUP (presencia) y en el grupo de su usuario,
+user_<id>: invitaciones, inicio de partidas y cambios de amigos se envían
+solo a los grupos de los usuarios implicados, no a todos los conectados.
+"""
+import asyncio
+
+ONLINE_GROUP = "online_users"
+
+
+def user_group(user_id):
+    return f"user_{user_id}"
+
+
+async def send_to_users(channel_layer, user_ids, event):
+    """Un group_send por usuario implicado (los repetidos o None se ignoran)."""
+    await asyncio.gather(*(
+        channel_layer.group_send(user_group(user_id), event)
+        for user_id in dict.fromkeys(user_ids) if user_id is not None
+    ))
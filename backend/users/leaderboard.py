@@ -0,0 +1,143 @@
+"""
+Puntuación Elo de los jugadores y clasificación en Redis.
+
+La puntuación (CustomUser.rating) se actualiza de forma incremental en el
+sumidero de resultados (pong/results.py), dentro de la misma transacción que
+guarda las partidas: ver apply(). Después, el sumidero la replica en Redis:
+
+    LEADERBOARD_KEY  ZSET  id de usuario -> rating
+    NAMES_KEY        HASH  id de usuario -> username
+
+Así la API de clasificación (top-N y "alrededor de mí") se sirve con
+ZREVRANGE/ZREVRANK, O(log N + k), sin consultar Postgres ni ordenar la
+tabla de usuarios. Los usuarios que aún no han jugado desde que existe la
+clasificación se cargan con `python manage.py rebuild_leaderboard`.
+"""
+from asgiref.sync import async_to_sync
+from django.contrib.auth import get_user_model
+
+from backend.redis_pool import get_redis
+
+User = get_user_model()
+
+LEADERBOARD_KEY = "leaderboard:rating"
+NAMES_KEY = "leaderboard:names"
+
+# Factor K de Elo: máximo de puntos que se ganan o pierden en una partida
+K_FACTOR = 32
+# Máximo de jugadores por página de la API y alrededor del propio jugador
+MAX_PAGE = 100
+MAX_RADIUS = 25
+# Usuarios leídos por consulta al reconstruir la clasificación
+REBUILD_BATCH = 1000
+
+
+def expected(rating, opponent):
+    """Probabilidad de ganar de `rating` contra `opponent` según Elo."""
+    return 1 / (1 + 10 ** ((opponent - rating) / 400))
+
+
+def apply(results):
+    """
+    Aplica en orden las partidas puntuables de un lote (se llama dentro de la
+    transacción de results.write_results) y devuelve
+    {user_id: (username, rating nuevo)} de los jugadores afectados.
+    """
+    user_ids = {user_id for result in results for user_id in (result.winner_id, result.loser_id)}
+    players = {
+        user_id: [username, rating]
+        for user_id, username, rating in User.objects.select_for_update()
+        .filter(id__in=user_ids).values_list("id", "username", "rating")
+    }
+    for result in results:
+        winner, loser = players.get(result.winner_id), players.get(result.loser_id)
+        if winner is None or loser is None:
+            continue
+        delta = round(K_FACTOR * (1 - expected(winner[1], loser[1])))
+        winner[1] += delta
+        loser[1] -= delta
+    return {user_id: tuple(player) for user_id, player in players.items()}
+
+
+# ======================================================
+#   Réplica en Redis
+# ======================================================
+async def update(players):
+    """Replica {user_id: (username, rating)} en la clasificación."""
+    if not players:
+        return
+    async with get_redis().pipeline(transaction=True) as pipe:
+        pipe.zadd(LEADERBOARD_KEY, {user_id: rating for user_id, (_, rating) in players.items()})
+        pipe.hset(NAMES_KEY, mapping={user_id: username for user_id, (username, _) in players.items()})
+        await pipe.execute()
+
+
+async def remove(user_id):
+    async with get_redis().pipeline(transaction=True) as pipe:
+        pipe.zrem(LEADERBOARD_KEY, user_id)
+        pipe.hdel(NAMES_KEY, user_id)
+        await pipe.execute()
+
+
+async def rename(user_id, username):
+    """Nuevo username de un jugador que ya está en la clasificación."""
+    redis = get_redis()
+    if await redis.hexists(NAMES_KEY, user_id):
+        await redis.hset(NAMES_KEY, user_id, username)
+
+
+async def page(start=0, count=20):
+    """Jugadores de las posiciones [start, start + count) y el total."""
+    redis = get_redis()
+    count = max(1, min(count, MAX_PAGE))
+    async with redis.pipeline(transaction=False) as pipe:
+        pipe.zrevrange(LEADERBOARD_KEY, start, start + count - 1, withscores=True)
+        pipe.zcard(LEADERBOARD_KEY)
+        entries, total = await pipe.execute()
+    return await _with_names(redis, entries, start), total
+
+
+async def around(user_id, radius=5):
+    """Posición del jugador (desde 0) y los `radius` de encima y de debajo."""
+    redis = get_redis()
+    rank = await redis.zrevrank(LEADERBOARD_KEY, user_id)
+    if rank is None:
+        return None, []
+    radius = max(0, min(radius, MAX_RADIUS))
+    start = max(0, rank - radius)
+    entries = await redis.zrevrange(LEADERBOARD_KEY, start, rank + radius, withscores=True)
+    return rank, await _with_names(redis, entries, start)
+
+
+async def _with_names(redis, entries, start):
+    if not entries:
+        return []
+    names = await redis.hmget(NAMES_KEY, [user_id for user_id, _ in entries])
+    return [
+        {"rank": start + offset + 1, "username": username, "rating": int(rating)}
+        for offset, ((_, rating), username) in enumerate(zip(entries, names))
+    ]
+
+
+def rebuild(batch_size=REBUILD_BATCH):
+    """
+    Vuelve a cargar la clasificación entera desde la BD (usuarios activos,
+    paginados por id). Devuelve cuántos jugadores se han cargado.
+    """
+    async_to_sync(_clear)()
+    loaded = 0
+    last_id = 0
+    while True:
+        batch = list(
+            User.objects.filter(is_active=True, id__gt=last_id)
+            .order_by("id").values_list("id", "username", "rating")[:batch_size]
+        )
+        if not batch:
+            return loaded
+        async_to_sync(update)({user_id: (username, rating) for user_id, username, rating in batch})
+        loaded += len(batch)
+        last_id = batch[-1][0]
+
+
+async def _clear():
+    await get_redis().delete(LEADERBOARD_KEY, NAMES_KEY)
@@ -0,0 +1,21 @@
+"""
+Carga en Redis la clasificación por rating desde la BD (ver users/leaderboard.py).
+
+Ejemplo:
+    python manage.py rebuild_leaderboard
+"""
+from django.core.management.base import BaseCommand
+
+from users import leaderboard
+
+
+class Command(BaseCommand):
+    help = "Reconstruye la clasificación de Redis a partir de los ratings de la BD"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--batch-size", type=int, default=leaderboard.REBUILD_BATCH,
+                            help="Usuarios leídos por consulta")
+
+    def handle(self, *args, **options):
+        loaded = leaderboard.rebuild(options["batch_size"])
+        self.stdout.write(self.style.SUCCESS(f"{loaded} jugadores cargados en la clasificación"))
@@ -0,0 +1,235 @@
+"""
+Cola de emparejamiento por puntuación (rating).
+
+Dos ZSET en Redis:
+    QUEUE_KEY    username -> rating
+    WAITING_KEY  username -> hora de entrada    (orden de espera)
+
+En cada pase (Matchmaker.run_pass) se leen una sola vez los BATCH jugadores
+que más llevan esperando con su rating, se ordenan por (rating, hora de
+entrada) y se emparejan vecinos cuya diferencia cabe en la ventana, que se
+ensancha con la espera:
+
+    ventana = BASE_WINDOW + WIDEN_PER_SECOND * segundos esperando  (máx. MAX_WINDOW)
+
+Los jugadores del lote sin latido de presencia reciente (presence.py: su
+worker se cayó sin pasar por disconnect) se sacan de la cola en ese mismo
+pase en lugar de emparejarse. El coste de un pase es O(BATCH log N), no depende del tamaño de la cola, y
+los empates de rating (todas las cuentas nuevas empiezan igual) no limitan
+cuántas parejas salen: un lote de BATCH jugadores empatados da BATCH / 2.
+
+Con varios workers cada uno corre su bucle, pero un lock en Redis (LOCK_KEY)
+hace que solo uno empareje en cada pase. Emparejar es sacar a los dos de la
+cola, generar el room_id y enviar el start_game (el mismo evento que al
+aceptar una invitación) a los grupos user_<id> de los dos jugadores.
+"""
+import asyncio
+import logging
+import time
+import uuid
+
+from channels.db import database_sync_to_async
+from channels.layers import get_channel_layer
+from django.contrib.auth import get_user_model
+from redis.exceptions import WatchError
+
+from backend.redis_pool import get_redis
+from . import presence
+from .groups import send_to_users
+
+User = get_user_model()
+
+QUEUE_KEY = "matchmaking:queue"
+WAITING_KEY = "matchmaking:waiting"
+LOCK_KEY = "matchmaking:lock"
+
+# Segundos entre pases y vida máxima del lock de un pase
+PASS_INTERVAL = 1.0
+LOCK_TTL = 5
+# Jugadores (los que más esperan) que se intentan emparejar por pase
+BATCH = 1000
+# Ventana de rating: inicial, ensanchamiento por segundo de espera y máximo
+BASE_WINDOW = 50
+WIDEN_PER_SECOND = 10
+MAX_WINDOW = 400
+
+
+def rating_window(waited):
+    """Diferencia de rating aceptable tras `waited` segundos en la cola."""
+    return min(MAX_WINDOW, BASE_WINDOW + WIDEN_PER_SECOND * max(0.0, waited))
+
+
+class Matchmaker:
+    """Cola de emparejamiento y bucle de pases de este worker."""
+
+    def __init__(self):
+        self.task = None
+
+    def ensure_running(self):
+        """Arranca el bucle de pases la primera vez que alguien entra en la cola."""
+        if self.task is None or self.task.done():
+            self.task = asyncio.create_task(self.run())
+
+    async def join(self, username, rating):
+        """Mete (o actualiza) al jugador en la cola; conserva su hora de entrada."""
+        async with get_redis().pipeline(transaction=True) as pipe:
+            pipe.zadd(QUEUE_KEY, {username: rating})
+            pipe.zadd(WAITING_KEY, {username: time.time()}, nx=True)
+            pipe.zcard(QUEUE_KEY)
+            *_, queued = await pipe.execute()
+        self.ensure_running()
+        return queued
+
+    async def leave(self, username):
+        async with get_redis().pipeline(transaction=True) as pipe:
+            pipe.zrem(QUEUE_KEY, username)
+            pipe.zrem(WAITING_KEY, username)
+            removed, _ = await pipe.execute()
+        return bool(removed)
+
+    async def run(self):
+        while True:
+            try:
+                await self.run_pass()
+            except Exception as e:
+                logging.warning(f"⚠️ Error en el pase de emparejamiento: {e}")
+            await asyncio.sleep(PASS_INTERVAL)
+
+    # ======================================================
+    #   Pase de emparejamiento
+    # ======================================================
+    async def run_pass(self):
+        """Empareja lo que pueda del lote actual. Devuelve el número de partidas."""
+        redis = get_redis()
+        token = uuid.uuid4().hex
+        if not await redis.set(LOCK_KEY, token, nx=True, ex=LOCK_TTL):
+            return 0
+        try:
+            pairs = await self.find_pairs(redis)
+            matched = await self.take_pairs(redis, pairs)
+        finally:
+            await self.release_lock(redis, token)
+
+        channel_layer = get_channel_layer()
+        user_ids = await user_ids_by_username([username for pair in matched for username in pair])
+        for player_1, player_2 in matched:
+            await self.start_game(channel_layer, player_1, player_2, user_ids)
+        if matched:
+            logging.info(f"🎯 Emparejamiento: {len(matched)} partidas creadas")
+        return len(matched)
+
+    async def find_pairs(self, redis):
+        waiting = await redis.zrange(WAITING_KEY, 0, BATCH - 1, withscores=True)
+        if len(waiting) < 2:
+            return []
+        usernames = [username for username, _ in waiting]
+        async with redis.pipeline(transaction=False) as pipe:
+            pipe.zmscore(QUEUE_KEY, usernames)
+            pipe.zmscore(presence.ONLINE_KEY, usernames)
+            ratings, seen = await pipe.execute()
+
+        # Sin latido reciente (su worker se cayó sin pasar por disconnect): fuera de la cola
+        cutoff = time.time() - presence.PRESENCE_TTL
+        gone = [username for username, last in zip(usernames, seen) if last is None or last < cutoff]
+        if gone:
+            async with redis.pipeline(transaction=True) as pipe:
+                pipe.zrem(QUEUE_KEY, *gone)
+                pipe.zrem(WAITING_KEY, *gone)
+                await pipe.execute()
+            logging.info(f"🧹 {len(gone)} jugadores sin conexión fuera de la cola")
+            gone = set(gone)
+            ratings = [None if username in gone else rating for username, rating in zip(usernames, ratings)]
+
+        # Ordenados por rating y, a igual rating, por antigüedad en la cola: el
+        # rival más cercano de cada uno es su vecino, aunque haya miles empatados
+        players = sorted(
+            (rating, joined, username)
+            for (username, joined), rating in zip(waiting, ratings)
+            if rating is not None
+        )
+        now = time.time()
+        pairs = []
+        index = 0
+        while index < len(players) - 1:
+            rating, joined, username = players[index]
+            rival_rating, rival_joined, rival = players[index + 1]
+            # Basta con que la ventana de uno de los dos (la del que más espera) lo cubra
+            window = rating_window(now - min(joined, rival_joined))
+            if rival_rating - rating <= window:
+                pairs.append((username, rival))
+                index += 2
+            else:
+                index += 1
+        return pairs
+
+    async def take_pairs(self, redis, pairs):
+        """
+        Saca de la cola a los emparejados. Quien se fue de la cola mientras
+        tanto (queue_leave no espera al lock) deshace su pareja, y el otro
+        vuelve a la cola con su rating y su hora de entrada.
+        """
+        if not pairs:
+            return []
+        usernames = [username for pair in pairs for username in pair]
+        ratings = await redis.zmscore(QUEUE_KEY, usernames)
+        joined = await redis.zmscore(WAITING_KEY, usernames)
+        async with redis.pipeline(transaction=True) as pipe:
+            for username in usernames:
+                pipe.zrem(QUEUE_KEY, username)
+            pipe.zrem(WAITING_KEY, *usernames)
+            removed = (await pipe.execute())[:-1]
+
+        matched = []
+        restore = {}
+        for index, pair in enumerate(pairs):
+            present = removed[2 * index: 2 * index + 2]
+            if all(present):
+                matched.append(pair)
+                continue
+            for offset, username in enumerate(pair):
+                if present[offset] and ratings[2 * index + offset] is not None:
+                    restore[username] = 2 * index + offset
+        if restore:
+            async with redis.pipeline(transaction=True) as pipe:
+                pipe.zadd(QUEUE_KEY, {username: ratings[i] for username, i in restore.items()})
+                pipe.zadd(WAITING_KEY, {username: joined[i] or time.time() for username, i in restore.items()})
+                await pipe.execute()
+        return matched
+
+    async def release_lock(self, redis, token):
+        """Borra el lock solo si sigue siendo nuestro (no expiró y lo tomó otro)."""
+        async with redis.pipeline(transaction=True) as pipe:
+            try:
+                await pipe.watch(LOCK_KEY)
+                if await pipe.get(LOCK_KEY) == token:
+                    pipe.multi()
+                    pipe.delete(LOCK_KEY)
+                    await pipe.execute()
+            except WatchError:
+                pass
+
+    async def start_game(self, channel_layer, player_1, player_2, user_ids):
+        """Crea la sala y envía el start_game solo a los dos jugadores."""
+        room_id = str(uuid.uuid4())
+        await send_to_users(channel_layer, (user_ids.get(player_1), user_ids.get(player_2)), {
+            "type": "start_game",
+            "game_data": {
+                "from": player_1,
+                "to": player_2,
+                "room": room_id,
+                "player_1": player_1,
+                "player_2": player_2,
+                "matchmaking": True,
+            },
+        })
+
+
+matchmaker = Matchmaker()
+
+
+@database_sync_to_async
+def user_ids_by_username(usernames):
+    """{username: id} de los emparejados de un pase, en una sola consulta."""
+    if not usernames:
+        return {}
+    return dict(User.objects.filter(username__in=usernames).values_list("username", "id"))
@@ -0,0 +1,30 @@
+# Generated by Django 5.2.18 on 2026-10-18 09:20
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('users', '0002_customuser_rating'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='matchhistory',
+            name='mode',
+            field=models.CharField(choices=[('online', 'Online'), ('ai', 'Contra la IA')], default='online', max_length=10),
+        ),
+        migrations.AddField(
+            model_name='matchhistory',
+            name='replay',
+            field=models.FileField(blank=True, null=True, upload_to='replays/'),
+        ),
+        migrations.AlterField(
+            model_name='matchhistory',
+            name='player2',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='matches_as_player2', to=settings.AUTH_USER_MODEL),
+        ),
+    ]
@@ -11,6 +11,8 @@ class CustomUser(AbstractUser):
     # Campos adicionales
     wins = models.IntegerField(default=0)
     losses = models.IntegerField(default=0)
+    # Puntuación del jugador para el emparejamiento (ver users/matchmaking.py)
+    rating = models.IntegerField(default=1000)
     info = models.TextField(
         blank=True,
         default='',
@@ -26,15 +28,27 @@ class CustomUser(AbstractUser):
         return self.username
 
 class MatchHistory(models.Model):
+    ONLINE = "online"
+    AI = "ai"
+    MODE_CHOICES = [(ONLINE, "Online"), (AI, "Contra la IA")]
+
     player1 = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE, related_name="matches_as_player1")
-    player2 = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE, related_name="matches_as_player2")
+    # Vacío en las partidas contra la IA
+    player2 = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE, null=True, blank=True, related_name="matches_as_player2")
     score1 = models.IntegerField()
     score2 = models.IntegerField()
     winner = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.SET_NULL, null=True, blank=True, related_name="matches_won")
+    mode = models.CharField(max_length=10, choices=MODE_CHOICES, default=ONLINE)
+    # Grabación de la partida (ver pong/replay.py); se escribe una vez al acabar
+    replay = models.FileField(upload_to="replays/", null=True, blank=True)
     played_at = models.DateTimeField(auto_now_add=True)
 
+    @property
+    def player2_name(self):
+        return self.player2.username if self.player2 else "IA"
+
     def __str__(self):
-        return f"{self.player1.username} vs {self.player2.username} ({self.score1} - {self.score2})"
+        return f"{self.player1.username} vs {self.player2_name} ({self.score1} - {self.score2})"
 
 class PendingRegistration(models.Model):
     username = models.CharField(max_length=150, unique=True)
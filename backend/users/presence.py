@@ -0,0 +1,242 @@
+"""
+Presencia de usuarios online con versiones.
+
+En lugar de difundir la lista completa de usuarios en cada conexión y
+desconexión (O(N) bytes a N sockets), cada cambio es un evento pequeño
+(user_online / user_offline) con un número de versión creciente. Un socket
+recibe la lista completa una sola vez al conectar y luego solo los eventos.
+
+En Redis:
+    ONLINE_KEY       ZSET  username -> hora del último latido
+    CONNECTIONS_KEY  STR   sockets abiertos del usuario (en todos los workers)
+    VERSION_KEY      STR   versión actual (INCRBY en cada cambio)
+    LOG_KEY          ZSET  "versión:+username" / "versión:-username" -> versión,
+                           los últimos LOG_SIZE cambios
+
+Un usuario con varias pestañas pasa a offline cuando se cierra la última
+(contador de conexiones), no con la primera. Cada worker renueva cada
+HEARTBEAT_INTERVAL la hora de los usuarios que tiene conectados, en un solo
+pipeline (Heartbeat.beat()); si un worker se cae sin pasar por disconnect,
+sus usuarios dejan de renovarse y el barrido (sweep()) los saca a todos de
+una vez con ZREMRANGEBYSCORE tras PRESENCE_TTL segundos. Ningún worker
+recorre el conjunto entero: el barrido solo lee el rango caducado.
+
+Un cliente que reconecta con ?since=<versión> recibe solo los cambios que
+se ha perdido, si siguen en el log; si no, la lista completa.
+"""
+import asyncio
+import logging
+import time
+from collections import Counter
+
+from channels.layers import get_channel_layer
+from django.conf import settings
+from redis.exceptions import WatchError
+
+from backend.redis_pool import get_redis
+from .groups import ONLINE_GROUP
+
+ONLINE_KEY = "presence:online"
+CONNECTIONS_KEY = "presence:connections:{username}"
+VERSION_KEY = "presence:version"
+LOG_KEY = "presence:log"
+
+# Cambios que se guardan para reanudar por versión
+LOG_SIZE = 1000
+# Segundos sin latido tras los que un usuario pasa a offline
+PRESENCE_TTL = getattr(settings, "PRESENCE_TTL", 30)
+# Segundos entre latidos (y barridos) de cada worker
+HEARTBEAT_INTERVAL = PRESENCE_TTL / 3
+
+
+class Heartbeat:
+    """Usuarios conectados a este worker y su latido periódico."""
+
+    def __init__(self):
+        # username -> sockets abiertos en este worker
+        self.connections = Counter()
+        self.task = None
+
+    def ensure_running(self):
+        """Arranca el bucle la primera vez que se conecta un usuario."""
+        if self.task is None or self.task.done():
+            self.task = asyncio.create_task(self.run())
+
+    async def run(self):
+        while True:
+            await asyncio.sleep(HEARTBEAT_INTERVAL)
+            try:
+                await publish(await self.beat() + await sweep())
+            except Exception as e:
+                logging.warning(f"⚠️ Error en el latido de presencia: {e}")
+
+    async def beat(self):
+        """Renueva la hora de los usuarios de este worker; devuelve sus eventos si alguno había caducado."""
+        usernames = list(self.connections)
+        if not usernames:
+            return []
+        now = time.time()
+        redis = get_redis()
+        async with redis.pipeline(transaction=False) as pipe:
+            for username in usernames:
+                pipe.zadd(ONLINE_KEY, {username: now})
+            added = await pipe.execute()
+        # Barridos aunque siguen conectados (el worker estuvo parado más de
+        # PRESENCE_TTL): vuelven a estar online con las conexiones de aquí
+        revived = [username for username, new in zip(usernames, added) if new]
+        if not revived:
+            return []
+        async with redis.pipeline(transaction=False) as pipe:
+            for username in revived:
+                pipe.incrby(CONNECTIONS_KEY.format(username=username), self.connections[username])
+            await pipe.execute()
+        return await record(redis, [(username, True) for username in revived])
+
+
+heartbeat = Heartbeat()
+
+
+async def connect(username):
+    """Suma una conexión del usuario; devuelve el evento si acaba de pasar a online."""
+    redis = get_redis()
+    async with redis.pipeline(transaction=True) as pipe:
+        pipe.incr(CONNECTIONS_KEY.format(username=username))
+        pipe.zadd(ONLINE_KEY, {username: time.time()})
+        _, added = await pipe.execute()
+    # Después de Redis: un latido a medias no puede contarla dos veces
+    heartbeat.connections[username] += 1
+    if not added:
+        return []
+    return await record(redis, [(username, True)])
+
+
+async def disconnect(username):
+    """
+    Resta una conexión. Devuelve (True si era la última del usuario, eventos):
+    con la última pasa a offline, salvo que el barrido ya lo hubiera sacado.
+    """
+    heartbeat.connections[username] -= 1
+    if heartbeat.connections[username] <= 0:
+        del heartbeat.connections[username]
+    redis = get_redis()
+    key = CONNECTIONS_KEY.format(username=username)
+    # WATCH del contador: una pestaña que conecta a la vez no se queda offline
+    async with redis.pipeline(transaction=True) as pipe:
+        while True:
+            try:
+                await pipe.watch(key)
+                connections = int(await pipe.get(key) or 0) - 1
+                pipe.multi()
+                if connections > 0:
+                    pipe.set(key, connections)
+                else:
+                    pipe.delete(key)
+                    pipe.zrem(ONLINE_KEY, username)
+                results = await pipe.execute()
+                break
+            except WatchError:
+                continue
+    if connections > 0:
+        return False, []
+    # El barrido puede haberlo sacado ya (y enviado su evento)
+    if not results[-1]:
+        return True, []
+    return True, await record(redis, [(username, False)])
+
+
+async def sweep():
+    """Saca de una vez a los usuarios sin latido reciente y devuelve sus eventos."""
+    redis = get_redis()
+    cutoff = time.time() - PRESENCE_TTL
+    # Leer y borrar el rango en la misma transacción: si varios workers barren
+    # a la vez, cada usuario caducado lo devuelve solo uno de ellos
+    async with redis.pipeline(transaction=True) as pipe:
+        pipe.zrangebyscore(ONLINE_KEY, "-inf", cutoff)
+        pipe.zremrangebyscore(ONLINE_KEY, "-inf", cutoff)
+        expired, _ = await pipe.execute()
+    if not expired:
+        return []
+    await redis.delete(*(CONNECTIONS_KEY.format(username=username) for username in expired))
+    logging.info(f"🧹 {len(expired)} usuarios sin latido pasan a offline")
+    return await record(redis, [(username, False) for username in expired])
+
+
+async def record(redis, changes):
+    """Numera los cambios [(username, online)], los añade al log y devuelve sus eventos."""
+    last = await redis.incrby(VERSION_KEY, len(changes))
+    events = [
+        event(username, online, version)
+        for version, (username, online) in enumerate(changes, last - len(changes) + 1)
+    ]
+    # Puntuación = versión: el log queda ordenado aunque dos cambios se escriban cruzados
+    async with redis.pipeline(transaction=False) as pipe:
+        pipe.zadd(LOG_KEY, {
+            f"{data['version']}:{'+' if online else '-'}{username}": data["version"]
+            for data, (username, online) in zip(events, changes)
+        })
+        pipe.zremrangebyrank(LOG_KEY, 0, -LOG_SIZE - 1)
+        await pipe.execute()
+    return events
+
+
+async def publish(events):
+    """Difunde los eventos a los sockets online en un solo mensaje del grupo."""
+    if events:
+        await get_channel_layer().group_send(ONLINE_GROUP, {
+            "type": "presence_update",
+            "events": events,
+        })
+
+
+async def snapshot(friends=None):
+    """(versión, usernames online), solo entre `friends` si se indica."""
+    redis = get_redis()
+    cutoff = time.time() - PRESENCE_TTL
+    if friends is not None:
+        friends = list(friends)
+    async with redis.pipeline(transaction=True) as pipe:
+        pipe.get(VERSION_KEY)
+        if friends is None:
+            pipe.zrangebyscore(ONLINE_KEY, cutoff, "+inf")
+        elif friends:
+            pipe.zmscore(ONLINE_KEY, friends)
+        results = await pipe.execute()
+    version = int(results[0] or 0)
+    if friends is None:
+        return version, list(results[1])
+    if not friends:
+        return version, []
+    return version, [
+        username for username, seen in zip(friends, results[1])
+        if seen is not None and seen >= cutoff
+    ]
+
+
+async def changes_since(version, friends=None):
+    """
+    (versión actual, eventos desde `version`) o None si el log ya no los
+    cubre todos y hace falta la lista completa.
+    """
+    redis = get_redis()
+    async with redis.pipeline(transaction=True) as pipe:
+        pipe.get(VERSION_KEY)
+        pipe.zrangebyscore(LOG_KEY, f"({version}", "+inf")
+        current, entries = await pipe.execute()
+    current = int(current or 0)
+    if version > current or len(entries) != current - version:
+        return None
+    events = []
+    for entry in entries:
+        entry_version, change = entry.split(":", 1)
+        username = change[1:]
+        if friends is None or username in friends:
+            events.append(event(username, change[0] == "+", int(entry_version)))
+    return current, events
+
+
+def event(username, online, version):
+    return {
+        "type": "user_online" if online else "user_offline",
+        "username": username,
+        "version": version,
+    }
@@ -34,12 +34,13 @@ class UserSerializer(serializers.ModelSerializer):
         model = User
         fields = [
             'id', 'username', 'password', 'email', 'avatar',
-            'wins', 'losses', 'info', 'friends', 'blocked_friends'
+            'wins', 'losses', 'rating', 'info', 'friends', 'blocked_friends'
         ]
         extra_kwargs = {
             'password': {'write_only': True, 'required': True},
             'wins': {'read_only': True},
             'losses': {'read_only': True},
+            'rating': {'read_only': True},
             'email': {'required': True},
             'info': {'required': False},
         }
@@ -1,3 +1,93 @@
-from django.test import TestCase
+import time
+import unittest
+from unittest import mock
 
-# Create your tests here.
+from django.test import SimpleTestCase
+
+from . import presence
+from .matchmaking import QUEUE_KEY, WAITING_KEY, Matchmaker
+
+try:
+    from fakeredis import aioredis as fakeredis
+except ImportError:
+    fakeredis = None
+
+
+@unittest.skipIf(fakeredis is None, "fakeredis no está instalado")
+class MatchmakingTests(SimpleTestCase):
+    """Emparejamiento por rating (matchmaking.py) sobre un Redis en memoria."""
+
+    def setUp(self):
+        self.redis = fakeredis.FakeRedis(decode_responses=True)
+        for module in ("matchmaking", "presence"):
+            patcher = mock.patch(f"users.{module}.get_redis", return_value=self.redis)
+            patcher.start()
+            self.addCleanup(patcher.stop)
+        self.matchmaker = Matchmaker()
+        self.matchmaker.ensure_running = lambda: None
+
+    async def join(self, username, rating, seen=None):
+        """Entra en la cola con un latido de presencia (ahora por defecto)."""
+        await self.redis.zadd(presence.ONLINE_KEY, {username: seen or time.time()})
+        await self.matchmaker.join(username, rating)
+
+    async def test_players_tied_on_rating_are_all_paired(self):
+        usernames = [f"new{i}" for i in range(300)]
+        for username in usernames:
+            await self.join(username, 1000)
+
+        pairs = await self.matchmaker.find_pairs(self.redis)
+        matched = await self.matchmaker.take_pairs(self.redis, pairs)
+
+        self.assertEqual(len(matched), 150)
+        self.assertCountEqual([username for pair in matched for username in pair], usernames)
+        self.assertEqual(await self.redis.zcard(QUEUE_KEY), 0)
+        self.assertEqual(await self.redis.zcard(WAITING_KEY), 0)
+
+    async def test_rating_window_widens_with_waiting_time(self):
+        await self.join("low", 1000)
+        await self.join("high", 1300)
+        self.assertEqual(await self.matchmaker.find_pairs(self.redis), [])
+
+        await self.redis.zadd(WAITING_KEY, {"low": time.time() - 60})
+        self.assertEqual(await self.matchmaker.find_pairs(self.redis), [("low", "high")])
+
+    async def test_nearest_rating_is_paired_first(self):
+        for username, rating in (("a", 1000), ("b", 1200), ("c", 1010), ("d", 1190)):
+            await self.join(username, rating)
+        pairs = await self.matchmaker.find_pairs(self.redis)
+        self.assertCountEqual(pairs, [("a", "c"), ("d", "b")])
+
+    async def test_players_without_heartbeat_leave_the_queue(self):
+        await self.join("live", 1000)
+        await self.join("ghost", 1000, seen=time.time() - 10 * presence.PRESENCE_TTL)
+        await self.matchmaker.join("unknown", 1000)
+
+        self.assertEqual(await self.matchmaker.find_pairs(self.redis), [])
+        self.assertEqual(await self.redis.zrange(QUEUE_KEY, 0, -1), ["live"])
+        self.assertEqual(await self.redis.zrange(WAITING_KEY, 0, -1), ["live"])
+
+
+@unittest.skipIf(fakeredis is None, "fakeredis no está instalado")
+class PresenceTests(SimpleTestCase):
+    """Contador de conexiones por usuario (presence.py)."""
+
+    def setUp(self):
+        self.redis = fakeredis.FakeRedis(decode_responses=True)
+        patcher = mock.patch("users.presence.get_redis", return_value=self.redis)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.addCleanup(presence.heartbeat.connections.clear)
+
+    async def test_user_goes_offline_with_last_connection(self):
+        online = await presence.connect("alice")
+        self.assertEqual([event["type"] for event in online], ["user_online"])
+        self.assertEqual(await presence.connect("alice"), [])
+
+        self.assertEqual(await presence.disconnect("alice"), (False, []))
+        self.assertIsNotNone(await self.redis.zscore(presence.ONLINE_KEY, "alice"))
+
+        last, events = await presence.disconnect("alice")
+        self.assertTrue(last)
+        self.assertEqual([event["type"] for event in events], ["user_offline"])
+        self.assertIsNone(await self.redis.zscore(presence.ONLINE_KEY, "alice"))
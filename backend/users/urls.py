@@ -1,5 +1,5 @@
 from django.urls import path, include
-from .views import RegisterView, LoginView, UserDetailView, OnlineUsersView, UserUpdateView, UserDetailView, UserDeleteView, AddFriendView, RemoveFriendView, BlockFriendView, UnblockFriendView, update_my_stat, MatchHistoryView, SaveMatchView,  PublicUserProfileView, VerifyCodeView, LoginVerifyView
+from .views import RegisterView, LoginView, UserDetailView, OnlineUsersView, UserUpdateView, UserDetailView, UserDeleteView, AddFriendView, RemoveFriendView, BlockFriendView, UnblockFriendView, MatchHistoryView, LeaderboardView, LeaderboardAroundView, PublicUserProfileView, VerifyCodeView, LoginVerifyView
 from backend.views import pong_room
 
 urlpatterns = [
@@ -15,9 +15,9 @@ urlpatterns = [
     path('remove-friend/', RemoveFriendView.as_view(), name='remove-friend'),
     path('block-friend/', BlockFriendView.as_view(), name='block-friend'),
     path('unblock-friend/', UnblockFriendView.as_view(), name='unblock-friend'),
-    path("update_my_stat/", update_my_stat, name="update_my_stat"),
     path("match_history/", MatchHistoryView.as_view(), name="match_history"),
-    path("save_match/", SaveMatchView.as_view(), name="save_match"),
+    path("leaderboard/", LeaderboardView.as_view(), name="leaderboard"),
+    path("leaderboard/me/", LeaderboardAroundView.as_view(), name="leaderboard-me"),
     path('profile/<str:username>/', PublicUserProfileView.as_view(), name='user_profile'),
     path('me/', UserDetailView.as_view(), name='user-detail'),
     #path('online-users/', OnlineUsersView.as_view(), name='online-users'),  # Nueva ruta
@@ -5,6 +5,7 @@ from django.core.mail import send_mail
 from django.contrib.auth.hashers import make_password
 from django.utils import timezone
 from datetime import timedelta
+import logging
 import random
 
 from rest_framework import generics, permissions, status
@@ -15,10 +16,11 @@ from rest_framework.views import APIView
 from rest_framework.parsers import MultiPartParser, FormParser
 from asgiref.sync import async_to_sync
 from channels.layers import get_channel_layer
-from rest_framework.decorators import api_view, permission_classes
 
 from .serializers import UserSerializer, LoginSerializer
 from .models import MatchHistory, PendingRegistration
+from . import leaderboard
+from .groups import user_group
 
 User = get_user_model()
 
@@ -275,9 +277,15 @@ class UserUpdateView(generics.UpdateAPIView):
     def update(self, request, *args, **kwargs):
         partial = True
         instance = self.get_object()
+        old_username = instance.username
         serializer = self.get_serializer(instance, data=request.data, partial=partial)
         serializer.is_valid(raise_exception=True)
         self.perform_update(serializer)
+        if instance.username != old_username:
+            try:
+                async_to_sync(leaderboard.rename)(instance.id, instance.username)
+            except Exception as e:
+                logging.warning(f"⚠️ No se pudo renombrar en la clasificación: {e}")
         return Response(serializer.data)
 
 class UserDeleteView(APIView):
@@ -285,7 +293,12 @@ class UserDeleteView(APIView):
 
     def delete(self, request):
         user = request.user
+        user_id = user.id
         user.delete()
+        try:
+            async_to_sync(leaderboard.remove)(user_id)
+        except Exception as e:
+            logging.warning(f"⚠️ No se pudo quitar de la clasificación: {e}")
         return Response({"message": "Usuario eliminado exitosamente."}, status=status.HTTP_200_OK)
 
 class AddFriendView(APIView):
@@ -306,7 +319,7 @@ class AddFriendView(APIView):
         request.user.friends.add(friend)
         channel_layer = get_channel_layer()
         async_to_sync(channel_layer.group_send)(
-            f"user_{friend.id}",
+            user_group(friend.id),
             {
                 "type": "friend.update",
                 "friends": list(friend.friends.values_list("username", flat=True))
@@ -333,7 +346,7 @@ class RemoveFriendView(APIView):
         friend.friends.remove(request.user)
         channel_layer = get_channel_layer()
         async_to_sync(channel_layer.group_send)(
-            f"user_{friend.id}",
+            user_group(friend.id),
             {
                 "type": "friend.update",
                 "friends": list(friend.friends.values_list("username", flat=True))
@@ -403,40 +416,53 @@ class MatchHistoryView(APIView):
 
     def get(self, request):
         user = request.user
-        matches = MatchHistory.objects.filter(models.Q(player1=user) | models.Q(player2=user)).order_by('-played_at')
+        matches = MatchHistory.objects.filter(
+            models.Q(player1=user) | models.Q(player2=user)
+        ).select_related("player1", "player2", "winner").order_by('-played_at')
         data = [{
+            "id": m.id,
             "player1": m.player1.username,
-            "player2": m.player2.username,
+            "player2": m.player2_name,
             "score1": m.score1,
             "score2": m.score2,
-            "winner": m.winner.username if m.winner else "Desconocido",
+            "winner": m.winner.username if m.winner else ("IA" if m.mode == MatchHistory.AI else "Desconocido"),
+            "mode": m.mode,
+            "has_replay": bool(m.replay),
             "played_at": m.played_at.strftime("%Y-%m-%d %H:%M")
         } for m in matches]
         return Response(data)
 
-class SaveMatchView(APIView):
+class LeaderboardView(APIView):
+    """
+    GET ?start=0&count=20 => clasificación por rating, paginada. Se sirve
+    desde Redis (ver users/leaderboard.py), sin consultar la BD.
+    """
     permission_classes = [IsAuthenticated]
 
-    def post(self, request):
-        data = request.data
+    def get(self, request):
         try:
-            player1 = User.objects.get(username=data["player1"])
-            player2 = User.objects.get(username=data["player2"])
-            winner = User.objects.get(username=data["winner"]) if data["winner"] else None
-
-            MatchHistory.objects.create(
-                player1=player1,
-                player2=player2,
-                score1=data["score1"],
-                score2=data["score2"],
-                winner=winner
-            )
-            return Response({"message": "Partida guardada correctamente."}, status=201)
+            start = max(0, int(request.query_params.get("start", 0)))
+            count = int(request.query_params.get("count", 20))
+        except ValueError:
+            return Response({"error": "'start' y 'count' deben ser enteros."}, status=status.HTTP_400_BAD_REQUEST)
+        results, total = async_to_sync(leaderboard.page)(start, count)
+        return Response({"start": start, "total": total, "results": results})
+
+class LeaderboardAroundView(APIView):
+    """GET ?radius=5 => posición del usuario y los jugadores que tiene alrededor."""
+    permission_classes = [IsAuthenticated]
 
-        except User.DoesNotExist:
-            return Response({"error": "Uno de los usuarios no existe."}, status=400)
-        except Exception as e:
-            return Response({"error": str(e)}, status=400)
+    def get(self, request):
+        try:
+            radius = int(request.query_params.get("radius", 5))
+        except ValueError:
+            return Response({"error": "'radius' debe ser un entero."}, status=status.HTTP_400_BAD_REQUEST)
+        rank, results = async_to_sync(leaderboard.around)(request.user.id, radius)
+        return Response({
+            "rank": rank + 1 if rank is not None else None,
+            "rating": request.user.rating,
+            "results": results,
+        })
 
 class PublicUserProfileView(APIView):
     permission_classes = [IsAuthenticated]
@@ -445,18 +471,3 @@ class PublicUserProfileView(APIView):
         user = get_object_or_404(User, username=username)
         serializer = UserSerializer(user)
         return Response(serializer.data)
-
-@api_view(["POST"])
-@permission_classes([IsAuthenticated])
-def update_my_stat(request):
-    stat = request.data.get("stat")
-    if stat == "win":
-        request.user.wins = (request.user.wins or 0) + 1
-        request.user.save()
-        return Response({"message": "Victoria sumada."})
-    elif stat == "loss":
-        request.user.losses = (request.user.losses or 0) + 1
-        request.user.save()
-        return Response({"message": "Derrota sumada."})
-    else:
-        return Response({"error": "Tipo de estadística inválido."}, status=400)
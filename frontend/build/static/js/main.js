@@ -17,6 +17,7 @@ const WS_BASE_URL = (window.location.protocol === "https:" ? "wss" : "ws")
 let userSocket = null;      // WS para usuarios online
 let pongSocket = null;      // WS para la partida
 let globalOnlineUsers = []; // Lista global de usuarios online
+let presenceVersion = null; // Última versión de presencia recibida (para reanudar)
 let currentFriendsViewContext = "chat"; // Contexto actual de la vista de amigos ("chat" o "friends")
 let globalBlockedUsers = [];
 let chatHistoryIntervalId = null;
@@ -36,7 +37,7 @@ window.tournamentHandleKeyDown = function(e) {
     message = { type: "paddle_input", paddle: "right", speed: 3 };
   }
   if (message && window.tournamentLocalSocket.readyState === WebSocket.OPEN) {
-    window.tournamentLocalSocket.send(JSON.stringify(message));
+    sendPongInput(window.tournamentLocalSocket, message);
   }
 };
 
@@ -49,7 +50,7 @@ window.tournamentHandleKeyUp = function(e) {
     message = { type: "paddle_input", paddle: "right", speed: 0 };
   }
   if (message && window.tournamentLocalSocket.readyState === WebSocket.OPEN) {
-    window.tournamentLocalSocket.send(JSON.stringify(message));
+    sendPongInput(window.tournamentLocalSocket, message);
   }
 };
 
@@ -106,6 +107,123 @@ function getHashQueryParam(param) {
   return urlParams.get(param);
 }
 
+/****************************************************
+ * PROTOCOLO BINARIO DE FRAMES (ver backend/pong/protocol.py)
+ ****************************************************/
+const PONG_BINARY_PROTOCOL = "pong.bin.v1";
+const FRAME_FLAG_PADDLES = 0x01;
+const FRAME_FLAG_SCORES = 0x02;
+const FRAME_FLAG_ACKS = 0x08;
+const FRAME_SCALE = 100;
+
+// Decodifica un frame binario "game_update". Palas, marcador y acks solo
+// vienen cuando cambian, así que pueden quedar undefined.
+function decodePongFrame(buffer) {
+  const view = new DataView(buffer);
+  const flags = view.getUint8(1);
+  const frame = {
+    type: "game_update",
+    seq: view.getUint32(2, true),
+    tick: view.getUint32(6, true),
+    t: view.getUint32(10, true),
+    ball_x: view.getInt16(14, true) / FRAME_SCALE,
+    ball_y: view.getInt16(16, true) / FRAME_SCALE,
+  };
+  let offset = 18;
+  if (flags & FRAME_FLAG_PADDLES) {
+    frame.paddle_left = view.getInt16(offset, true) / FRAME_SCALE;
+    frame.paddle_right = view.getInt16(offset + 2, true) / FRAME_SCALE;
+    offset += 4;
+  }
+  if (flags & FRAME_FLAG_SCORES) {
+    frame.score_left = view.getUint8(offset);
+    frame.score_right = view.getUint8(offset + 1);
+    offset += 2;
+  }
+  if (flags & FRAME_FLAG_ACKS) {
+    frame.ack_left = view.getUint32(offset, true);
+    frame.ack_right = view.getUint32(offset + 4, true);
+  }
+  return frame;
+}
+
+/****************************************************
+ * ENTRADAS SECUENCIADAS
+ ****************************************************/
+// Numera cada entrada de pala ("seq", creciente por socket). El servidor las
+// aplica una vez por tick y devuelve en los frames el último seq aplicado.
+function sendPongInput(socket, message) {
+  socket.inputSeq = (socket.inputSeq || 0) + 1;
+  message.seq = socket.inputSeq;
+  socket.send(JSON.stringify(message));
+  return message.seq;
+}
+
+/****************************************************
+ * INTERPOLACIÓN DE SNAPSHOTS
+ ****************************************************/
+// El servidor simula a más frecuencia de la que envía snapshots; cada uno
+// lleva su tick y su marca de tiempo "t" (ms). Se pinta con un pequeño
+// retraso interpolando entre los dos snapshots que rodean ese instante.
+const SNAPSHOT_RENDER_DELAY_MS = 100;
+const SNAPSHOT_BUFFER_SIZE = 32;
+// Saltos mayores (saque tras un gol) no se interpolan
+const SNAPSHOT_MAX_JUMP = 25;
+
+function createSnapshotBuffer() {
+  return { snapshots: [], offset: null };
+}
+
+// Guarda un snapshot; las palas que no vengan (frames binarios parciales)
+// se copian del anterior.
+function pushSnapshot(buffer, data) {
+  if (data.t === undefined) return;
+  const snaps = buffer.snapshots;
+  const last = snaps[snaps.length - 1];
+  if (last && data.t < last.t) {
+    // Reloj del servidor reiniciado (otra partida / otro worker)
+    snaps.length = 0;
+    buffer.offset = null;
+  }
+  const prev = snaps[snaps.length - 1];
+  snaps.push({
+    t: data.t,
+    ball_x: data.ball_x,
+    ball_y: data.ball_y,
+    paddle_left: data.paddle_left !== undefined ? data.paddle_left : (prev ? prev.paddle_left : 50),
+    paddle_right: data.paddle_right !== undefined ? data.paddle_right : (prev ? prev.paddle_right : 50),
+  });
+  if (snaps.length > SNAPSHOT_BUFFER_SIZE) snaps.shift();
+
+  // Desfase entre el reloj local y el del servidor: el menor observado (el
+  // snapshot que menos tardó en llegar), dejando que suba despacio por deriva
+  const offset = performance.now() - data.t;
+  buffer.offset = (buffer.offset === null) ? offset : Math.min(offset, buffer.offset + 0.5);
+}
+
+// Devuelve {ball_x, ball_y, paddle_left, paddle_right} para el instante de
+// render actual, o null si aún no hay snapshots.
+function sampleSnapshot(buffer) {
+  const snaps = buffer.snapshots;
+  if (!snaps.length) return null;
+  const renderT = performance.now() - buffer.offset - SNAPSHOT_RENDER_DELAY_MS;
+  while (snaps.length > 2 && snaps[1].t <= renderT) snaps.shift();
+
+  const a = snaps[0];
+  const b = snaps[1];
+  if (!b || renderT <= a.t) return a;
+  if (renderT >= b.t || Math.abs(b.ball_x - a.ball_x) > SNAPSHOT_MAX_JUMP) return b;
+
+  const k = (renderT - a.t) / (b.t - a.t);
+  const lerp = (from, to) => from + (to - from) * k;
+  return {
+    ball_x: lerp(a.ball_x, b.ball_x),
+    ball_y: lerp(a.ball_y, b.ball_y),
+    paddle_left: lerp(a.paddle_left, b.paddle_left),
+    paddle_right: lerp(a.paddle_right, b.paddle_right),
+  };
+}
+
 /****************************************************
  * FUNCIONES ADICIONALES PARA CIERRE DE WS
  ****************************************************/
@@ -243,6 +361,7 @@ function router() {
   const token = usernametoken ? getToken(usernametoken) : null;
 
   cleanupTournamentSocket();
+  stopReplayPlayback();
   updateNavbarVisibility(!!token);
 
   // Cierra el WS de Pong online, si existe
@@ -278,6 +397,16 @@ function router() {
     return;
   }
 
+  if (hash.startsWith("replay")) {
+    renderReplayView(getHashQueryParam("match"));
+    return;
+  }
+
+  if (hash.startsWith("spectate")) {
+    renderSpectateView(getHashQueryParam("room"));
+    return;
+  }
+
   if (hash.startsWith("chat")) {
     const params = getHashQueryParams();
     if (params.friend) {
@@ -877,6 +1006,7 @@ function renderSettingsView() {
             <small class="text-muted">
               Ganador: ${m.winner} | ${new Date(m.played_at).toLocaleString()}
             </small>
+            ${m.has_replay ? `<a class="ms-2 small" href="#replay?match=${m.id}">Ver replay</a>` : ""}
           </div>
         </div>
       `).join("");
@@ -994,6 +1124,11 @@ function renderGameIaView() {
   const contentHtml = `
     <div class="text-center">
       <h2>Pong vs IA</h2>
+      <select id="iaDifficulty" class="form-select form-select-sm mb-2" style="max-width: 200px; margin: 0 auto;">
+        <option value="easy">Fácil</option>
+        <option value="normal">Normal</option>
+        <option value="hard">Difícil</option>
+      </select>
       <canvas id="gameCanvasIa" width="800" height="400"></canvas>
       <div class="mt-2 d-flex justify-content-between" style="max-width: 800px; margin: 0 auto;">
         <div id="iaLeftScore">0</div>
@@ -1004,11 +1139,23 @@ function renderGameIaView() {
   `;
   renderLayout(contentHtml);
 
+  // Nivel de la IA: cambiarlo reinicia la partida
+  const difficultySelect = document.getElementById("iaDifficulty");
+  difficultySelect.value = localStorage.getItem("pongAiDifficulty") || "normal";
+  difficultySelect.addEventListener("change", () => {
+    localStorage.setItem("pongAiDifficulty", difficultySelect.value);
+    document.removeEventListener("keydown", onPongIaKeyDown);
+    document.removeEventListener("keyup", onPongIaKeyUp);
+    window.iaGameOver = true;
+    renderGameIaView();
+  });
+
   // 3) Variables globales para la partida
   window.iaGameOver = false;
   window.iaPaddleLeft = 50;
   window.iaPaddleRight = 50; 
   window.iaBallPos = { x: 50, y: 50 };
+  window.iaSnapshots = createSnapshotBuffer();
 
   // 4) Generamos un roomId aleatorio (o puedes usar algo fijo)
   const randomRoomId = Math.floor(Math.random() * 10000);
@@ -1032,16 +1179,20 @@ function initPongAiWebSocket(roomId) {
     return;
   }
 
-  const wsUrl = `${WS_BASE_URL}/ws/pong_ai/${roomId}/?token=${token}`;
+  const difficulty = localStorage.getItem("pongAiDifficulty") || "normal";
+  const wsUrl = `${WS_BASE_URL}/ws/pong_ai/${roomId}/?token=${token}&difficulty=${encodeURIComponent(difficulty)}`;
   console.log("Abriendo WS IA:", wsUrl);
-  pongSocket = new WebSocket(wsUrl);
+  pongSocket = new WebSocket(wsUrl, [PONG_BINARY_PROTOCOL]);
+  pongSocket.binaryType = "arraybuffer";
 
   pongSocket.onopen = () => console.log("WS Pong IA abierto");
   pongSocket.onclose = (e) => console.log("WS Pong IA cerrado", e);
 
   pongSocket.onmessage = (event) => {
     try {
-      const data = JSON.parse(event.data);
+      const data = (event.data instanceof ArrayBuffer)
+        ? decodePongFrame(event.data)
+        : JSON.parse(event.data);
 
       if (data.type === "initial_state") {
         // Estado inicial: centro de palas y pos. pelota
@@ -1059,7 +1210,8 @@ function initPongAiWebSocket(roomId) {
         }
       }
       else if (data.type === "game_update") {
-        // Actualiza pelota, marcador y palas si vienen en data
+        // Pelota y palas se interpolan en el bucle de dibujo
+        pushSnapshot(iaSnapshots, data);
         if (data.ball_x !== undefined) iaBallPos.x = data.ball_x;
         if (data.ball_y !== undefined) iaBallPos.y = data.ball_y;
         if (data.score_left !== undefined && data.score_right !== undefined) {
@@ -1165,10 +1317,10 @@ function onPongIaKeyUp(e) {
  */
 function sendPaddleSpeed(speedValue) {
   if (!pongSocket) return;
-  pongSocket.send(JSON.stringify({
+  sendPongInput(pongSocket, {
     type: "paddle_input",
     speed: speedValue
-  }));
+  });
 }
 
 /**
@@ -1189,6 +1341,14 @@ function initPongAiCanvasLoop() {
   const ballRadius = 10;
 
   function drawFrame() {
+    const snap = sampleSnapshot(iaSnapshots);
+    if (snap) {
+      iaBallPos.x = snap.ball_x;
+      iaBallPos.y = snap.ball_y;
+      iaPaddleLeft = snap.paddle_left;
+      iaPaddleRight = snap.paddle_right;
+    }
+
     ctx.clearRect(0, 0, cw, ch);
 
     // Fondo
@@ -1636,6 +1796,12 @@ function renderPongView(roomId) {
   paddle1Pos = 50; 
   paddle2Pos = 50; 
   ballPos = { x: 50, y: 50 };
+  pongSnapshots = createSnapshotBuffer();
+  // Predicción de la pala propia: posición autoritativa, último ack y
+  // movimientos enviados que el servidor aún no ha aplicado
+  pongServerPaddle = 50;
+  pongAckedSeq = 0;
+  pongPendingInputs = [];
   gameOver = false;
   players = { player1: null, player2: null };
 
@@ -1653,6 +1819,9 @@ function closePongWS() {
   pongSocket = null;
 }
 
+// Espera (ms) antes de reconectar tras un corte del socket de la partida
+const PONG_RECONNECT_DELAY = 1000;
+
 function initPongWebSocket(roomId) {
   const usernametoken = getUsername();
   const token = usernametoken ? getToken(usernametoken) : null;
@@ -1663,13 +1832,45 @@ function initPongWebSocket(roomId) {
   }
   const wsUrl = `${WS_BASE_URL}/ws/pong/${roomId}/?token=${token}`;
   console.log("Abriendo pongSocket:", wsUrl);
-  pongSocket = new WebSocket(wsUrl);
+  const socket = new WebSocket(wsUrl, [PONG_BINARY_PROTOCOL]);
+  socket.binaryType = "arraybuffer";
+  pongSocket = socket;
+  // Un socket nuevo numera sus entradas desde cero
+  pongAckedSeq = 0;
+  pongPendingInputs = [];
 
   pongSocket.onopen = () => console.log("WS Pong abierto");
-  pongSocket.onclose = (e) => console.log("WS Pong cerrado", e);
+  pongSocket.onclose = (e) => {
+    console.log("WS Pong cerrado", e);
+    // Corte inesperado a mitad de partida: el servidor guarda el asiento unos
+    // segundos con la partida en pausa, así que se reintenta la conexión
+    if (pongSocket === socket && !gameOver) {
+      setTimeout(() => {
+        if (pongSocket === socket && !gameOver) initPongWebSocket(roomId);
+      }, PONG_RECONNECT_DELAY);
+    }
+  };
   pongSocket.onmessage = (event) => {
     try {
-      const data = JSON.parse(event.data);
+      let data;
+      if (event.data instanceof ArrayBuffer) {
+        const frame = decodePongFrame(event.data);
+        data = {
+          type: frame.type,
+          tick: frame.tick,
+          t: frame.t,
+          ball_x: frame.ball_x,
+          ball_y: frame.ball_y,
+          paddle1: frame.paddle_left,
+          paddle2: frame.paddle_right,
+          score1: frame.score_left,
+          score2: frame.score_right,
+          ack1: frame.ack_left,
+          ack2: frame.ack_right,
+        };
+      } else {
+        data = JSON.parse(event.data);
+      }
       if (data.type === "game_over") {
         gameOver = true;
         displayGameOver(data);
@@ -1680,6 +1881,13 @@ function initPongWebSocket(roomId) {
         if (players.player1 === currentUser) myPaddle = "paddle_1";
         else if (players.player2 === currentUser) myPaddle = "paddle_2";
         updatePlayerNames();
+        const away = data.away || [];
+        const countdownEl = document.getElementById("countdown");
+        if (away.length) {
+          countdownEl.textContent = `Esperando a ${away.join(", ")}...`;
+        } else if (countdownEl.textContent.startsWith("Esperando")) {
+          countdownEl.textContent = "";
+        }
       } else if (data.type === "update_paddle") {
         if (data.paddle === "paddle_1") {
           paddle1Pos = data.position;
@@ -1687,11 +1895,21 @@ function initPongWebSocket(roomId) {
           paddle2Pos = data.position;
         }
       } else if (data.type === "game_update") {
+        pushSnapshot(pongSnapshots, {
+          t: data.t,
+          ball_x: data.ball_x,
+          ball_y: data.ball_y,
+          paddle_left: data.paddle1,
+          paddle_right: data.paddle2,
+        });
         if (data.ball_x !== undefined) ballPos.x = data.ball_x;
         if (data.ball_y !== undefined) ballPos.y = data.ball_y;
+        if (data.paddle1 !== undefined) paddle1Pos = data.paddle1;
+        if (data.paddle2 !== undefined) paddle2Pos = data.paddle2;
         if (data.score1 !== undefined && data.score2 !== undefined) {
           updateScore(data.score1, data.score2);
         }
+        reconcilePongPaddle(data);
       }
     } catch (err) {
       console.error("Error Pong WS parse:", err);
@@ -1713,6 +1931,17 @@ function initPongCanvasLoop() {
   const ballRadius = 10;
 
   function drawFrame() {
+    const snap = sampleSnapshot(pongSnapshots);
+    if (snap) {
+      ballPos.x = snap.ball_x;
+      ballPos.y = snap.ball_y;
+      paddle1Pos = snap.paddle_left;
+      paddle2Pos = snap.paddle_right;
+    }
+    // La pala propia no se interpola: se pinta la predicción local
+    if (myPaddle === "paddle_1") paddle1Pos = predictPongPaddle();
+    else if (myPaddle === "paddle_2") paddle2Pos = predictPongPaddle();
+
     ctx.clearRect(0, 0, cw, ch);
     ctx.fillStyle = "#000";
     ctx.fillRect(0, 0, cw, ch);
@@ -1744,22 +1973,198 @@ function initPongCanvasLoop() {
   loop();
 }
 
+/****************************************************
+ * REPLAYS (ver backend pong/replay.py)
+ ****************************************************/
+// El replay se pide por trozos desde el keyframe más cercano al punto
+// elegido, así que se puede saltar a cualquier momento sin descargarlo entero.
+let replayPlayback = null;
+// Frames en cola por debajo de los cuales se pide el siguiente trozo
+const REPLAY_PREFETCH_FRAMES = 60;
+
+function stopReplayPlayback() {
+  if (replayPlayback) {
+    clearInterval(replayPlayback.timer);
+    replayPlayback = null;
+  }
+}
+
+function renderReplayView(matchId) {
+  const token = getToken(getUsername());
+  renderLayout(`
+    <h2>Replay</h2>
+    <canvas id="replayCanvas" width="800" height="400" style="background: #000;"></canvas>
+    <div style="max-width: 800px;">
+      <input type="range" id="replaySeek" class="form-range mt-2" min="0" max="0" value="0">
+      <div class="d-flex justify-content-between">
+        <span id="replayScore">0 - 0</span>
+        <small id="replayTime" class="text-muted"></small>
+      </div>
+    </div>
+  `);
+
+  fetch(`${API_BASE_URL}/api/pong/replays/${matchId}/`, {
+    headers: { "Authorization": "Bearer " + token }
+  })
+    .then(r => {
+      if (!r.ok) throw new Error("HTTP " + r.status);
+      return r.json();
+    })
+    .then(info => {
+      const seek = document.getElementById("replaySeek");
+      seek.max = info.keyframes.length ? info.keyframes[info.keyframes.length - 1] : 0;
+      seek.addEventListener("change", () => playReplayFrom(matchId, Number(seek.value), info));
+      playReplayFrom(matchId, 0, info);
+    })
+    .catch(err => {
+      console.error("Replay:", err);
+      document.getElementById("replayTime").textContent = "Replay no disponible.";
+    });
+}
+
+function playReplayFrom(matchId, tick, info) {
+  stopReplayPlayback();
+  const playback = { frames: [], next: tick, lastTick: -1, state: {}, loading: false, done: false };
+  replayPlayback = playback;
+  loadReplayChunk(matchId, playback);
+
+  const period = 1000 * info.snapshot_every / info.tick_rate;
+  playback.timer = setInterval(() => {
+    if (playback.frames.length < REPLAY_PREFETCH_FRAMES && !playback.loading && !playback.done) {
+      loadReplayChunk(matchId, playback);
+    }
+    const frame = playback.frames.shift();
+    if (!frame) return;
+    // Los deltas solo traen lo que cambió: se acumulan sobre el último keyframe
+    Object.assign(playback.state, frame);
+    drawViewerFrame(playback.state);
+    document.getElementById("replaySeek").value = frame.tick;
+    document.getElementById("replayTime").textContent = `${(frame.tick / info.tick_rate).toFixed(1)} s`;
+  }, period);
+}
+
+function loadReplayChunk(matchId, playback) {
+  const token = getToken(getUsername());
+  playback.loading = true;
+  fetch(`${API_BASE_URL}/api/pong/replays/${matchId}/frames/?tick=${playback.next}`, {
+    headers: { "Authorization": "Bearer " + token }
+  })
+    .then(r => r.arrayBuffer())
+    .then(buffer => {
+      if (replayPlayback !== playback) return;
+      const view = new DataView(buffer);
+      let offset = 0;
+      let added = 0;
+      while (offset < buffer.byteLength) {
+        const length = view.getUint16(offset, true);
+        offset += 2;
+        const frame = decodePongFrame(buffer.slice(offset, offset + length));
+        offset += length;
+        // El trozo empieza en un keyframe: se saltan los frames ya encolados
+        if (frame.tick <= playback.lastTick) continue;
+        playback.frames.push(frame);
+        playback.lastTick = frame.tick;
+        added++;
+      }
+      playback.next = playback.lastTick + 1;
+      playback.done = added === 0;
+      playback.loading = false;
+    })
+    .catch(err => {
+      console.error("Replay:", err);
+      playback.loading = false;
+    });
+}
+
+/****************************************************
+ * ESPECTADORES (ver backend pong/spectators.py)
+ ****************************************************/
+// Solo recibe: un stream reducido de la sala (frames binarios) y sus
+// room_update/game_over en JSON. Se dibuja con el mismo lienzo que los replays.
+function renderSpectateView(roomId) {
+  const token = getToken(getUsername());
+  renderLayout(`
+    <h2>Espectador</h2>
+    <p id="spectatePlayers" class="text-muted"></p>
+    <canvas id="replayCanvas" width="800" height="400" style="background: #000;"></canvas>
+    <div style="max-width: 800px;">
+      <span id="replayScore">0 - 0</span>
+    </div>
+  `);
+
+  const state = {};
+  const wsUrl = `${WS_BASE_URL}/ws/pong/${roomId}/spectate/?token=${token}`;
+  pongSocket = new WebSocket(wsUrl, [PONG_BINARY_PROTOCOL]);
+  pongSocket.binaryType = "arraybuffer";
+
+  pongSocket.onmessage = (event) => {
+    if (event.data instanceof ArrayBuffer) {
+      Object.assign(state, decodePongFrame(event.data));
+      drawViewerFrame(state);
+      return;
+    }
+    const data = JSON.parse(event.data);
+    if (data.type === "room_update") {
+      const players = data.players || {};
+      document.getElementById("spectatePlayers").textContent =
+        `${players.player1 || "?"} vs ${players.player2 || "?"}`;
+    } else if (data.type === "game_over") {
+      document.getElementById("spectatePlayers").textContent = `Ganador: ${data.winner || "-"}`;
+    }
+  };
+  pongSocket.onclose = () => console.log("WS espectador cerrado");
+}
+
+function drawViewerFrame(state) {
+  const canvas = document.getElementById("replayCanvas");
+  if (!canvas) return;
+  const ctx = canvas.getContext("2d");
+  const cw = canvas.width;
+  const ch = canvas.height;
+  const paddleWidth = 10;
+  const paddleHeight = 80;
+
+  ctx.fillStyle = "#000";
+  ctx.fillRect(0, 0, cw, ch);
+  ctx.fillStyle = "#fff";
+  ctx.fillRect(0.05 * cw, (state.paddle_left / 100) * ch - paddleHeight / 2, paddleWidth, paddleHeight);
+  ctx.fillRect(0.95 * cw - paddleWidth, (state.paddle_right / 100) * ch - paddleHeight / 2, paddleWidth, paddleHeight);
+  ctx.beginPath();
+  ctx.arc((state.ball_x / 100) * cw, (state.ball_y / 100) * ch, 10, 0, 2 * Math.PI);
+  ctx.fill();
+  document.getElementById("replayScore").textContent = `${state.score_left} - ${state.score_right}`;
+}
+
 function onPongKeyDown(e) {
   if (gameOver) return;
   let direction = 0;
   if (e.key === "ArrowUp") direction = -5;
   if (e.key === "ArrowDown") direction = 5;
   if (direction !== 0 && myPaddle && pongSocket) {
-    const currentPos = (myPaddle === "paddle_1") ? paddle1Pos : paddle2Pos;
-    pongSocket.send(JSON.stringify({
-      type: "move_paddle",
-      username: getUsername(),
-      direction,
-      position: currentPos
-    }));
+    const seq = sendPongInput(pongSocket, { type: "move_paddle", direction });
+    pongPendingInputs.push({ seq, direction });
   }
 }
 
+// Con cada frame: se toma la posición autoritativa de la pala propia y se
+// descartan los movimientos que el servidor ya ha aplicado (ack).
+function reconcilePongPaddle(data) {
+  const pos = (myPaddle === "paddle_1") ? data.paddle1 : data.paddle2;
+  const ack = (myPaddle === "paddle_1") ? data.ack1 : data.ack2;
+  if (pos !== undefined) pongServerPaddle = pos;
+  if (ack !== undefined) pongAckedSeq = ack;
+  pongPendingInputs = pongPendingInputs.filter((input) => input.seq > pongAckedSeq);
+}
+
+// Posición autoritativa + movimientos aún no confirmados (mismos límites que el servidor)
+function predictPongPaddle() {
+  let pos = pongServerPaddle;
+  for (const input of pongPendingInputs) {
+    pos = Math.max(10, Math.min(90, pos + input.direction));
+  }
+  return pos;
+}
+
 function updatePlayerNames() {
   document.getElementById("leftPlayerName").textContent = players.player1 || "Jugador 1";
   document.getElementById("rightPlayerName").textContent = players.player2 || "Jugador 2";
@@ -1815,14 +2220,8 @@ function displayGameOver(gameData) {
   }
   
 
-  // Actualizar las estadísticas del usuario: si el usuario es ganador, suma 1 en wins;
-  // de lo contrario, suma 1 en losses.
-  if (getUsername() === winner) {
-    updateMyStats("win");
-    saveMatchResult(players.player1, players.player2, gameData.score1, gameData.score2, winner);
-  } else {
-    updateMyStats("loss");
-  }
+  // Las estadísticas y el historial los guarda el servidor al acabar la
+  // partida (pong/results.py); el cliente ya no los envía.
 
   // Determinar el mensaje a mostrar
   let resultMessage = (getUsername() === winner) ? "¡Has ganado!" : "Has perdido";
@@ -1858,8 +2257,6 @@ function displayGameOver(gameData) {
   btn.onclick = () => {
     document.body.removeChild(overlay);
     window.location.hash = "#home";
-    // Opcional: aquí podrías llamar a updateMyStats() o alguna función para refrescar el DOM,
-    // pero en este caso ya se actualizó la estadística con updateMyStats()
   };
   overlay.appendChild(btn);
 
@@ -1867,56 +2264,6 @@ function displayGameOver(gameData) {
 }
 
 
-function updateMyStats(statType) {
-  const usernametoken = getUsername();
-  const token = usernametoken ? getToken(usernametoken) : null;
-  fetch(`${API_BASE_URL}/api/users/update_my_stat/`, {
-    method: "POST",
-    headers: {
-      "Content-Type": "application/json",
-      "Authorization": "Bearer " + token
-    },
-    body: JSON.stringify({ stat: statType })  // "win" o "loss"
-  })
-    .then(response => response.json())
-    .then(data => {
-      console.log("✅ Stats actualizadas:", data);
-    })
-    .catch(err => {
-      console.error("❌ Error actualizando stats:", err);
-    });
-}
-
-function saveMatchResult(player1, player2, score1, score2, winner) {
-  const usernametoken = getUsername();
-  const token = usernametoken ? getToken(usernametoken) : null;
-  fetch(`${API_BASE_URL}/api/users/save_match/`, {
-    method: "POST",
-    headers: {
-      "Content-Type": "application/json",
-      "Authorization": `Bearer ${token}`
-    },
-    body: JSON.stringify({
-      player1,
-      player2,
-      score1,
-      score2,
-      winner
-    })
-  })
-  .then(res => {
-    if (!res.ok) {
-      return res.json().then(err => { throw err; });
-    }
-    return res.json();
-  })
-  .then(data => {
-    console.log("🎮 Partida guardada:", data);
-  })
-  .catch(err => {
-    console.error("❌ Error al guardar partida:", err);
-  });
-}
 
 
 
@@ -1925,37 +2272,68 @@ function saveMatchResult(player1, player2, score1, score2, winner) {
 /****************************************************
  * WS Y FUNCIONES PARA CHAT, INVITACIONES, etc.
  ****************************************************/
+/**
+ * Partida de torneo que le toca jugar al usuario y que pudo anunciarse
+ * mientras estaba desconectado ("next_match" de la API de torneos).
+ */
+function checkPendingTournamentMatch(token) {
+  fetch(`${API_BASE_URL}/api/pong/tournaments/`, {
+    headers: { "Authorization": "Bearer " + token }
+  })
+    .then(response => response.ok ? response.json() : [])
+    .then(tournaments => {
+      const pending = tournaments.find(t => t.status === "running" && t.next_match);
+      if (!pending || window.location.hash.includes(pending.next_match.room)) return;
+      const match = pending.next_match;
+      if (confirm(`Torneo "${pending.name}": te toca jugar la ronda ${match.round} contra ${match.opponent}. ¿Entrar ahora?`)) {
+        window.location.hash = `pong?room=${match.room}`;
+      }
+    })
+    .catch(err => console.error("Error consultando torneos:", err));
+}
 function initUsersWebSocket() {
   const usernametoken = getUsername();
   const token = usernametoken ? getToken(usernametoken) : null;
   const currentUser = getUsername();
   if (!token || !currentUser) return;
-  const wsUrl = `${WS_BASE_URL}/ws/online_users/?token=${token}`;
+  // Con la versión de presencia ya conocida solo llegan los cambios perdidos
+  const since = presenceVersion !== null ? `&since=${presenceVersion}` : "";
+  const wsUrl = `${WS_BASE_URL}/ws/online_users/?token=${token}${since}`;
   console.log("Abriendo userSocket:", wsUrl);
   userSocket = new WebSocket(wsUrl);
-  userSocket.onopen = () => console.log("userSocket abierto");
+  userSocket.onopen = () => {
+    console.log("userSocket abierto");
+    // El start_game de torneo solo llega a quien estaba conectado al anunciarse
+    checkPendingTournamentMatch(token);
+  };
   userSocket.onclose = (evt) => console.log("userSocket cerrado", evt);
   userSocket.onmessage = (e) => {
     try {
       const data = JSON.parse(e.data);
-      if (data.users) {
-        // Actualiza la lista global de usuarios online
+      if (data.type === "presence_snapshot") {
+        // Lista completa: solo al conectar sin versión (o si ya no se puede reanudar)
         globalOnlineUsers = data.users;
-        updateUsersList(data.users, getUsername());
-        // Si la vista de amigos está visible, actualizamos la lista de amigos
-        if (document.getElementById("friendsListContainer")) {
-          // Se actualiza la lista de amigos usando data.friends si existe,
-          // o un array vacío de lo contrario
-          updateFriendsList(data.friends || []);
-        }
+        presenceVersion = data.version;
+        updateUsersList(globalOnlineUsers, getUsername());
+      } else if (data.type === "presence_delta") {
+        data.events.forEach(applyPresenceEvent);
+        presenceVersion = Math.max(presenceVersion || 0, data.version);
+        updateUsersList(globalOnlineUsers, getUsername());
+      } else if (data.type === "user_online" || data.type === "user_offline") {
+        if (applyPresenceEvent(data)) updateUsersList(globalOnlineUsers, getUsername());
       } else if (data.type === "friend_update") {
-        // Actualiza la lista de amigos en directo
-        updateFriendsList(data.friends);
+        // El evento solo trae usernames: se recarga la lista con sus avatares
+        pollFriendsList();
       } else if (data.type === "invite" && data.to === getUsername()) {
         showInvitationReceived(data);
       } else if (data.type === "cancel_invite" && data.to === getUsername()) {
         alert(`La invitación de ${data.from} ha sido cancelada.`);
+      } else if (data.type === "tournament_finished") {
+        alert(`Torneo "${data.name}" terminado. Ganador: ${data.winner}`);
+      } else if (data.type === "queue_status") {
+        setMatchmakingStatus(data.status === "queued", data.rating);
       } else if (data.type === "start_game") {
+        setMatchmakingStatus(false);
         const inviteModal = document.getElementById("inviteModal");
         if (inviteModal) {
           const instance = bootstrap.Modal.getInstance(inviteModal);
@@ -1968,6 +2346,15 @@ function initUsersWebSocket() {
     }
   };
 
+  // Aplica un user_online/user_offline; los ya incluidos en la versión actual se ignoran
+  function applyPresenceEvent(event) {
+    if (presenceVersion !== null && event.version <= presenceVersion) return false;
+    const others = globalOnlineUsers.filter((u) => u !== event.username);
+    globalOnlineUsers = event.type === "user_online" ? [...others, event.username] : others;
+    presenceVersion = event.version;
+    return true;
+  }
+
   function updateUsersList(users, currentUser) {
     const ul = document.getElementById("usersList");
     if (!ul) return;
@@ -1986,6 +2373,28 @@ function initUsersWebSocket() {
 }
 
 
+/****************************************************
+ * COLA DE EMPAREJAMIENTO (por rating)
+ ****************************************************/
+let inMatchmakingQueue = false;
+
+function setMatchmakingStatus(queued, rating) {
+  inMatchmakingQueue = queued;
+  const btn = document.getElementById("btnMatchmaking");
+  const status = document.getElementById("matchmakingStatus");
+  if (btn) btn.textContent = queued ? "Cancelar búsqueda" : "Buscar partida";
+  if (status) status.textContent = queued ? `Buscando rival (rating ${rating})...` : "";
+}
+
+const btnMatchmaking = document.getElementById("btnMatchmaking");
+if (btnMatchmaking) {
+  btnMatchmaking.addEventListener("click", function() {
+    if (!userSocket || userSocket.readyState !== WebSocket.OPEN) return;
+    userSocket.send(JSON.stringify({ type: inMatchmakingQueue ? "queue_leave" : "queue_join" }));
+  });
+}
+
+
 let friendsPollingInterval = null;
 
 function pollFriendsList() {
@@ -2131,6 +2540,7 @@ function renderGameLocalView() {
   window.localPaddleLeft = 50;
   window.localPaddleRight = 50;
   window.localBallPos = { x: 50, y: 50 };
+  window.localSnapshots = createSnapshotBuffer();
 
   // Genera un roomId aleatorio para el juego local (puedes usar uno fijo si lo prefieres)
   const localRoomId = Math.floor(Math.random() * 10000);
@@ -2186,6 +2596,13 @@ function initLocalGameCanvasLoop() {
   const ballRadius = 10;
   
   function drawFrame() {
+    const snap = sampleSnapshot(window.localSnapshots);
+    if (snap) {
+      window.localBallPos = { x: snap.ball_x, y: snap.ball_y };
+      window.localPaddleLeft = snap.paddle_left;
+      window.localPaddleRight = snap.paddle_right;
+    }
+
     ctx.clearRect(0, 0, cw, ch);
     ctx.fillStyle = "#000";
     ctx.fillRect(0, 0, cw, ch);
@@ -2239,6 +2656,8 @@ function updateLocalGame(gameState) {
   window.localBallPos = { x: gameState.ball_x, y: gameState.ball_y };
   window.localPaddleLeft = gameState.paddle_left;
   window.localPaddleRight = gameState.paddle_right;
+  // Pelota y palas se interpolan en el bucle de dibujo
+  pushSnapshot(window.localSnapshots, gameState);
   document.getElementById("localLeftScore").textContent = gameState.score_left;
   document.getElementById("localRightScore").textContent = gameState.score_right;
 }
@@ -2270,6 +2689,7 @@ function renderGameLocalView() {
   window.localPaddleLeft = 50;
   window.localPaddleRight = 50;
   window.localBallPos = { x: 50, y: 50 };
+  window.localSnapshots = createSnapshotBuffer();
 
   const localRoomId = Math.floor(Math.random() * 10000);
 
@@ -2320,6 +2740,13 @@ function initLocalGameCanvasLoop() {
   const ballRadius = 10;
   
   function drawFrame() {
+    const snap = sampleSnapshot(window.localSnapshots);
+    if (snap) {
+      window.localBallPos = { x: snap.ball_x, y: snap.ball_y };
+      window.localPaddleLeft = snap.paddle_left;
+      window.localPaddleRight = snap.paddle_right;
+    }
+
     ctx.clearRect(0, 0, cw, ch);
     ctx.fillStyle = "#000";
     ctx.fillRect(0, 0, cw, ch);
@@ -2372,6 +2799,8 @@ function updateLocalGame(gameState) {
   window.localBallPos = { x: gameState.ball_x, y: gameState.ball_y };
   window.localPaddleLeft = gameState.paddle_left;
   window.localPaddleRight = gameState.paddle_right;
+  // Pelota y palas se interpolan en el bucle de dibujo
+  pushSnapshot(window.localSnapshots, gameState);
   const leftScoreEl = document.getElementById("localLeftScore");
   const rightScoreEl = document.getElementById("localRightScore");
   if (leftScoreEl) leftScoreEl.textContent = gameState.score_left;
@@ -2441,7 +2870,7 @@ function handleLocalKeyDown(e) {
     message = { type: "paddle_input", paddle: "right", speed: 3 };
   }
   if (message && window.localPongSocket && window.localPongSocket.readyState === WebSocket.OPEN) {
-    window.localPongSocket.send(JSON.stringify(message));
+    sendPongInput(window.localPongSocket, message);
   }
 }
 
@@ -2453,7 +2882,7 @@ function handleLocalKeyUp(e) {
     message = { type: "paddle_input", paddle: "right", speed: 0 };
   }
   if (message && window.localPongSocket && window.localPongSocket.readyState === WebSocket.OPEN) {
-    window.localPongSocket.send(JSON.stringify(message));
+    sendPongInput(window.localPongSocket, message);
   }
 }
 
@@ -2676,6 +3105,8 @@ function launchTournamentMatch(playerLeft, playerRight, onMatchComplete) {
   window.tournamentPaddleLeft = 50;
   window.tournamentPaddleRight = 50;
   window.tournamentBallPos = { x: 50, y: 50 };
+  window.tournamentSnapshots = createSnapshotBuffer();
+  window.tournamentDrawing = false;
   
   const wsUrl = `${WS_BASE_URL}/ws/local_pong/`;
   const localSocket = new WebSocket(wsUrl);
@@ -2736,7 +3167,12 @@ function launchTournamentMatch(playerLeft, playerRight, onMatchComplete) {
     window.tournamentPaddleRight = gameState.paddle_right;
     document.getElementById("tournamentLeftScore").textContent = gameState.score_left;
     document.getElementById("tournamentRightScore").textContent = gameState.score_right;
-    drawTournamentGame();
+    pushSnapshot(window.tournamentSnapshots, gameState);
+    // Un único bucle de dibujo: interpola entre snapshots a la frecuencia de pantalla
+    if (!window.tournamentDrawing) {
+      window.tournamentDrawing = true;
+      drawTournamentGame();
+    }
   }
   
   function drawTournamentGame() {
@@ -2748,6 +3184,12 @@ function launchTournamentMatch(playerLeft, playerRight, onMatchComplete) {
     const paddleWidth = 10;
     const paddleHeight = 80;
     const ballRadius = 10;
+    const snap = sampleSnapshot(window.tournamentSnapshots);
+    if (snap) {
+      window.tournamentBallPos = { x: snap.ball_x, y: snap.ball_y };
+      window.tournamentPaddleLeft = snap.paddle_left;
+      window.tournamentPaddleRight = snap.paddle_right;
+    }
     ctx.clearRect(0, 0, cw, ch);
     ctx.fillStyle = "#000";
     ctx.fillRect(0, 0, cw, ch);
@@ -2768,6 +3210,8 @@ function launchTournamentMatch(playerLeft, playerRight, onMatchComplete) {
     ctx.fillRect(rightPaddleX, rightPaddleY, paddleWidth, paddleHeight);
     if (!window.tournamentGameOver) {
       requestAnimationFrame(drawTournamentGame);
+    } else {
+      window.tournamentDrawing = false;
     }
   }
   
@@ -2785,7 +3229,7 @@ function launchTournamentMatch(playerLeft, playerRight, onMatchComplete) {
       message = { type: "paddle_input", paddle: "right", speed: 3 };
     }
     if (message) {
-      window.tournamentLocalSocket.send(JSON.stringify(message));
+      sendPongInput(window.tournamentLocalSocket, message);
     }
   }
   
@@ -2798,7 +3242,7 @@ function launchTournamentMatch(playerLeft, playerRight, onMatchComplete) {
       message = { type: "paddle_input", paddle: "right", speed: 0 };
     }
     if (message) {
-      window.tournamentLocalSocket.send(JSON.stringify(message));
+      sendPongInput(window.tournamentLocalSocket, message);
     }
   }
   